@@ -0,0 +1,6 @@
+from .covers import *
+from .suite import *
+from .compare import *
+from .imports import *
+from .synthetic import *
+from .scaling import *
@@ -0,0 +1,64 @@
+import argparse
+import sys
+
+from bench.compare import DEFAULT_THRESHOLD, compare_runs, print_comparison
+from bench.covers import COVER_SIZES
+from bench.imports import run_import_bench
+from bench.scaling import DEFAULT_FIT_MIN_SIZE, DEFAULT_TOLERANCE, SCALING_ITERATIONS, print_scaling_report, \
+    run_scaling_report, write_scaling_report
+from bench.synthetic import SYNTHETIC_SHAPES, SYNTHETIC_SIZES
+from bench.suite import BENCH_PATH, run_suite, write_bench
+from rdh_algorithm import get_algorithm
+
+parser = argparse.ArgumentParser(prog='bench', description='Benchmark the RDH algorithms.')
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+run_parser = subparsers.add_parser('run', help='Time embed, extract, plan and metrics for every algorithm.')
+run_parser.add_argument('--algorithms', nargs='+', help='Algorithm labels (default: all).')
+run_parser.add_argument('--datasets', nargs='+', help='Datasets in res/ (default: all).')
+run_parser.add_argument('--sizes', nargs='+', type=int, default=COVER_SIZES, help='Square cover sizes.')
+run_parser.add_argument('--images', type=int, default=1, help='Images per dataset.')
+run_parser.add_argument('--iterations', type=int, default=10)
+run_parser.add_argument('--repeats', type=int, default=3)
+
+compare_parser = subparsers.add_parser('compare', help='Compare two benchmark runs and flag regressions.')
+compare_parser.add_argument('baseline', help='Baseline run JSON.')
+compare_parser.add_argument('current', nargs='?', default=f'{BENCH_PATH}/latest.json', help='Current run JSON.')
+compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Relative slowdown flagged as a regression.')
+
+imports_parser = subparsers.add_parser('imports', help='Time cold imports of the core embed/extract path.')
+imports_parser.add_argument('--repeats', type=int, default=5)
+imports_parser.add_argument('--max-ms', type=float, default=500, help='Slowest accepted median import time.')
+
+scaling_parser = subparsers.add_parser('scaling', help='Fit how time and memory grow on synthetic covers.')
+scaling_parser.add_argument('--algorithms', nargs='+', help='Algorithm labels (default: all).')
+scaling_parser.add_argument('--shapes', nargs='+', choices=list(SYNTHETIC_SHAPES), help='Histogram shapes.')
+scaling_parser.add_argument('--sizes', nargs='+', type=int, default=SYNTHETIC_SIZES, help='Square cover sizes.')
+scaling_parser.add_argument('--iterations', nargs='+', type=int, default=SCALING_ITERATIONS)
+scaling_parser.add_argument('--repeats', type=int, default=3)
+scaling_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help='Exponent above 1 accepted before a fit is flagged.')
+scaling_parser.add_argument('--fit-min-size', type=int, default=DEFAULT_FIT_MIN_SIZE,
+                            help='Smallest cover size used in the fits.')
+
+args = parser.parse_args()
+
+if args.command == 'run':
+    algorithms = [get_algorithm(label) for label in args.algorithms] if args.algorithms else None
+    run = run_suite(algorithms, args.datasets, args.sizes, args.images, args.iterations, args.repeats)
+    print(f'results written to {write_bench(run)}')
+elif args.command == 'scaling':
+    algorithms = [get_algorithm(label) for label in args.algorithms] if args.algorithms else None
+    report = run_scaling_report(algorithms, args.shapes, args.sizes, args.iterations, args.repeats, args.tolerance,
+                                args.fit_min_size)
+    flagged = print_scaling_report(report)
+    print(f'results written to {write_scaling_report(report)}')
+    sys.exit(1 if flagged else 0)
+elif args.command == 'imports':
+    timings = run_import_bench(args.repeats)
+    failures = [t for t in timings if t.heavy_modules or 1000 * t.median > args.max_ms]
+    sys.exit(1 if failures else 0)
+else:
+    regressions = print_comparison(compare_runs(args.baseline, args.current), args.threshold)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,53 @@
+import json
+from dataclasses import dataclass
+from typing import Dict, List
+
+__all__ = [
+    'DEFAULT_THRESHOLD',
+    'Comparison',
+    'load_timings',
+    'compare_runs',
+    'print_comparison',
+]
+
+DEFAULT_THRESHOLD = 0.1
+
+
+@dataclass
+class Comparison:
+    key: tuple
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        return self.current / self.baseline - 1 if self.baseline else 0.0
+
+    def is_regression(self, threshold: float) -> bool:
+        return self.change > threshold
+
+
+def load_timings(file_path: str) -> Dict[tuple, float]:
+    with open(file_path, encoding='utf-8') as data_file:
+        run = json.load(data_file)
+    return {(t['algorithm'], t['dataset'], t['image'], t['size'], t['phase']): t['median'] for t in run['timings']}
+
+
+def compare_runs(baseline_path: str, current_path: str) -> List[Comparison]:
+    baseline = load_timings(baseline_path)
+    current = load_timings(current_path)
+    return [Comparison(key, baseline[key], current[key]) for key in sorted(baseline.keys() & current.keys())]
+
+
+def print_comparison(comparisons: List[Comparison], threshold: float = DEFAULT_THRESHOLD) -> int:
+    regressions = 0
+    for comparison in comparisons:
+        algorithm, dataset, image, size, phase = comparison.key
+        flag = ''
+        if comparison.is_regression(threshold):
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f'{dataset}/{image} {size}x{size} {algorithm:<30} {phase:<8} '
+              f'{comparison.baseline:9.4f}s -> {comparison.current:9.4f}s ({100 * comparison.change:+7.1f}%){flag}')
+    print(f'{regressions} regression(s) beyond {100 * threshold:.0f}% out of {len(comparisons)} timings')
+    return regressions
@@ -0,0 +1,37 @@
+import os
+from typing import List, Tuple
+
+import PIL.Image as Image
+import numpy as np
+
+from util.util import is_image, read_image
+
+__all__ = [
+    'RES_PATH',
+    'COVER_SIZES',
+    'get_datasets',
+    'load_dataset',
+    'resize_cover',
+]
+
+RES_PATH = 'res'
+COVER_SIZES = [512, 1024, 2048, 4096, 8192]
+
+
+def get_datasets(res_path: str = RES_PATH) -> List[str]:
+    return sorted(d for d in os.listdir(res_path) if os.path.isdir(os.path.join(res_path, d)))
+
+
+def load_dataset(dataset: str, limit: int = None, res_path: str = RES_PATH) -> List[Tuple[str, np.ndarray]]:
+    directory_path = os.path.join(res_path, dataset)
+    filenames = sorted(f for f in os.listdir(directory_path) if is_image(os.path.join(directory_path, f)))
+    if limit is not None:
+        filenames = filenames[:limit]
+    return [(filename, read_image(os.path.join(directory_path, filename))) for filename in filenames]
+
+
+# Bilinear resampling keeps the overall histogram shape of the source cover
+def resize_cover(image: np.ndarray, size: int) -> np.ndarray:
+    if image.shape == (size, size):
+        return image.copy()
+    return np.asarray(Image.fromarray(image).resize((size, size), Image.BILINEAR), dtype=np.uint8).copy()
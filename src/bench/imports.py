@@ -0,0 +1,66 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import List
+
+__all__ = [
+    'CORE_IMPORTS',
+    'HEAVY_MODULES',
+    'ImportTiming',
+    'time_import',
+    'run_import_bench',
+]
+
+# What a one-image embed/extract call needs: the package plus one resolved algorithm
+CORE_IMPORTS = {
+    'util': 'import util',
+    'rdh_algorithm': 'import rdh_algorithm',
+    'unidirection': 'import rdh_algorithm; rdh_algorithm.get_algorithm("unidirection").embedder',
+    'bidirectional': 'import rdh_algorithm; rdh_algorithm.get_algorithm("original").embedder',
+}
+
+# Modules the core path must not load on import
+HEAVY_MODULES = ['matplotlib', 'skimage', 'scipy', 'numba', 'cv2']
+
+_SCRIPT = '''
+import json, sys, time
+start_time = time.perf_counter()
+exec({statement!r})
+seconds = time.perf_counter() - start_time
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+@dataclass
+class ImportTiming:
+    name: str
+    statement: str
+    times: List[float]
+    median: float
+    heavy_modules: List[str]
+
+
+# Every repeat runs in a fresh interpreter, so the timings are cold imports (warm disk cache)
+def time_import(name: str, statement: str, repeats: int = 5) -> ImportTiming:
+    script = _SCRIPT.format(statement=statement, heavy=HEAVY_MODULES)
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(['src', '.', os.environ.get('PYTHONPATH', '')]))
+    times = []
+    loaded = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', script], env=environment, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        loaded = result['loaded']
+    return ImportTiming(name, statement, times, statistics.median(times), loaded)
+
+
+def run_import_bench(repeats: int = 5, verbose: bool = True) -> List[ImportTiming]:
+    timings = [time_import(name, statement, repeats) for name, statement in CORE_IMPORTS.items()]
+    if verbose:
+        for t in timings:
+            print(f'{t.name:<16} {1000 * t.median:9.1f} ms  heavy modules: {", ".join(t.heavy_modules) or "none"}')
+    return timings
@@ -0,0 +1,63 @@
+import argparse
+import sys
+from typing import List
+
+import numpy as np
+
+from bench.covers import get_datasets, load_dataset
+from bench.suite import get_payload
+from rdh_algorithm import ALGORITHMS, RdhAlgorithm, get_algorithm
+from util.kernels import JIT_AVAILABLE, set_jit_enabled
+
+__all__ = [
+    'check_parity',
+]
+
+
+def _run(algorithm: RdhAlgorithm, cover: np.ndarray, data: bytes, iterations: int) -> List[tuple]:
+    outputs = []
+    for embedded_image, embedded_iterations, pure_embedded_data in algorithm.embedder(cover.copy(), data):
+        outputs.append((embedded_image, embedded_iterations, pure_embedded_data))
+        if embedded_iterations >= iterations:
+            break
+    return outputs
+
+
+# Embeds with the JIT kernels and with the NumPy path and checks the outputs are bit-identical
+def check_parity(algorithm: RdhAlgorithm, cover: np.ndarray, data: bytes, iterations: int) -> bool:
+    set_jit_enabled(True)
+    try:
+        jit_outputs = _run(algorithm, cover, data, iterations)
+    finally:
+        set_jit_enabled(False)
+    numpy_outputs = _run(algorithm, cover, data, iterations)
+    set_jit_enabled(True)
+
+    return len(jit_outputs) == len(numpy_outputs) and all(
+        np.array_equal(jit_image, numpy_image) and jit_iterations == numpy_iterations and jit_data == numpy_data
+        for (jit_image, jit_iterations, jit_data), (numpy_image, numpy_iterations, numpy_data)
+        in zip(jit_outputs, numpy_outputs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the JIT kernels against the NumPy path.')
+    parser.add_argument('--algorithms', nargs='+', help='Algorithm labels (default: all).')
+    parser.add_argument('--datasets', nargs='+', help='Datasets in res/ (default: all).')
+    parser.add_argument('--images', type=int, default=2, help='Images per dataset.')
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    if not JIT_AVAILABLE:
+        print('numba is not installed, only the NumPy path is available')
+        sys.exit(0)
+
+    algorithms = [get_algorithm(label) for label in args.algorithms] if args.algorithms else ALGORITHMS
+    data = get_payload()
+    failures = 0
+    for dataset in args.datasets or get_datasets():
+        for filename, cover in load_dataset(dataset, args.images):
+            for algorithm in algorithms:
+                is_identical = check_parity(algorithm, cover, data, args.iterations)
+                failures += not is_identical
+                print(f'{dataset}/{filename} {algorithm.label:<30} {"ok" if is_identical else "MISMATCH"}')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,220 @@
+import datetime
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bench.suite import BENCH_PATH, get_payload
+from bench.synthetic import SYNTHETIC_SHAPES, SYNTHETIC_SIZES, make_cover
+from rdh_algorithm import ALGORITHMS, RdhAlgorithm
+from write_data import dump_json
+
+__all__ = [
+    'SCALING_ITERATIONS',
+    'DEFAULT_TOLERANCE',
+    'DEFAULT_FIT_MIN_SIZE',
+    'ScalingPoint',
+    'ScalingFit',
+    'ScalingReport',
+    'measure_point',
+    'fit_exponents',
+    'fit_scaling',
+    'run_scaling_report',
+    'print_scaling_report',
+    'write_scaling_report',
+]
+
+SCALING_ITERATIONS = [1, 4, 16]
+DEFAULT_TOLERANCE = 0.15
+# Below this side length the fixed per-call costs dominate and pull the fitted exponents down
+DEFAULT_FIT_MIN_SIZE = 256
+FIT_QUANTITIES = ['embed', 'extract', 'memory']
+
+
+@dataclass
+class ScalingPoint:
+    algorithm: str
+    shape: str
+    size: int
+    pixels: int
+    requested_iterations: int
+    iterations: Optional[int] = None
+    embed_time: Optional[float] = None
+    extract_time: Optional[float] = None
+    peak_bytes: Optional[int] = None
+    capacity: Optional[int] = None
+    recovered: Optional[bool] = None
+    error: Optional[str] = None
+
+
+# quantity ~ pixels^pixels_exponent * iterations^iterations_exponent, fitted in log-log space
+@dataclass
+class ScalingFit:
+    algorithm: str
+    shape: str
+    quantity: str
+    points: int
+    pixels_exponent: Optional[float] = None
+    iterations_exponent: Optional[float] = None
+    flagged: bool = False
+
+
+@dataclass
+class ScalingReport:
+    repeats: int
+    tolerance: float
+    fit_min_size: int
+    date: Optional[datetime.date] = field(default_factory=datetime.datetime.utcnow)
+    points: List[ScalingPoint] = field(default_factory=list)
+    fits: List[ScalingFit] = field(default_factory=list)
+
+
+def _median_time(function, repeats: int):
+    times = []
+    returned = None
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        returned = function()
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times), returned
+
+
+# tracemalloc slows everything down, so the peak is taken on a separate, untimed round trip
+def _peak_bytes(algorithm: RdhAlgorithm, cover: np.ndarray, data: bytes, iterations: int) -> int:
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        embedded_image, _, _ = algorithm.embedder(cover, data).embed(iterations)
+        embed_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        algorithm.extractor().extract(embedded_image)
+        return max(embed_peak, tracemalloc.get_traced_memory()[1])
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+def measure_point(algorithm: RdhAlgorithm, shape: str, cover: np.ndarray, data: bytes, iterations: int,
+                  repeats: int) -> ScalingPoint:
+    point = ScalingPoint(algorithm.label, shape, cover.shape[0], cover.size, iterations)
+    try:
+        point.embed_time, (embedded_image, point.iterations, point.capacity) = _median_time(
+            lambda: algorithm.embedder(cover, data).embed(iterations), repeats)
+        point.extract_time, (recovered_image, extracted_iterations, _) = _median_time(
+            lambda: algorithm.extractor().extract(embedded_image), repeats)
+        point.recovered = bool(np.array_equal(recovered_image, cover) and extracted_iterations == point.iterations)
+        point.peak_bytes = _peak_bytes(algorithm, cover, data, iterations)
+    except Exception as error:
+        point.error = f'{type(error).__name__}: {error}'
+    point.iterations = None if point.iterations is None else int(point.iterations)
+    point.capacity = None if point.capacity is None else int(point.capacity)
+    return point
+
+
+# Least squares on log(y) = a log(pixels) + b log(iterations) + c. The iterations term is
+# dropped when the points do not vary in iterations, and no fit is made without two sizes.
+def fit_exponents(pixels: List[int], iterations: List[int], values: List[float]) -> (float, float):
+    if len(set(pixels)) < 2:
+        return None, None
+    columns = [np.log(pixels)]
+    if len(set(iterations)) > 1:
+        columns.append(np.log(iterations))
+    columns.append(np.ones(len(values)))
+    solution, *_ = np.linalg.lstsq(np.stack(columns, axis=1), np.log(values), rcond=None)
+    return float(solution[0]), float(solution[1]) if len(columns) == 3 else None
+
+
+def _quantity(point: ScalingPoint, quantity: str) -> Optional[float]:
+    return {'embed': point.embed_time, 'extract': point.extract_time, 'memory': point.peak_bytes}[quantity]
+
+
+# Time is flagged when it grows faster than pixels * iterations, memory when it grows faster than pixels
+def fit_scaling(points: List[ScalingPoint], tolerance: float = DEFAULT_TOLERANCE,
+                fit_min_size: int = DEFAULT_FIT_MIN_SIZE) -> List[ScalingFit]:
+    groups: Dict[tuple, List[ScalingPoint]] = {}
+    for point in points:
+        if point.error is None and point.iterations and point.size >= fit_min_size:
+            groups.setdefault((point.algorithm, point.shape), []).append(point)
+
+    fits = []
+    for (algorithm, shape), group in groups.items():
+        for quantity in FIT_QUANTITIES:
+            valid = [p for p in group if _quantity(p, quantity)]
+            pixels_exponent, iterations_exponent = fit_exponents(
+                [p.pixels for p in valid], [p.iterations for p in valid], [_quantity(p, quantity) for p in valid])
+            fit = ScalingFit(algorithm, shape, quantity, len(valid), pixels_exponent, iterations_exponent)
+            fit.flagged = pixels_exponent is not None and pixels_exponent > 1 + tolerance
+            if quantity != 'memory' and iterations_exponent is not None:
+                fit.flagged |= iterations_exponent > 1 + tolerance
+            fits.append(fit)
+    return fits
+
+
+def run_scaling_report(algorithms: List[RdhAlgorithm] = None,
+                       shapes: List[str] = None,
+                       sizes: List[int] = None,
+                       iterations: List[int] = None,
+                       repeats: int = 3,
+                       tolerance: float = DEFAULT_TOLERANCE,
+                       fit_min_size: int = DEFAULT_FIT_MIN_SIZE,
+                       verbose: bool = True) -> ScalingReport:
+    algorithms = algorithms or ALGORITHMS
+    shapes = shapes or list(SYNTHETIC_SHAPES)
+    sizes = sizes or SYNTHETIC_SIZES
+    iterations = iterations or SCALING_ITERATIONS
+    data = get_payload()
+
+    report = ScalingReport(repeats, tolerance, fit_min_size)
+    for shape in shapes:
+        for size in sizes:
+            cover = make_cover(shape, size)
+            for algorithm in algorithms:
+                for requested_iterations in iterations:
+                    point = measure_point(algorithm, shape, cover, data, requested_iterations, repeats)
+                    report.points.append(point)
+                    if verbose:
+                        print(_format_point(point))
+    report.fits = fit_scaling(report.points, tolerance, fit_min_size)
+    return report
+
+
+def _format_point(point: ScalingPoint) -> str:
+    prefix = f'{point.shape:<10} {point.size:>5}x{point.size:<5} {point.algorithm:<30} ' \
+             f'{point.requested_iterations:>3} it'
+    if point.error is not None:
+        return f'{prefix}  failed: {point.error}'
+    recovered = '' if point.recovered else '  NOT RECOVERED'
+    return f'{prefix} -> {point.iterations:>3}  embed {1000 * point.embed_time:9.2f} ms  ' \
+           f'extract {1000 * point.extract_time:9.2f} ms  peak {point.peak_bytes / 2 ** 20:8.2f} MiB  ' \
+           f'capacity {point.capacity:>9} bits{recovered}'
+
+
+def print_scaling_report(report: ScalingReport) -> int:
+    print(f'{"algorithm":<30} {"shape":<10} {"quantity":<8} {"points":>6} {"pixels^k":>9} {"iterations^k":>13}')
+    flagged = 0
+    for fit in sorted(report.fits, key=lambda f: (f.algorithm, f.shape, f.quantity)):
+        pixels_exponent = '-' if fit.pixels_exponent is None else f'{fit.pixels_exponent:.2f}'
+        iterations_exponent = '-' if fit.iterations_exponent is None else f'{fit.iterations_exponent:.2f}'
+        flag = '  SUPERLINEAR' if fit.flagged else ''
+        flagged += fit.flagged
+        print(f'{fit.algorithm:<30} {fit.shape:<10} {fit.quantity:<8} {fit.points:>6} '
+              f'{pixels_exponent:>9} {iterations_exponent:>13}{flag}')
+    failures = sum(1 for point in report.points if point.error is not None or not point.recovered)
+    print(f'{flagged} superlinear fit(s) beyond {report.tolerance:+.2f}, '
+          f'{failures} failed or unrecovered point(s) out of {len(report.points)}')
+    return flagged
+
+
+def write_scaling_report(report: ScalingReport) -> str:
+    path = Path(BENCH_PATH) / 'scaling'
+    path.mkdir(parents=True, exist_ok=True)
+    file_path = f'{path}/{report.date.isoformat().replace(".", "-").replace(":", "-")}.json'
+    dump_json(report, file_path)
+    dump_json(report, f'{path}/latest.json')
+    return file_path
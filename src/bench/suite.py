@@ -0,0 +1,144 @@
+import datetime
+import statistics
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+from skimage.metrics import structural_similarity
+
+from bench.covers import COVER_SIZES, get_datasets, load_dataset, resize_cover
+from rdh_algorithm import ALGORITHMS, RdhAlgorithm, plan_capacity
+from util.util import bits_to_bytes
+from write_data import DATA_PATH, dump_json
+
+__all__ = [
+    'BENCH_PATH',
+    'PHASES',
+    'PhaseTiming',
+    'BenchRun',
+    'get_payload',
+    'benchmark_cover',
+    'run_suite',
+    'write_bench',
+]
+
+BENCH_PATH = f'{DATA_PATH}/bench'
+PHASES = ['embed', 'extract', 'plan', 'metrics']
+
+
+@dataclass
+class PhaseTiming:
+    algorithm: str
+    dataset: str
+    image: str
+    size: int
+    phase: str
+    iterations: int
+    pixels: int
+    times: List[float] = field(default_factory=list)
+    median: Optional[float] = None
+    megapixels_per_second: Optional[float] = None
+    iteration_latency: Optional[float] = None
+
+    def finalize(self) -> None:
+        self.median = statistics.median(self.times)
+        self.megapixels_per_second = self.pixels / 1e6 / self.median if self.median else float('inf')
+        self.iteration_latency = self.median / max(self.iterations, 1)
+
+    def key(self) -> tuple:
+        return self.algorithm, self.dataset, self.image, self.size, self.phase
+
+
+@dataclass
+class BenchRun:
+    iterations: int
+    repeats: int
+    date: Optional[datetime.date] = field(default_factory=datetime.datetime.utcnow)
+    timings: List[PhaseTiming] = field(default_factory=list)
+
+
+def get_payload(bits: int = 2000 * 2000, seed: int = 2115) -> bytes:
+    np.random.seed(seed)
+    return bits_to_bytes(np.random.randint(0, 2, size=bits) > 0)
+
+
+def _time(function: Callable, repeats: int) -> (List[float], object):
+    times = []
+    returned = None
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        returned = function()
+        times.append(time.perf_counter() - start_time)
+    return times, returned
+
+
+def benchmark_cover(algorithm: RdhAlgorithm, cover: np.ndarray, data: bytes, iterations: int, repeats: int,
+                    dataset: str = '', image: str = '') -> List[PhaseTiming]:
+    def timing(phase, times, phase_iterations):
+        phase_timing = PhaseTiming(algorithm.label, dataset, image, cover.shape[0], phase, phase_iterations,
+                                   cover.size, times)
+        phase_timing.finalize()
+        return phase_timing
+
+    times, (embedded_image, embedded_iterations, _) = _time(
+        lambda: algorithm.embedder(cover.copy(), data).embed(iterations), repeats)
+    timings = [timing('embed', times, embedded_iterations)]
+
+    times, _ = _time(lambda: algorithm.extractor().extract(embedded_image), repeats)
+    timings.append(timing('extract', times, embedded_iterations))
+
+    times, capacities = _time(lambda: plan_capacity(algorithm, cover, data, iterations), repeats)
+    timings.append(timing('plan', times, len(capacities)))
+
+    def metrics():
+        mean = np.abs(np.mean(cover) - np.mean(embedded_image, dtype=np.float64))
+        std = float(np.std(embedded_image, dtype=np.float64))
+        ssim = structural_similarity(cover, embedded_image)
+        return mean, std, ssim
+
+    times, _ = _time(metrics, repeats)
+    timings.append(timing('metrics', times, 1))
+
+    return timings
+
+
+def run_suite(algorithms: List[RdhAlgorithm] = None,
+              datasets: List[str] = None,
+              sizes: List[int] = None,
+              images_per_dataset: int = 1,
+              iterations: int = 10,
+              repeats: int = 3,
+              verbose: bool = True) -> BenchRun:
+    algorithms = algorithms or ALGORITHMS
+    datasets = datasets or get_datasets()
+    sizes = sizes or COVER_SIZES
+    data = get_payload()
+
+    run = BenchRun(iterations, repeats)
+    for dataset in datasets:
+        for filename, image in load_dataset(dataset, images_per_dataset):
+            for size in sizes:
+                cover = resize_cover(image, size)
+                for algorithm in algorithms:
+                    timings = benchmark_cover(algorithm, cover, data, iterations, repeats, dataset, filename)
+                    run.timings.extend(timings)
+                    if verbose:
+                        for t in timings:
+                            print(f'{dataset}/{filename} {size}x{size} {t.algorithm:<30} {t.phase:<8} '
+                                  f'{t.median:9.4f}s {t.megapixels_per_second:9.2f} MP/s '
+                                  f'{1000 * t.iteration_latency:9.3f} ms/iteration')
+    return run
+
+
+def get_bench_file_path(run: BenchRun) -> str:
+    return f'{BENCH_PATH}/{run.date.isoformat().replace(".", "-").replace(":", "-")}.json'
+
+
+def write_bench(run: BenchRun) -> str:
+    Path(BENCH_PATH).mkdir(parents=True, exist_ok=True)
+    file_path = get_bench_file_path(run)
+    dump_json(run, file_path)
+    dump_json(run, f'{BENCH_PATH}/latest.json')
+    return file_path
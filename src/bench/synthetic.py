@@ -0,0 +1,57 @@
+from typing import Callable, Dict
+
+import numpy as np
+
+__all__ = [
+    'SYNTHETIC_SHAPES',
+    'SYNTHETIC_SIZES',
+    'make_cover',
+]
+
+SYNTHETIC_SIZES = [16, 64, 256, 512, 1024]
+
+
+# Every value equally often, so there is no zero bin and every peak is as small as it gets
+def _flat(pixels: int, rng: np.random.Generator) -> np.ndarray:
+    return np.arange(pixels) % 256
+
+
+# Almost every pixel on a handful of values around the middle
+def _peaky(pixels: int, rng: np.random.Generator) -> np.ndarray:
+    return np.rint(128 + rng.laplace(scale=0.75, size=pixels))
+
+
+# Under/over exposure: most pixels clipped to 0 or 255, which makes the is_modified maps huge
+def _saturated(pixels: int, rng: np.random.Generator) -> np.ndarray:
+    values = rng.integers(1, 255, size=pixels)
+    clipped = rng.random(pixels)
+    values[clipped < 0.4] = 0
+    values[clipped > 0.6] = 255
+    return values
+
+
+# Every other value empty, so zero bins sit right next to every peak
+def _comb(pixels: int, rng: np.random.Generator) -> np.ndarray:
+    return 2 * rng.integers(0, 128, size=pixels)
+
+
+# A natural-looking single hump, as a reference for the other shapes
+def _gaussian(pixels: int, rng: np.random.Generator) -> np.ndarray:
+    return np.rint(rng.normal(128, 40, size=pixels))
+
+
+SYNTHETIC_SHAPES: Dict[str, Callable[[int, np.random.Generator], np.ndarray]] = {
+    'flat': _flat,
+    'peaky': _peaky,
+    'saturated': _saturated,
+    'comb': _comb,
+    'gaussian': _gaussian,
+}
+
+
+# Pixels are placed in random order: the histogram is controlled, the spatial layout is not,
+# which is also the worst case for compressing the location maps
+def make_cover(shape: str, size: int, seed: int = 2115) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    values = np.clip(SYNTHETIC_SHAPES[shape](size * size, rng), 0, 255).astype(np.uint8)
+    return rng.permutation(values).reshape((size, size))
@@ -1,4 +1,6 @@
+from .batch import *
 from .bp_scaling import *
+from .multi_peak import *
 from .original import *
 from .scaling import *
 
@@ -11,5 +13,8 @@ __all__ = [
     'VariableBitsScalingEmbedder',
     'NbVoEmbedder',
     'BPVariableBitsScalingEmbedder',
-    'BPNbVoEmbedder'
+    'BPNbVoEmbedder',
+    'MultiPeakEmbedder',
+    'MultiPeakExtractor',
+    'BatchOriginalEmbedder',
 ]
@@ -0,0 +1,118 @@
+from bidirectional.configurations import *
+from bidirectional.original import OriginalEmbedder
+from util import *
+
+
+# OriginalEmbedder over an (N, H, W) stack of same-size covers. Preprocessing, histograms,
+# peaks and the shifts run on the whole stack at once; only the is_modified maps are compressed
+# and the payload buffers advanced image by image. Every image comes out exactly as
+# OriginalEmbedder embeds it on its own.
+class BatchOriginalEmbedder(Configurable, Reentrant):
+    _HEADER_SIZE = HEADER_SIZE
+    _DEFAULT_CONFIG = DEFAULT_CONFIG
+    _ITERATIONS_LIMIT = OriginalEmbedder._ITERATIONS_LIMIT
+    _ITERATIONS_LIMIT_EXCEEDED_ERROR = OriginalEmbedder._ITERATIONS_LIMIT_EXCEEDED_ERROR
+
+    def __init__(self, cover_images: np.ndarray, hidden_data, compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        self._set_config(config)
+        self._cover_images = as_pixels(cover_images)
+        if self._cover_images.ndim != 3:
+            raise ValueError(f'expected an (N, H, W) stack of covers, got shape {self._cover_images.shape}')
+        self._payloads = get_payloads(hidden_data, len(self._cover_images))
+        self._compress = compression.compress
+        self._reset_state()
+
+    def _reset_state(self):
+        self._processed_pixels = None
+        self._header_pixels = None
+        self._buffers = None
+        self._hists = None
+
+    # Returns the embedded stack with the iterations and the capacity of every image
+    @profiled('embed')
+    def embed(self, iterations, out=None, inplace=False):
+        return self._new_context()._embed(iterations, out, inplace)
+
+    def _embed(self, iterations, out, inplace):
+        if iterations > self._ITERATIONS_LIMIT:
+            raise ValueError(self._ITERATIONS_LIMIT_EXCEEDED_ERROR)
+        with phase('split'):
+            images = get_work_image(self._cover_images, out, inplace)
+            pixels = images.reshape(len(images), -1)
+            header_size = self._config.header_size
+            self._header_pixels, self._processed_pixels = pixels[:, :header_size], pixels[:, header_size:]
+        with phase('preprocess'):
+            is_modified = self._preprocess(iterations)
+        with phase('buffer'):
+            self._fill_buffers(is_modified)
+        self._process(iterations)
+        pure_embedded_data = np.array([len(payload) - buffer.remaining()
+                                       for payload, buffer in zip(self._payloads, self._buffers)], dtype=np.int64)
+        return images, iterations, pure_embedded_data
+
+    def _preprocess(self, iterations):
+        lower_bound = self._processed_pixels < iterations
+        upper_bound = MAX_PIXEL_VALUE - iterations < self._processed_pixels
+        is_modified = np.logical_or(lower_bound, upper_bound)
+        self._processed_pixels[lower_bound] += iterations
+        self._processed_pixels[upper_bound] -= iterations
+        is_modifiable = np.logical_or(self._processed_pixels < 2 * iterations,
+                                      self._processed_pixels > MAX_PIXEL_VALUE - 2 * iterations)
+        return [row_modified[row_modifiable] for row_modified, row_modifiable in zip(is_modified, is_modifiable)]
+
+    def _fill_buffers(self, is_modified):
+        header_lsbs = (self._header_pixels & 1).astype(bool)
+        self._buffers = []
+        for lsbs, row_modified, payload in zip(header_lsbs, is_modified, self._payloads):
+            with phase('compress'):
+                is_modified_compressed = self._compress(bits_to_bytes(row_modified))
+            is_modified_size_bits = integer_to_binary(len(is_modified_compressed),
+                                                      self._config.compressed_data_length_bits)
+            self._buffers.append(PayloadBuffer(lsbs, is_modified_size_bits, bytes_to_bits(is_modified_compressed),
+                                               payload=payload))
+
+    def _process(self, iterations):
+        previous_peaks = np.zeros((len(self._buffers), 2), dtype=np.int64)
+
+        for _ in range(iterations):
+            with phase('iteration'):
+                with phase('peaks'):
+                    peaks = self._get_peaks()
+                self._shift_and_embed(peaks, previous_peaks)
+                previous_peaks = peaks
+
+        with phase('lsb'):
+            parities = np.array([buffer.get_parity() for buffer in self._buffers], dtype=np.uint8)
+            self._header_pixels[:, 0] = (self._header_pixels[:, 0] & np.uint8(0xFE)) | parities
+            binary_previous_peaks = np.zeros((len(self._buffers), self._header_pixels.shape[1] - 1), dtype=np.uint8)
+            binary_previous_peaks[:, :16] = np.unpackbits(previous_peaks.astype(np.uint8), axis=1)
+            self._header_pixels[:, 1:] = (self._header_pixels[:, 1:] & np.uint8(0xFE)) | binary_previous_peaks
+
+    def _shift_and_embed(self, peaks, previous_peaks):
+        left_peaks, right_peaks = peaks[:, 0], peaks[:, 1]
+        binary_previous_peaks = np.unpackbits(previous_peaks.astype(np.uint8), axis=1).astype(bool)
+        with phase('buffer'):
+            left_bits, right_bits = [], []
+            for buffer, binary, hist, left_peak, right_peak in zip(self._buffers, binary_previous_peaks, self._hists,
+                                                                   left_peaks, right_peaks):
+                buffer.add(binary)
+                left_bits.append(buffer.next(hist[left_peak]))
+                right_bits.append(buffer.next(hist[right_peak]))
+
+        with phase('shift_and_embed'):
+            self._hists = shift_and_embed_pair_batch(self._processed_pixels, left_peaks, right_peaks,
+                                                     np.concatenate(left_bits), np.concatenate(right_bits), self._hists)
+
+    # The two highest bins of every histogram, trimmed to its last used value as
+    # OriginalEmbedder does. argsort breaks ties depending on the length it sorts, so the
+    # rows are sorted in groups of equal trimmed length.
+    def _get_peaks(self):
+        if self._hists is None:
+            self._hists = get_row_hists(self._processed_pixels)
+        lengths = self._hists.shape[1] - np.argmax(self._hists[:, ::-1] > 0, axis=1)
+        peaks = np.empty((len(self._hists), 2), dtype=np.int64)
+        for length in np.unique(lengths):
+            rows = np.flatnonzero(lengths == length)
+            peaks[rows] = np.sort(self._hists[rows, :length].argsort(axis=1)[:, -2:], axis=1)
+        return peaks
@@ -1,24 +1,24 @@
-from bidirectional.configurations import BRIGHTNESS_THRESHOLD
 from bidirectional.scaling import *
 from util import *
 
 
 class BPScalingEmbedder(ScalingEmbedder):
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        ScalingEmbedder.__init__(self, cover_image, hidden_data, compression)
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        ScalingEmbedder.__init__(self, cover_image, hidden_data, compression, config)
         self._original_brightness = np.mean(cover_image)
 
-    def embed(self, iterations):
-        return super(BPScalingEmbedder, self).embed(iterations)
+    def embed(self, iterations, out=None, inplace=False):
+        return super(BPScalingEmbedder, self).embed(iterations, out, inplace)
 
     def _get_peaks(self):
-        hist = np.bincount(self._processed_pixels)
+        hist = self._get_hist()
         current_brightness = np.mean(self._processed_pixels)
         cutoff_index = int(np.ceil(current_brightness))
 
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD:
+        if self._original_brightness - current_brightness > self._config.brightness_threshold:
             return np.sort(hist[:cutoff_index].argsort()[-2:])
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold:
             return np.sort(hist[cutoff_index:].argsort()[-2:]) + cutoff_index
         else:
             return np.sort(hist.argsort()[-2:])
@@ -29,18 +29,19 @@ class BPScalingExtractor(ScalingExtractor):
 
 
 class BPVariableBitsScalingEmbedder(VariableBitsScalingEmbedder):
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        super().__init__(cover_image, hidden_data, compression)
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        super().__init__(cover_image, hidden_data, compression, config=config)
         self._original_brightness = np.mean(cover_image)
 
     def _get_peaks(self):
-        hist = np.bincount(self._processed_pixels)
+        hist = self._get_hist()
         current_brightness = np.mean(self._processed_pixels)
         cutoff_index = int(np.ceil(current_brightness))
 
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD:
+        if self._original_brightness - current_brightness > self._config.brightness_threshold:
             return np.sort(hist[:cutoff_index].argsort()[-2:])
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold:
             return np.sort(hist[cutoff_index:].argsort()[-2:]) + cutoff_index
         else:
             return np.sort(hist.argsort()[-2:])
@@ -51,18 +52,19 @@ class BPVariableBitsScalingExtractor(VariableBitsScalingExtractor):
 
 
 class BPValueOrderScalingEmbedder(ValueOrderScalingEmbedder):
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        super().__init__(cover_image, hidden_data, compression)
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        super().__init__(cover_image, hidden_data, compression, config=config)
         self._original_brightness = np.mean(cover_image)
 
     def _get_peaks(self):
-        hist = np.bincount(self._processed_pixels)
+        hist = self._get_hist()
         current_brightness = np.mean(self._processed_pixels)
         cutoff_index = int(np.ceil(current_brightness))
 
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD:
+        if self._original_brightness - current_brightness > self._config.brightness_threshold:
             return np.sort(hist[:cutoff_index].argsort()[-2:])
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold:
             return np.sort(hist[cutoff_index:].argsort()[-2:]) + cutoff_index
         else:
             return np.sort(hist.argsort()[-2:])
@@ -1,5 +1,13 @@
+from util.config import RdhConfig
+
 COMPRESSED_DATA_LENGTH_BITS = 24
 MAX_PIXEL_VALUE = 255
 COMPRESSION_LEVEL = 9
 HEADER_SIZE = 17
 BRIGHTNESS_THRESHOLD = 0.5
+MAX_PEAK_PAIRS = 8  # peak pairs embedded per pass by the multi-peak embedder
+PAIR_COUNT_BITS = 4
+MULTI_PEAK_HEADER_SIZE = 1 + PAIR_COUNT_BITS + MAX_PEAK_PAIRS * 16
+
+# the header size is left to each layout's _HEADER_SIZE
+DEFAULT_CONFIG = RdhConfig(BRIGHTNESS_THRESHOLD, compressed_data_length_bits=COMPRESSED_DATA_LENGTH_BITS)
@@ -0,0 +1,165 @@
+from bidirectional.configurations import *
+from bidirectional.original import *
+
+
+# One round moves every value below a left peak down by the number of left peaks above it,
+# and every value above a right peak up by the number of right peaks below it. Each peak
+# lands on its own value with a free bin next to it, so all pairs embed in a single pass.
+# Returns that shift as a LUT, the peaks in ascending order, where their pixels land and
+# the direction each of them embeds towards.
+def _get_round(left_peaks, right_peaks):
+    lut = get_identity_lut()
+    for peak in left_peaks:
+        lut[:peak] -= 1
+    for peak in right_peaks:
+        lut[peak + 1:] += 1
+
+    peaks = np.sort(np.concatenate([left_peaks, right_peaks]))
+    directions = np.where(np.isin(peaks, left_peaks), -1, 1)
+    return lut, peaks, lut[peaks], directions
+
+
+def _round_to_binary(left_peaks, right_peaks):
+    binary = list(integer_to_binary(len(left_peaks), PAIR_COUNT_BITS))
+    for left_peak, right_peak in zip(left_peaks, right_peaks):
+        binary.extend(integer_to_binary(left_peak))
+        binary.extend(integer_to_binary(right_peak))
+    return binary
+
+
+class MultiPeakEmbedder(OriginalEmbedder):
+    _HEADER_SIZE = MULTI_PEAK_HEADER_SIZE
+
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 pairs_per_round: int = MAX_PEAK_PAIRS, config: RdhConfig = None):
+        super().__init__(cover_image, hidden_data, compression, config)
+        if not 0 < pairs_per_round <= MAX_PEAK_PAIRS:
+            raise ValueError(f'pairs_per_round must be between 1 and {MAX_PEAK_PAIRS}')
+        self._pairs_per_round = pairs_per_round
+
+    # iterations counts peak pairs, as in OriginalEmbedder, and is embedded in
+    # ceil(iterations / pairs_per_round) passes over the pixels
+    def _process(self, iterations):
+        previous_left_peaks = previous_right_peaks = []
+
+        while iterations:
+            with phase('iteration'):
+                with phase('peaks'):
+                    left_peaks, right_peaks = self._get_peak_pairs(min(self._pairs_per_round, iterations), iterations)
+                iterations -= len(left_peaks)
+
+                self._embed_round(left_peaks, right_peaks, _round_to_binary(previous_left_peaks, previous_right_peaks))
+
+                previous_left_peaks = left_peaks
+                previous_right_peaks = right_peaks
+
+        with phase('lsb'):
+            self._header_pixels[0] = set_lsb(self._header_pixels[0], self._buffer.get_parity())
+            binary_previous_round = _round_to_binary(previous_left_peaks, previous_right_peaks)
+            for index in range(1, self._header_pixels.size):
+                binary_value = binary_previous_round[index - 1] if index <= len(binary_previous_round) else False
+                self._header_pixels[index] = set_lsb(self._header_pixels[index], binary_value)
+
+    # The 2 * pairs highest bins; the lower half are the left peaks (closest to the middle
+    # first) and the upper half the right peaks. With margin pairs still to embed, every
+    # pixel lies in [margin, MAX_PIXEL_VALUE - margin], so peaks are picked from there
+    # and no shift can leave the pixel range.
+    def _get_peak_pairs(self, pairs, margin):
+        self._get_hist()
+        window = self._hist[margin:MAX_PIXEL_VALUE + 1 - margin]
+        peaks = np.sort(window.argsort(kind='stable')[-2 * pairs:]) + margin
+        return peaks[:pairs][::-1], peaks[pairs:]
+
+    def _embed_round(self, left_peaks, right_peaks, binary_previous_round):
+        lut, peaks, peak_values, directions = _get_round(left_peaks, right_peaks)
+
+        with phase('shift'):
+            apply_lut(self._processed_pixels, lut)
+
+        # the payload goes to the peaks in ascending order, and to each peak's pixels in raster order
+        with phase('select'):
+            peak_index = np.full(MAX_PIXEL_VALUE + 1, -1, dtype=np.int8)
+            peak_index[peak_values] = np.arange(peaks.size)
+            pixel_peaks = peak_index.take(self._processed_pixels)
+            positions = np.flatnonzero(pixel_peaks >= 0)
+            pixel_peaks = pixel_peaks[positions]
+            order = np.argsort(pixel_peaks, kind='stable')
+            positions = positions[order]
+            pixel_peaks = pixel_peaks[order]
+
+        with phase('buffer'):
+            self._buffer.add(binary_previous_round)
+            bits = self._buffer.next(positions.size)
+
+        with phase('embed'):
+            moved_peaks = pixel_peaks[bits]
+            moved_positions = positions[bits]
+            moved_directions = directions[moved_peaks]
+            self._processed_pixels[moved_positions[moved_directions < 0]] -= np.uint8(1)
+            self._processed_pixels[moved_positions[moved_directions > 0]] += np.uint8(1)
+
+        moved_hist = np.zeros(MAX_PIXEL_VALUE + 1, dtype=np.int64)
+        np.add.at(moved_hist, lut.astype(np.uint8), self._hist)
+        moved_counts = np.bincount(moved_peaks, minlength=peaks.size)
+        moved_hist[peak_values] -= moved_counts
+        moved_hist[peak_values + directions] += moved_counts
+        self._next_hist = moved_hist
+
+        if self._observers:
+            self._emit_iteration(pairs=len(left_peaks), left_peaks=left_peaks, right_peaks=right_peaks,
+                                 capacity=positions.size, net_capacity=positions.size - len(binary_previous_round))
+
+
+class MultiPeakExtractor(OriginalExtractor):
+    _HEADER_SIZE = MULTI_PEAK_HEADER_SIZE
+
+    @staticmethod
+    def _get_peak_pairs(pairs, binary_pairs):
+        peaks = [binary_to_integer(binary_pairs[8 * i:8 * (i + 1)]) for i in range(2 * pairs)]
+        return np.array(peaks[0::2], dtype=int), np.array(peaks[1::2], dtype=int)
+
+    def _process(self):
+        iterations = 0
+        parity = get_lsb([self._header_pixels[0]])
+        self._buffer.set_parity(parity)
+        header_bits = get_lsb(self._header_pixels[1:])
+        pairs = binary_to_integer(header_bits[:PAIR_COUNT_BITS])
+        left_peaks, right_peaks = self._get_peak_pairs(pairs, header_bits[PAIR_COUNT_BITS:])
+        with phase('index'):
+            value_index = ValueIndex(self._processed_pixels)
+        while pairs:
+            with phase('iteration'):
+                iterations += pairs
+                bits = self._extract_round(value_index, left_peaks, right_peaks)
+                self._emit('iteration', iteration=iterations, left_peaks=left_peaks, right_peaks=right_peaks,
+                           bits=bits)
+
+                with phase('peaks'):
+                    pairs = binary_to_integer(self._buffer.next(PAIR_COUNT_BITS))
+                    left_peaks, right_peaks = self._get_peak_pairs(pairs, self._buffer.next(16 * pairs))
+
+        if self._restores_image:
+            with phase('materialize'):
+                value_index.materialize(self._processed_pixels)
+        return iterations
+
+    def _extract_round(self, value_index, left_peaks, right_peaks):
+        lut, peaks, peak_values, directions = _get_round(left_peaks, right_peaks)
+
+        # the peaks in ascending order, each one's pixels in raster order
+        with phase('payload'):
+            bits = np.concatenate([value_index.read_pair(value, direction)
+                                   for value, direction in zip(peak_values, directions)])
+
+        with phase('buffer'):
+            self._buffer.add(bits)
+
+        with phase('shift'):
+            values = get_identity_lut()
+            in_range = np.logical_and(lut >= 0, lut <= MAX_PIXEL_VALUE)
+            inverse_lut = get_identity_lut()
+            inverse_lut[lut[in_range]] = values[in_range]
+            inverse_lut[peak_values + directions] = peaks
+            value_index.apply_lut(inverse_lut)
+
+        return bits.size
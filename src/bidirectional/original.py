@@ -2,28 +2,59 @@ from bidirectional.configurations import *
 from util import *
 
 
-class OriginalEmbedder:
+class OriginalEmbedder(Observable, Configurable, Reentrant):
+    _HEADER_SIZE = HEADER_SIZE
+    _DEFAULT_CONFIG = DEFAULT_CONFIG
     _ITERATIONS_LIMIT = 64
     _ITERATIONS_LIMIT_EXCEEDED_ERROR = 'Exceeded the max number of iterations allowed.'
 
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        self._cover_image = cover_image
-        self._hidden_data = bytes_to_bits(hidden_data)
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        self._set_config(config)
+        self._cover_image = as_pixels(cover_image)
+        self._payload = PayloadSource(hidden_data)
         self._compress = compression.compress
+        # values computed from the cover on first use, shared by every call
+        self._derived = {}
+        self._reset_state()
 
+    def _reset_state(self):
         self._processed_pixels = None
         self._header_pixels = None
         self._buffer = BoolDataBuffer()
 
-    def embed(self, iterations):
+        self._hist = None
+        self._next_hist = None
+
+    # The embedded image is written to out when given; inplace overwrites the cover itself,
+    # so later embeds start from the embedded image and nothing derived from the old cover is kept
+    @profiled('embed')
+    def embed(self, iterations, out=None, inplace=False):
+        try:
+            return self._new_context()._embed(iterations, out, inplace)
+        finally:
+            if inplace:
+                self._derived.clear()
+
+    def _embed(self, iterations, out, inplace):
         if iterations > self._ITERATIONS_LIMIT:
             raise ValueError(self._ITERATIONS_LIMIT_EXCEEDED_ERROR)
-        self._header_pixels, self._processed_pixels = get_header_and_body(self._cover_image, HEADER_SIZE)
-        is_modified = self._preprocess(iterations)
-        self._fill_buffer(is_modified)
+        self._start_trace()
+        with phase('split'):
+            image = get_work_image(self._cover_image, out, inplace)
+            self._header_pixels, self._processed_pixels = get_header_and_body(image, self._config.header_size,
+                                                                              copy=False)
+            self._next_hist = None
+        with phase('preprocess'):
+            is_modified = self._preprocess(iterations)
+        with phase('buffer'):
+            self._fill_buffer(is_modified)
         self._process(iterations)
-        embedded_image = assemble_image(self._header_pixels, self._processed_pixels, self._cover_image.shape)
-        return embedded_image, iterations, len(self._hidden_data) - len(self._buffer.next(-1))
+        with phase('assemble'):
+            embedded_image = assemble_image(self._header_pixels, self._processed_pixels, image.shape, out=image)
+        pure_embedded_data = len(self._payload) - self._buffer.remaining()
+        self._emit('embed', iterations=iterations, capacity=pure_embedded_data)
+        return embedded_image, iterations, pure_embedded_data
 
     def _preprocess(self, iterations):
         is_modified = np.zeros_like(self._processed_pixels, dtype=np.bool)
@@ -39,16 +70,20 @@ class OriginalEmbedder:
         return is_modified
 
     def _fill_buffer(self, is_modified):
-        self._buffer.clear()
-        is_modified_compressed = self._compress(bits_to_bytes(is_modified))
-        is_modified_size_bits = integer_to_binary(len(is_modified_compressed), COMPRESSED_DATA_LENGTH_BITS)
+        with phase('compress'):
+            is_modified_compressed = self._compress(bits_to_bytes(is_modified))
+        is_modified_size_bits = integer_to_binary(len(is_modified_compressed), self._config.compressed_data_length_bits)
         is_modified_bits = bytes_to_bits(is_modified_compressed)
-        self._buffer = BoolDataBuffer(*self._get_overhead(), is_modified_size_bits, is_modified_bits, self._hidden_data)
+        overhead = self._get_overhead()
+        self._buffer = PayloadBuffer(*overhead, is_modified_size_bits, is_modified_bits, payload=self._payload)
+        self._emit('location_map', map_bits=len(is_modified), compressed_bits=len(is_modified_bits),
+                   overhead_bits=sum(len(bits) for bits in overhead) + len(is_modified_size_bits) + len(is_modified_bits))
 
     def _get_overhead(self):
         return get_lsb(self._header_pixels),
 
     def _process(self, iterations):
+        total_iterations = iterations
         previous_left_peaks = previous_right_peaks = 0
 
         def get_previous_binary():
@@ -58,38 +93,61 @@ class OriginalEmbedder:
             return ret
 
         while iterations:
-            iterations -= 1
-            left_peak, right_peak = self._get_peaks()
-
-            self._processed_pixels[self._processed_pixels < left_peak] -= 1
-            self._processed_pixels[self._processed_pixels > right_peak] += 1
-
+            with phase('iteration'):
+                iterations -= 1
+                with phase('peaks'):
+                    left_peak, right_peak = self._get_peaks()
+
+                self._shift_and_embed(left_peak, right_peak, get_previous_binary())
+                if self._observers:
+                    capacity = self._hist[left_peak] + self._hist[right_peak]
+                    self._emit_iteration(iteration=total_iterations - iterations, left_peak=left_peak,
+                                         right_peak=right_peak, capacity=capacity, net_capacity=capacity - 16)
+
+                previous_left_peaks = left_peak
+                previous_right_peaks = right_peak
+
+        with phase('lsb'):
+            self._header_pixels[0] = set_lsb(self._header_pixels[0], self._buffer.get_parity())
+            # a header longer than the two peaks is padded with zeros
             binary_previous_peaks = get_previous_binary()
-
+            binary_previous_peaks += [0] * (self._header_pixels.size - 1 - len(binary_previous_peaks))
+            binary_index = 0
+            for index in range(1, self._header_pixels.size):
+                binary_value = binary_previous_peaks[binary_index]
+                binary_index += 1
+                self._header_pixels[index] = set_lsb(self._header_pixels[index], binary_value)
+
+    def _shift_and_embed(self, left_peak, right_peak, binary_previous_peaks):
+        with phase('buffer'):
             self._buffer.add(binary_previous_peaks)
+            left_bits = self._buffer.next(self._hist[left_peak])
+            right_bits = self._buffer.next(self._hist[right_peak])
 
-            self._processed_pixels[self._processed_pixels == left_peak] -= self._buffer.next(
-                np.count_nonzero(self._processed_pixels == left_peak))
-            self._processed_pixels[self._processed_pixels == right_peak] += self._buffer.next(
-                np.count_nonzero(self._processed_pixels == right_peak))
-
-            previous_left_peaks = left_peak
-            previous_right_peaks = right_peak
-
-        self._header_pixels[0] = set_lsb(self._header_pixels[0], self._buffer.get_parity())
-        binary_previous_peaks = get_previous_binary()
-        binary_index = 0
-        for index in range(1, self._header_pixels.size):
-            binary_value = binary_previous_peaks[binary_index]
-            binary_index += 1
-            self._header_pixels[index] = set_lsb(self._header_pixels[index], binary_value)
+        with phase('shift_and_embed'):
+            self._next_hist = shift_and_embed_pair(self._processed_pixels, left_peak, right_peak,
+                                                   left_bits, right_bits, self._hist)
 
     def _get_peaks(self):
-        hist = np.bincount(self._processed_pixels)
+        hist = self._get_hist()
         return np.sort(hist.argsort()[-2:])
 
+    def _emit_iteration(self, **fields):
+        self._emit('iteration', **fields, brightness_drift=self._get_brightness_drift(self._next_hist))
+
+    # Trimmed to the length np.bincount gives without minlength, so argsort ties resolve the same way
+    def _get_hist(self):
+        if self._next_hist is not None:
+            self._hist, self._next_hist = self._next_hist, None
+        else:
+            self._hist = np.bincount(self._processed_pixels, minlength=MAX_PIXEL_VALUE + 1)
+        return self._hist[:np.flatnonzero(self._hist)[-1] + 1]
+
+    # Each sweep is a context of its own, so sweeping never changes the shared instance
     def __iter__(self):
-        return self
+        sweep = self._new_context()
+        sweep._index = 0
+        return sweep
 
     def __next__(self):
         if not hasattr(self, '_index'):
@@ -103,71 +161,117 @@ class OriginalEmbedder:
             raise StopIteration
 
 
-class OriginalExtractor:
-    def __init__(self, compression=deflate):
+class OriginalExtractor(Observable, Configurable, Reentrant):
+    _HEADER_SIZE = HEADER_SIZE
+    _DEFAULT_CONFIG = DEFAULT_CONFIG
+
+    def __init__(self, compression=deflate, config: RdhConfig = None):
+        self._set_config(config)
         self._decompress = compression.decompress
+        self._reset_state()
 
+    def _reset_state(self):
         self._header_pixels = None
         self._processed_pixels = None
         self._buffer = BoolDataBuffer()
+        self._restores_image = True
+        self._unpacks_payload = True
 
     @staticmethod
     def _get_peaks(peaks):
-        return binary_to_integer(peaks[:8]), binary_to_integer(peaks[8:])
-
-    def extract(self, embedded_image):
-        embedded_image = embedded_image.copy()
-        self._header_pixels, self._processed_pixels = get_header_and_body(embedded_image, HEADER_SIZE)
+        return binary_to_integer(peaks[:8]), binary_to_integer(peaks[8:16])
+
+    # mode 'payload' returns None for the image and 'image' None for the payload
+    @profiled('extract')
+    def extract(self, embedded_image, out=None, inplace=False, mode='both'):
+        return self._new_context()._extract(embedded_image, out, inplace, mode)
+
+    def _extract(self, embedded_image, out, inplace, mode='both'):
+        self._restores_image, self._unpacks_payload = get_extract_parts(mode)
+        self._start_trace()
+        with phase('split'):
+            # without the image to restore the pixels are only read, so they are not copied
+            image = get_work_image(as_pixels(embedded_image), out, inplace) if self._restores_image \
+                else as_pixels(embedded_image)
+            self._header_pixels, self._processed_pixels = get_header_and_body(image, self._config.header_size,
+                                                                              copy=False)
 
         iterations = self._process()
-        hidden_data, is_modified_packed = self._process_data(iterations)
-        is_modified = self._unpack_is_modified(is_modified_packed, iterations)
-        self._recover_image(iterations, is_modified)
-
-        cover_image = assemble_image(self._header_pixels, self._processed_pixels, embedded_image.shape)
-
+        with phase('payload'):
+            hidden_data, is_modified_packed = self._process_data(iterations)
+
+        cover_image = None
+        if self._restores_image:
+            with phase('unpack'):
+                is_modified = self._unpack_is_modified(is_modified_packed, iterations)
+            with phase('recover'):
+                self._recover_image(iterations, is_modified)
+            with phase('assemble'):
+                cover_image = assemble_image(self._header_pixels, self._processed_pixels, image.shape, out=image)
+
+        self._emit('extract', iterations=iterations, mode=mode,
+                   payload_bits=None if hidden_data is None else 8 * len(hidden_data))
         return cover_image, iterations, hidden_data
 
+    # The iterations are unwound on a ValueIndex, so each one only touches the bins it merges
     def _process(self):
         iterations = 0
         parity = get_lsb([self._header_pixels[0]])
         self._buffer.set_parity(parity)
         left_peak, right_peak = self._get_peaks(get_lsb(self._header_pixels[1:]))
+        with phase('index'):
+            value_index = ValueIndex(self._processed_pixels)
         while left_peak or right_peak:
-            iterations += 1
-
-            left_peak_pixels = self._processed_pixels[
-                np.logical_or(self._processed_pixels == left_peak, self._processed_pixels == left_peak - 1)]
-
-            right_peak_pixels = self._processed_pixels[
-                np.logical_or(self._processed_pixels == right_peak, self._processed_pixels == right_peak + 1)]
-
-            iteration_data = []
-            iteration_data.extend(left_peak - left_peak_pixels)
-            iteration_data.extend(right_peak_pixels - right_peak)
-            self._buffer.add(iteration_data)
-
-            self._processed_pixels[self._processed_pixels == left_peak - 1] = left_peak
-            self._processed_pixels[self._processed_pixels == right_peak + 1] = right_peak
-            self._processed_pixels[self._processed_pixels < left_peak] += 1
-            self._processed_pixels[self._processed_pixels > right_peak] -= 1
-
-            binary_last_peaks = self._buffer.next(16)
-            left_peak, right_peak = self._get_peaks(binary_last_peaks)
-
+            with phase('iteration'):
+                iterations += 1
+
+                with phase('payload'):
+                    left_peak_data = value_index.read_pair(left_peak, -1)
+                    right_peak_data = value_index.read_pair(right_peak, 1)
+
+                with phase('buffer'):
+                    self._buffer.add(np.concatenate([left_peak_data, right_peak_data]))
+                self._emit('iteration', iteration=iterations, left_peak=left_peak, right_peak=right_peak,
+                           bits=left_peak_data.size + right_peak_data.size)
+
+                # merges each embedded bin back into its peak and pulls the outer bins in
+                with phase('shift'):
+                    lut = get_identity_lut()
+                    lut[:left_peak] += 1
+                    lut[right_peak + 1:] -= 1
+                    value_index.apply_lut(lut)
+
+                with phase('peaks'):
+                    binary_last_peaks = self._buffer.next(16)
+                    left_peak, right_peak = self._get_peaks(binary_last_peaks)
+
+        if self._restores_image:
+            with phase('materialize'):
+                value_index.materialize(self._processed_pixels)
         return iterations
 
     def _process_data(self, iterations):
-        for index, value in np.ndenumerate(self._header_pixels):
-            self._header_pixels[index] = set_lsb(value, self._buffer.next())
-
-        is_modified_size_bits = self._buffer.next(COMPRESSED_DATA_LENGTH_BITS)
-        is_modified_compressed_size = binary_to_integer(is_modified_size_bits)
-        is_modified_compressed = self._buffer.next(is_modified_compressed_size * 8)
-        is_modified_minimized_bytes = self._decompress(bits_to_bytes(is_modified_compressed))
-        is_modified = bytes_to_bits(is_modified_minimized_bytes)
-        hidden_data = bits_to_bytes(self._buffer.next(-1))
-        return hidden_data, is_modified
+        self._fix_header_LSBs()
+        is_modified = self._read_compressed()
+        return self._read_payload(), is_modified
+
+    # The header LSBs are always read past, and written back only when the image is restored
+    def _fix_header_LSBs(self):
+        LSBs = self._buffer.next(self._header_pixels.size)
+        if self._restores_image:
+            self._header_pixels[...] = (self._header_pixels & np.uint8(0xFE)) | LSBs
+
+    # The compressed side information, decompressed only when the image is restored
+    def _read_compressed(self):
+        compressed_size = binary_to_integer(self._buffer.next(self._config.compressed_data_length_bits))
+        compressed = self._buffer.next(compressed_size * 8)
+        if not self._restores_image:
+            return None
+        with phase('decompress'):
+            return bytes_to_bits(self._decompress(bits_to_bytes(compressed)))
+
+    def _read_payload(self):
+        return bits_to_bytes(self._buffer.next(-1)) if self._unpacks_payload else None
 
     def _unpack_is_modified(self, is_modified_packed, iterations):
         is_modified = np.zeros_like(self._processed_pixels, dtype=np.bool)
@@ -260,18 +364,19 @@ class NeighboringBinsExtractor(OriginalExtractor):
         self._processed_pixels[np.logical_and(is_modified_decompressed, self._processed_pixels >= 128)] += 1
 
 class BPNeighboringBinsEmbedder(NeighboringBinsEmbedder):
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        OriginalEmbedder.__init__(self, cover_image, hidden_data, compression)
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        OriginalEmbedder.__init__(self, cover_image, hidden_data, compression, config)
         self._original_brightness = np.mean(cover_image)
 
     def _get_peaks(self):
-        hist = np.bincount(self._processed_pixels)
+        hist = self._get_hist()
         current_brightness = np.mean(self._processed_pixels)
         cutoff_index = int(np.ceil(current_brightness))
 
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD:
+        if self._original_brightness - current_brightness > self._config.brightness_threshold:
             return np.sort(hist[:cutoff_index].argsort()[-2:])
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold:
             return np.sort(hist[cutoff_index:].argsort()[-2:]) + cutoff_index
         else:
             return np.sort(hist.argsort()[-2:])
@@ -334,18 +439,19 @@ class NbVoExtractor(OriginalExtractor):
 
 
 class BPNbVoEmbedder(NbVoEmbedder):
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        super().__init__(cover_image, hidden_data, compression)
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        super().__init__(cover_image, hidden_data, compression, config)
         self._original_brightness = np.mean(cover_image)
 
     def _get_peaks(self):
-        hist = np.bincount(self._processed_pixels)
+        hist = self._get_hist()
         current_brightness = np.mean(self._processed_pixels)
         cutoff_index = int(np.ceil(current_brightness))
 
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD:
+        if self._original_brightness - current_brightness > self._config.brightness_threshold:
             return np.sort(hist[:cutoff_index].argsort()[-2:])
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold:
             return np.sort(hist[cutoff_index:].argsort()[-2:]) + cutoff_index
         else:
             return np.sort(hist.argsort()[-2:])
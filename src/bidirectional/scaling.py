@@ -4,8 +4,50 @@ from util.util import *
 
 class ScalingEmbedder(OriginalEmbedder):
     _ITERATIONS_LIMIT = 10000
+    # scaling to MAX_PIXEL_VALUE - 2 * iterations needs at least two values left
+    _MAX_SCALED_ITERATIONS = MAX_PIXEL_VALUE // 2
+
+    def is_feasible(self, iterations):
+        return self._is_feasible(self._get_body_hist(), iterations)
+
+    def _is_feasible(self, hist, iterations):
+        if iterations > self._MAX_SCALED_ITERATIONS:
+            return False
+        return bool(self._get_feasible(hist, np.array([iterations]))[0])
+
+    # Whether each of the iteration counts, none above _MAX_SCALED_ITERATIONS, is feasible
+    def _get_feasible(self, hist, iterations):
+        return get_rounding_feasible(hist, MAX_PIXEL_VALUE - 2 * iterations)
+
+    # The last iteration count a sweep reaches: iterating stops at the first infeasible one.
+    # Feasibility is not monotone in the iteration count, so every count up to the limit is
+    # checked, in one pass over the value table.
+    def get_max_iterations(self):
+        if 'max_iterations' not in self._derived:
+            limit = min(self._ITERATIONS_LIMIT, self._MAX_SCALED_ITERATIONS)
+            infeasible = np.flatnonzero(~self._get_feasible(self._get_body_hist(), np.arange(1, limit + 1)))
+            self._derived['max_iterations'] = int(infeasible[0]) if infeasible.size else limit
+        return self._derived['max_iterations']
+
+    def get_feasible_iterations(self):
+        return range(1, self.get_max_iterations() + 1)
+
+    def _get_body_hist(self):
+        if 'body_hist' not in self._derived:
+            body = self._cover_image.ravel()[self._config.header_size:]
+            self._derived['body_hist'] = np.bincount(body, minlength=MAX_PIXEL_VALUE + 1)
+        return self._derived['body_hist']
+
+    def __next__(self):
+        if getattr(self, '_index', 0) >= self.get_max_iterations():
+            raise StopIteration
+        return super().__next__()
 
     def _preprocess(self, iterations):
+        # checked on the pixels being embedded into, not on the values cached from the cover
+        if not self._is_feasible(np.bincount(self._processed_pixels, minlength=MAX_PIXEL_VALUE + 1), iterations):
+            raise ValueError(super()._ITERATIONS_LIMIT_EXCEEDED_ERROR)
+
         original_pixels = self._processed_pixels.copy()
         self._original_min = np.min(self._processed_pixels)
         self._original_max = np.max(self._processed_pixels)
@@ -14,10 +56,6 @@ class ScalingEmbedder(OriginalEmbedder):
         self._processed_pixels = scale_to(self._processed_pixels, scaled_max)
         mapped_values = get_mapped_values(self._original_max - self._original_min, scaled_max)
         is_rounded = self.get_is_rounded(original_pixels, self._processed_pixels)
-
-        if len(np.unique(is_rounded)) > 2:
-            raise ValueError(super()._ITERATIONS_LIMIT_EXCEEDED_ERROR)
-
         is_rounded = is_rounded.astype(bool)
 
         is_rounded = is_rounded[np.in1d(self._processed_pixels, mapped_values)]
@@ -41,19 +79,13 @@ class ScalingEmbedder(OriginalEmbedder):
 
 class ScalingExtractor(OriginalExtractor):
     def _process_data(self, iterations):
-        for index, value in np.ndenumerate(self._header_pixels):
-            self._header_pixels[index] = set_lsb(value, self._buffer.next())
+        self._fix_header_LSBs()
 
         self._original_min = binary_to_integer(self._buffer.next(8))
         self._original_max = binary_to_integer(self._buffer.next(8))
 
-        is_modified_size_bits = self._buffer.next(COMPRESSED_DATA_LENGTH_BITS)
-        is_modified_compressed_size = binary_to_integer(is_modified_size_bits)
-        is_modified_compressed = self._buffer.next(is_modified_compressed_size * 8)
-        is_modified_minimized_bytes = self._decompress(bits_to_bytes(is_modified_compressed))
-        is_rounded = bytes_to_bits(is_modified_minimized_bytes)
-        hidden_data = bits_to_bytes(self._buffer.next(-1))
-        return hidden_data, is_rounded
+        is_rounded = self._read_compressed()
+        return self._read_payload(), is_rounded
 
     def _unpack_is_modified(self, is_modified_packed, iterations):
         return is_modified_packed[:self._processed_pixels.size]
@@ -75,11 +107,19 @@ class VariableBitsScalingEmbedder(ScalingEmbedder):
     def __init__(self, cover_image: np.ndarray,
                  hidden_data: Iterable,
                  compression: CompressionAlgorithm = deflate,
-                 bit_limit=2):
-        super().__init__(cover_image, hidden_data, compression)
+                 bit_limit=2,
+                 config: RdhConfig = None):
+        super().__init__(cover_image, hidden_data, compression, config)
         self._bit_limit = bit_limit
 
+    def _get_feasible(self, hist, iterations):
+        values = np.flatnonzero(hist)
+        return get_bits_feasible(values[-1] - values[0], MAX_PIXEL_VALUE - 2 * iterations, self._bit_limit)
+
     def _preprocess(self, iterations):
+        if not self._is_feasible(np.bincount(self._processed_pixels, minlength=MAX_PIXEL_VALUE + 1), iterations):
+            raise ValueError(super()._ITERATIONS_LIMIT_EXCEEDED_ERROR)
+
         original_pixels = self._processed_pixels.copy()
         self._original_min = np.min(self._processed_pixels)
         self._original_max = np.max(self._processed_pixels)
@@ -88,8 +128,6 @@ class VariableBitsScalingEmbedder(ScalingEmbedder):
         self._processed_pixels = scale_to(self._processed_pixels, scaled_max)
         # mapped_values = get_mapped_values(self._original_max - self._original_min, scaled_max)
         map_sizes = get_values_freqs(self._original_max - self._original_min, scaled_max)
-        if np.max(map_sizes) > self._bit_limit:
-            raise ValueError
 
         is_rounded = self.get_is_rounded(original_pixels, self._processed_pixels)
         is_rounded_bits = BoolDataBuffer()
@@ -106,21 +144,6 @@ class VariableBitsScalingEmbedder(ScalingEmbedder):
 
 
 class VariableBitsScalingExtractor(ScalingExtractor):
-    def _process_data(self, iterations):
-        for index, value in np.ndenumerate(self._header_pixels):
-            self._header_pixels[index] = set_lsb(value, self._buffer.next())
-
-        self._original_min = binary_to_integer(self._buffer.next(8))
-        self._original_max = binary_to_integer(self._buffer.next(8))
-
-        is_modified_size_bits = self._buffer.next(COMPRESSED_DATA_LENGTH_BITS)
-        is_modified_compressed_size = binary_to_integer(is_modified_size_bits)
-        is_modified_compressed = self._buffer.next(is_modified_compressed_size * 8)
-        is_modified_minimized_bytes = self._decompress(bits_to_bytes(is_modified_compressed))
-        is_rounded = bytes_to_bits(is_modified_minimized_bytes)
-        hidden_data = bits_to_bytes(self._buffer.next(-1))
-        return hidden_data, is_rounded
-
     def _unpack_is_modified(self, is_modified_packed, iterations):
         return is_modified_packed
 
@@ -150,8 +173,9 @@ class VariableBitsScalingExtractor(ScalingExtractor):
 class ValueOrderScalingEmbedder(VariableBitsScalingEmbedder):
     def __init__(self, cover_image: np.ndarray,
                  hidden_data: Iterable,
-                 compression: CompressionAlgorithm = deflate):
-        super().__init__(cover_image, hidden_data, compression, 1)
+                 compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        super().__init__(cover_image, hidden_data, compression, 1, config)
 
 
 class ValueOrderedScalingExtractor(VariableBitsScalingExtractor):
@@ -168,6 +192,44 @@ def get_values_freqs(original_max: int, scaled_max: int):
     return np.ceil(np.log2(values_freq)).astype(int)
 
 
+# scale_to on every row of rows at once, each to its own maximum in scaled_maxes
+def scale_rows_to(rows: np.ndarray, scaled_maxes) -> np.ndarray:
+    rows = rows - np.min(rows, axis=1, keepdims=True)
+    original_ranges = np.max(rows, axis=1, keepdims=True) + 1
+    scaled_ranges = np.broadcast_to(np.asarray(scaled_maxes, dtype=np.int64), (len(rows),))[:, None] + 1
+    scaled = rows * (scaled_ranges / original_ranges)
+    scaled = np.where(scaled_ranges > original_ranges, np.ceil(scaled - EPS), np.floor(scaled + EPS))
+    return scaled.astype(np.int64)
+
+
+# scale_to maps every value on its own once the minimum and maximum are fixed, so both
+# checks run on a table of the values between them instead of on the pixels, with a row
+# per scaled maximum. The differences are taken modulo 256 as the uint8 pixels would be.
+def get_rounding_feasible(value_hist: np.ndarray, scaled_maxes) -> np.ndarray:
+    values = np.flatnonzero(value_hist)
+    original = np.arange(values[-1] - values[0] + 1)
+    rows = np.broadcast_to(original, (len(scaled_maxes), original.size))
+    recovered = scale_rows_to(scale_rows_to(rows, scaled_maxes), original[-1])
+    is_rounded = (original - recovered)[:, value_hist[values[0]:values[-1] + 1] > 0] % (MAX_PIXEL_VALUE + 1)
+    return np.count_nonzero(np.diff(np.sort(is_rounded, axis=1), axis=1), axis=1) < 2
+
+
+# No scaled value is shared by more than 2 ** bit_limit original values
+def get_bits_feasible(original_max: int, scaled_maxes, bit_limit: int) -> np.ndarray:
+    rows = np.broadcast_to(np.arange(original_max + 1), (len(scaled_maxes), original_max + 1))
+    scaled = scale_rows_to(rows, scaled_maxes) + np.arange(len(rows))[:, None] * (MAX_PIXEL_VALUE + 1)
+    freqs = np.bincount(scaled.ravel(), minlength=len(rows) * (MAX_PIXEL_VALUE + 1)).reshape(len(rows), -1)
+    return np.max(freqs, axis=1) <= 2 ** bit_limit
+
+
+def is_rounding_feasible(value_hist: np.ndarray, scaled_max: int) -> bool:
+    return bool(get_rounding_feasible(value_hist, [scaled_max])[0])
+
+
+def is_bits_feasible(original_max: int, scaled_max: int, bit_limit: int) -> bool:
+    return bool(get_bits_feasible(original_max, [scaled_max], bit_limit)[0])
+
+
 def integers_to_bits(r, m=8):
     return ((r[:, None] & (1 << np.arange(m))) > 0).ravel().astype(bool)
 
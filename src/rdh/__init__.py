@@ -0,0 +1,3 @@
+from .sources import *
+from .pipeline import *
+from .tasks import *
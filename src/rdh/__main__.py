@@ -0,0 +1,92 @@
+import argparse
+import functools
+import sys
+import traceback
+
+from rdh.pipeline import Pipeline
+from rdh.sources import iterate_sources
+from rdh.tasks import OutputWriter, embed_task, extract_task, get_payload, init_worker, plan_task, verify_task
+from rdh_algorithm import get_algorithm
+from util.config import get_config, parse_parameter_value
+from util.util import EXTRACT_MODES
+
+parser = argparse.ArgumentParser(prog='rdh', description='Embed, extract, verify or plan over many covers.')
+parser.add_argument('--io-workers', type=int, default=4, help='Threads for reading, decoding and encoding.')
+parser.add_argument('--workers', type=int, help='Processes for embedding/extraction (default: CPU count).')
+parser.add_argument('--max-in-flight', type=int, help='Files held in memory at once.')
+parser.add_argument('--report', help='Write a JSON line per file to this path.')
+parser.add_argument('--quiet', action='store_true', help='Only print failures and the final statistics.')
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+
+def add_command(name: str, help_text: str, embeds: bool, writes: bool):
+    command_parser = subparsers.add_parser(name, help=help_text)
+    command_parser.add_argument('inputs', nargs='+', help='Directories, tar archives, image files or glob patterns.')
+    command_parser.add_argument('-a', '--algorithm', required=True, help='Algorithm label.')
+    command_parser.add_argument('--parameters', nargs='+', default=[], metavar='NAME=VALUE',
+                                help='RdhConfig values instead of the defaults, e.g. exact_candidates=8; '
+                                     'extract needs the values the images were embedded with.')
+    if embeds:
+        command_parser.add_argument('-n', '--iterations', type=int, default=1000)
+        command_parser.add_argument('--data', help='Payload file (default: random bits).')
+    if writes:
+        command_parser.add_argument('-o', '--output', required=True, help='Output directory.')
+    return command_parser
+
+
+add_command('embed', 'Embed the payload and write the embedded images.', embeds=True, writes=True)
+extract_parser = add_command('extract', 'Recover the covers and hidden data from embedded images.', embeds=False,
+                             writes=True)
+extract_parser.add_argument('--mode', choices=EXTRACT_MODES, default='both',
+                            help='Recover the covers and the data, only the data or only the covers.')
+add_command('verify', 'Embed and extract in memory and check the round trip.', embeds=True, writes=False)
+add_command('plan', 'Report the capacity after every iteration.', embeds=True, writes=False)
+
+args = parser.parse_args()
+
+try:
+    algorithm = get_algorithm(args.algorithm)
+    config = get_config({name: parse_parameter_value(value)
+                         for name, _, value in (argument.partition('=') for argument in args.parameters)})
+    algorithm.embedder.resolve_config(config)
+except KeyError as error:
+    parser.error(error.args[0])
+except ValueError as error:
+    parser.error(str(error))
+
+if args.command == 'extract':
+    compute = functools.partial(extract_task, args.algorithm, mode=args.mode, config=config)
+    payload = b''
+else:
+    task = {'embed': embed_task, 'verify': verify_task, 'plan': plan_task}[args.command]
+    compute = functools.partial(task, args.algorithm, args.iterations, config=config)
+    payload = get_payload(args.data)
+
+writer = OutputWriter(getattr(args, 'output', None), args.report)
+failures = []
+
+
+def on_record(name: str, record: dict, error: BaseException):
+    if error is not None:
+        failures.append(name)
+        print(f'{name}: FAILED', file=sys.stderr)
+        traceback.print_exception(error)
+        return
+    if args.command == 'verify' and not (record['recovered'] and record['data_recovered']):
+        failures.append(name)
+        print(f'{name}: ROUND TRIP FAILED {record}', file=sys.stderr)
+    elif not args.quiet:
+        print(name, ' '.join(f'{key}={value}' for key, value in record.items() if key not in ('name', 'capacities')))
+
+
+pipeline = Pipeline(compute, writer, args.io_workers, args.workers, args.max_in_flight, init_worker, (payload,))
+try:
+    stats = pipeline.run(iterate_sources(args.inputs), on_record)
+except FileNotFoundError as error:
+    parser.error(str(error))
+finally:
+    writer.close()
+
+print('----------------------')
+print(stats.table())
+sys.exit(1 if failures else 0)
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from rdh.sources import SourceItem
+from util.util import decode_image
+
+__all__ = [
+    'PipelineStats',
+    'Pipeline',
+]
+
+
+@dataclass
+class PipelineStats:
+    files: int = 0
+    failed: int = 0
+    pixels: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    decode_seconds: float = 0
+    compute_seconds: float = 0
+    encode_seconds: float = 0
+    wall_seconds: float = 0
+
+    def table(self) -> str:
+        wall_seconds = self.wall_seconds or float('inf')
+        lines = [
+            f'files:      {self.files} ({self.failed} failed)',
+            f'wall time:  {self.wall_seconds:.3f} s',
+            f'throughput: {self.files / wall_seconds:.2f} files/s, {self.pixels / 1e6 / wall_seconds:.2f} MP/s',
+            f'read:       {self.bytes_read / 2 ** 20:.2f} MiB, written: {self.bytes_written / 2 ** 20:.2f} MiB',
+            f'busy time:  decode {self.decode_seconds:.3f} s, compute {self.compute_seconds:.3f} s, '
+            f'encode {self.encode_seconds:.3f} s',
+        ]
+        return '\n'.join(lines)
+
+
+def _timed(function: Callable, *args) -> (object, float):
+    start_time = time.perf_counter()
+    returned = function(*args)
+    return returned, time.perf_counter() - start_time
+
+
+# Streams covers through three overlapping stages:
+#   decode  (thread pool)  bytes -> image
+#   compute (process pool) image -> result
+#   encode  (thread pool)  result -> written bytes and a record
+# At most max_in_flight files are between reading and the end of their encode stage,
+# so memory stays bounded however many files the source yields.
+# compute must be picklable (a module-level function or a partial of one); it runs
+# as compute(image). encode runs as encode(name, image, result) and returns
+# (bytes_written, record). on_record(name, record, error) is called for every file.
+class Pipeline:
+    def __init__(self, compute: Callable, encode: Callable, io_workers: int = 4, compute_workers: int = None,
+                 max_in_flight: int = None, initializer: Callable = None, initargs: tuple = ()):
+        self._compute = compute
+        self._encode = encode
+        compute_workers = compute_workers or os.cpu_count()
+        self._io_pool = ThreadPoolExecutor(io_workers)
+        self._compute_pool = ProcessPoolExecutor(compute_workers, initializer=initializer, initargs=initargs)
+        self._max_in_flight = max_in_flight or 2 * compute_workers + io_workers
+        self._slots = threading.BoundedSemaphore(self._max_in_flight)
+        self._lock = threading.Lock()
+        self._stats = PipelineStats()
+        self._on_record: Optional[Callable] = None
+
+    def run(self, items: Iterable[SourceItem], on_record: Callable = None) -> PipelineStats:
+        self._stats = PipelineStats()
+        self._on_record = on_record
+        start_time = time.perf_counter()
+        try:
+            for item in items:
+                self._slots.acquire()
+                self._io_pool.submit(_timed, self._decode, item).add_done_callback(
+                    lambda future, name=item.name: self._decoded(name, future))
+            for _ in range(self._max_in_flight):
+                self._slots.acquire()
+        finally:
+            self._io_pool.shutdown(wait=True, cancel_futures=True)
+            self._compute_pool.shutdown(wait=True, cancel_futures=True)
+        self._stats.wall_seconds = time.perf_counter() - start_time
+        return self._stats
+
+    def _decode(self, item: SourceItem) -> np.ndarray:
+        with self._lock:
+            self._stats.bytes_read += len(item.data)
+        return decode_image(item.data)
+
+    def _decoded(self, name: str, future: Future):
+        try:
+            image, seconds = future.result()
+            with self._lock:
+                self._stats.decode_seconds += seconds
+            self._compute_pool.submit(_timed, self._compute, image).add_done_callback(
+                lambda compute_future: self._computed(name, image, compute_future))
+        except BaseException as error:
+            self._finish(name, None, error)
+
+    def _computed(self, name: str, image: np.ndarray, future: Future):
+        try:
+            result, seconds = future.result()
+            with self._lock:
+                self._stats.compute_seconds += seconds
+            self._io_pool.submit(_timed, self._encode, name, image, result).add_done_callback(
+                lambda encode_future: self._encoded(name, image, encode_future))
+        except BaseException as error:
+            self._finish(name, None, error)
+
+    def _encoded(self, name: str, image: np.ndarray, future: Future):
+        try:
+            (bytes_written, record), seconds = future.result()
+            with self._lock:
+                self._stats.encode_seconds += seconds
+                self._stats.bytes_written += bytes_written
+                self._stats.pixels += image.size
+            self._finish(name, record, None)
+        except BaseException as error:
+            self._finish(name, None, error)
+
+    def _finish(self, name: str, record: Optional[dict], error: Optional[BaseException]):
+        try:
+            with self._lock:
+                self._stats.files += 1
+                self._stats.failed += error is not None
+                if self._on_record is not None:
+                    self._on_record(name, record, error)
+        finally:
+            self._slots.release()
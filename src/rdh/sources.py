@@ -0,0 +1,85 @@
+import glob
+import os
+import posixpath
+import tarfile
+from typing import Iterator, List, NamedTuple
+
+from util.util import IMAGE_EXTENSIONS
+
+__all__ = [
+    'SourceItem',
+    'get_safe_name',
+    'iterate_sources',
+]
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+class SourceItem(NamedTuple):
+    name: str  # relative name, reused for the output path
+    data: bytes
+
+
+# The name normalized to a relative '/'-separated path. Absolute names and names that climb
+# out with '..' are rejected, since the name becomes a path under the output directory.
+def get_safe_name(name: str) -> str:
+    normalized = posixpath.normpath(name.replace(os.sep, '/'))
+    if posixpath.isabs(normalized) or os.path.splitdrive(name)[0] or normalized == '.' \
+            or '..' in normalized.split('/'):
+        raise ValueError(f'unsafe input name: {name!r}')
+    return normalized
+
+
+def _has_image_extension(name: str) -> bool:
+    return os.path.splitext(name)[1][1:].lower() in IMAGE_EXTENSIONS
+
+
+def _read_file(path: str, name: str) -> SourceItem:
+    with open(path, 'rb') as f:
+        return SourceItem(name, f.read())
+
+
+def _iterate_directory(directory_path: str) -> Iterator[SourceItem]:
+    for root, directories, filenames in os.walk(directory_path):
+        directories.sort()
+        for filename in sorted(filenames):
+            if _has_image_extension(filename):
+                path = os.path.join(root, filename)
+                yield _read_file(path, get_safe_name(os.path.relpath(path, directory_path)))
+
+
+# Members are read one at a time in archive order, so compressed archives are streamed
+def _iterate_tar(archive_path: str) -> Iterator[SourceItem]:
+    with tarfile.open(archive_path, 'r|*') as archive:
+        for member in archive:
+            if member.isfile() and _has_image_extension(member.name):
+                yield SourceItem(get_safe_name(member.name), archive.extractfile(member).read())
+
+
+# The directory a glob pattern starts from: its leading components without wildcards.
+# Matches keep their path below it, so equal filenames in different directories stay apart.
+def _get_pattern_base(pattern: str) -> str:
+    base = os.path.dirname(pattern)
+    while glob.has_magic(base):
+        base = os.path.dirname(base)
+    return base or os.curdir
+
+
+# Each input is a directory (walked recursively), a tar archive, an image file or a glob pattern.
+# Files are read lazily, one by one, as the consumer asks for them.
+def iterate_sources(inputs: List[str]) -> Iterator[SourceItem]:
+    for source in inputs:
+        if os.path.isdir(source):
+            yield from _iterate_directory(source)
+        elif os.path.isfile(source) and source.endswith(TAR_SUFFIXES):
+            yield from _iterate_tar(source)
+        elif os.path.isfile(source):
+            yield _read_file(source, get_safe_name(os.path.basename(source)))
+        else:
+            paths = sorted(glob.glob(source, recursive=True))
+            if not paths:
+                raise FileNotFoundError(f'No such file, directory or pattern: {source}')
+            base = _get_pattern_base(source)
+            for path in paths:
+                if os.path.isfile(path) and _has_image_extension(path):
+                    yield _read_file(path, get_safe_name(os.path.relpath(path, base)))
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from typing import Optional, Union
+
+import numpy as np
+
+from rdh.sources import get_safe_name
+from rdh_algorithm import get_algorithm, plan_capacity
+from util.config import RdhConfig
+from util.payload import PayloadSource
+from util.util import bits_to_bytes, encode_image
+
+__all__ = [
+    'get_payload',
+    'init_worker',
+    'embed_task',
+    'extract_task',
+    'verify_task',
+    'plan_task',
+    'OutputWriter',
+]
+
+# Set once per worker process by init_worker, so the payload is not pickled with every cover
+_payload = PayloadSource(b'')
+
+
+# A payload file is passed on as its path and memory-mapped by each worker
+def get_payload(path: str = None, bits: int = 2000 * 2000, seed: int = 2115) -> Union[bytes, str]:
+    if path is not None:
+        return path
+    return bits_to_bytes(np.random.RandomState(seed).randint(0, 2, size=bits) > 0)
+
+
+def init_worker(payload: Union[bytes, str]) -> None:
+    global _payload
+    _payload = PayloadSource(payload)
+
+
+def embed_task(label: str, iterations: int, cover: np.ndarray, config: RdhConfig = None) -> dict:
+    embedder = get_algorithm(label).embedder(cover, _payload, config=config)
+    embedded_image, iterations, pure_embedded_data = embedder.embed(iterations, inplace=True)
+    return {
+        'image': embedded_image,
+        'iterations': int(iterations),
+        'capacity': int(pure_embedded_data),
+    }
+
+
+def extract_task(label: str, embedded_image: np.ndarray, mode: str = 'both', config: RdhConfig = None) -> dict:
+    recovered_image, iterations, hidden_data = get_algorithm(label).extractor(config=config).extract(
+        embedded_image, inplace=True, mode=mode)
+    result = {'iterations': int(iterations)}
+    if recovered_image is not None:
+        result['image'] = recovered_image
+    if hidden_data is not None:
+        result['data'] = hidden_data
+    return result
+
+
+def verify_task(label: str, iterations: int, cover: np.ndarray, config: RdhConfig = None) -> dict:
+    algorithm = get_algorithm(label)
+    embedded_image, iterations, pure_embedded_data = algorithm.embedder(cover, _payload, config=config).embed(
+        iterations)
+    recovered_image, extraction_iterations, hidden_data = algorithm.extractor(config=config).extract(embedded_image,
+                                                                                                     inplace=True)
+    return {
+        'iterations': int(iterations),
+        'capacity': int(pure_embedded_data),
+        'recovered': bool(np.array_equal(recovered_image, cover) and extraction_iterations == iterations),
+        'data_recovered': hidden_data[:-1] == _payload.tobytes(0, max(len(hidden_data) - 1, 0)),
+    }
+
+
+def plan_task(label: str, iterations: int, cover: np.ndarray, config: RdhConfig = None) -> dict:
+    capacities = plan_capacity(get_algorithm(label), cover, _payload, iterations, config)
+    return {
+        'iterations': len(capacities),
+        'capacities': [int(capacity) for capacity in capacities],
+    }
+
+
+# Encode stage: writes the images (as PNG) and hidden data of a result under output_directory,
+# and appends a JSON line per file to the report. Returns bytes written and the record.
+# Two inputs that map to the same output file (x.png and x.jpg) raise instead of overwriting.
+class OutputWriter:
+    def __init__(self, output_directory: Optional[str] = None, report_path: Optional[str] = None):
+        self._output_directory = output_directory
+        self._report = open(report_path, 'w') if report_path else None
+        self._report_lock = threading.Lock()
+        self._paths = set()
+        self._paths_lock = threading.Lock()
+
+    def _write(self, name: str, extension: str, buffer: bytes) -> int:
+        path = os.path.join(self._output_directory, os.path.splitext(get_safe_name(name))[0] + extension)
+        with self._paths_lock:
+            if path in self._paths:
+                raise ValueError(f'{name} would overwrite {path}, written for another input')
+            self._paths.add(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(buffer)
+        return len(buffer)
+
+    def __call__(self, name: str, image: np.ndarray, result: dict) -> (int, dict):
+        bytes_written = 0
+        record = {'name': name, 'pixels': int(image.size)}
+        for key, value in result.items():
+            if key == 'image':
+                if self._output_directory is not None:
+                    bytes_written += self._write(name, '.png', encode_image(value))
+            elif key == 'data':
+                if self._output_directory is not None:
+                    bytes_written += self._write(name, '.bin', value)
+                record['data_bits'] = 8 * len(value)
+            else:
+                record[key] = value
+        if 'capacity' in record:
+            record['rate'] = record['capacity'] / image.size
+        if self._report is not None:
+            with self._report_lock:
+                self._report.write(json.dumps(record) + '\n')
+        return bytes_written, record
+
+    def close(self):
+        if self._report is not None:
+            self._report.close()
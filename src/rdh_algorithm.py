@@ -1,60 +1,136 @@
-from typing import NamedTuple, Any
+import importlib
+from typing import Any, Dict, List
 
-from src.bidirectional import bp_scaling, scaling, original
-from src.unidirection import bp_uni
-from src.unidirection import bp_uni_improved
-from src.unidirection import bp_uni_improved_zero
-from src.unidirection import uni_original
+import numpy as np
 
+from util.config import RdhConfig
 
-class RdhAlgorithm(NamedTuple):
-    embedder: Any
-    extractor: Any
-    label: str
 
+# Embedder and extractor classes are given as 'module:Class' and imported on first use,
+# so picking one algorithm does not load the others
+class RdhAlgorithm:
+    def __init__(self, embedder: str, extractor: str, label: str):
+        self._embedder_path = embedder
+        self._extractor_path = extractor
+        self._embedder = None
+        self._extractor = None
+        self.label = label
 
-original_algorithm = RdhAlgorithm(original.OriginalEmbedder, original.OriginalExtractor, 'original')
-scaling_algorithm = RdhAlgorithm(scaling.ScalingEmbedder, scaling.ScalingExtractor, 'scaling')
-bp_scaling_algorithm = RdhAlgorithm(bp_scaling.BPScalingEmbedder, bp_scaling.BPScalingExtractor, 'bp_scaling')
-uni_algorithm = RdhAlgorithm(uni_original.UnidirectionEmbedder, uni_original.UnidirectionExtractor, 'unidirection')
-bp_uni_algorithm = RdhAlgorithm(bp_uni.BPUnidirectionEmbedder, bp_uni.BPUnidirectionExtractor, 'bp_unidirection')
+    @staticmethod
+    def _resolve(path: str) -> Any:
+        module_name, class_name = path.split(':')
+        return getattr(importlib.import_module(module_name), class_name)
 
-bp_uni_algorithm_improved = RdhAlgorithm(bp_uni_improved.ImprovedBPUnidirectionEmbedder,
-                                         bp_uni_improved.ImprovedBPUnidirectionExtractor,
-                                         'bp_unidirection_improved')
+    @property
+    def embedder(self) -> Any:
+        if self._embedder is None:
+            self._embedder = self._resolve(self._embedder_path)
+        return self._embedder
 
-bp_uni_algorithm_improved_zero = RdhAlgorithm(bp_uni_improved_zero.BPZeroUnidirectionEmbedder,
-                                              bp_uni_improved_zero.BPZeroUnidirectionExtractor,
-                                              'bp_unidirection_improved_zero')
+    @property
+    def extractor(self) -> Any:
+        if self._extractor is None:
+            self._extractor = self._resolve(self._extractor_path)
+        return self._extractor
 
-vb_scaling_algorithm = RdhAlgorithm(scaling.VariableBitsScalingEmbedder,
-                                    scaling.VariableBitsScalingExtractor,
-                                    'vb_scaling')
+    # Unpacks as (embedder, extractor, label)
+    def __iter__(self):
+        return iter((self.embedder, self.extractor, self.label))
 
-bp_vb_scaling_algorithm = RdhAlgorithm(bp_scaling.BPVariableBitsScalingEmbedder,
-                                       bp_scaling.BPVariableBitsScalingExtractor,
-                                       'bp_vb_scaling')
+    def __repr__(self):
+        return f'RdhAlgorithm({self.label!r})'
 
-vo_scaling_algorithm = RdhAlgorithm(scaling.ValueOrderScalingEmbedder,
-                                    scaling.ValueOrderedScalingExtractor,
-                                    'vo_scaling')
 
-bp_vo_scaling_algorithm = RdhAlgorithm(bp_scaling.BPValueOrderScalingEmbedder,
-                                    bp_scaling.BPValueOrderedScalingExtractor,
-                                    'bp_vo_scaling')
+_REGISTRY: Dict[str, RdhAlgorithm] = {}
 
-nb_original_algorithm = RdhAlgorithm(original.NeighboringBinsEmbedder,
-                                     original.NeighboringBinsExtractor,
-                                     'nb_original')
 
-bp_nb_original_algorithm = RdhAlgorithm(original.BPNeighboringBinsEmbedder,
-                                        original.BPNeighboringBinsExtractor,
-                                        'bp_nb_original')
+def register_algorithm(embedder: str, extractor: str, label: str) -> RdhAlgorithm:
+    if label in _REGISTRY:
+        raise ValueError(f'RDH algorithm already registered: {label}')
+    _REGISTRY[label] = RdhAlgorithm(embedder, extractor, label)
+    return _REGISTRY[label]
 
-nb_vo_original_algorithm = RdhAlgorithm(original.NbVoEmbedder,
-                                        original.NbVoExtractor,
-                                        'nb_vo_original')
 
-bp_nb_vo_original_algorithm = RdhAlgorithm(original.BPNbVoEmbedder,
-                                           original.BPNbVoExtractor,
-                                           'bp_nb_vo_original')
+original_algorithm = register_algorithm('bidirectional.original:OriginalEmbedder',
+                                        'bidirectional.original:OriginalExtractor',
+                                        'original')
+
+scaling_algorithm = register_algorithm('bidirectional.scaling:ScalingEmbedder',
+                                       'bidirectional.scaling:ScalingExtractor',
+                                       'scaling')
+
+bp_scaling_algorithm = register_algorithm('bidirectional.bp_scaling:BPScalingEmbedder',
+                                          'bidirectional.bp_scaling:BPScalingExtractor',
+                                          'bp_scaling')
+
+uni_algorithm = register_algorithm('unidirection.uni_original:UnidirectionEmbedder',
+                                   'unidirection.uni_original:UnidirectionExtractor',
+                                   'unidirection')
+
+bp_uni_algorithm = register_algorithm('unidirection.bp_uni:BPUnidirectionEmbedder',
+                                      'unidirection.bp_uni:BPUnidirectionExtractor',
+                                      'bp_unidirection')
+
+bp_uni_algorithm_improved = register_algorithm('unidirection.bp_uni_improved:ImprovedBPUnidirectionEmbedder',
+                                               'unidirection.bp_uni_improved:ImprovedBPUnidirectionExtractor',
+                                               'bp_unidirection_improved')
+
+bp_uni_algorithm_improved_zero = register_algorithm('unidirection.bp_uni_improved_zero:BPZeroUnidirectionEmbedder',
+                                                    'unidirection.bp_uni_improved_zero:BPZeroUnidirectionExtractor',
+                                                    'bp_unidirection_improved_zero')
+
+vb_scaling_algorithm = register_algorithm('bidirectional.scaling:VariableBitsScalingEmbedder',
+                                          'bidirectional.scaling:VariableBitsScalingExtractor',
+                                          'vb_scaling')
+
+bp_vb_scaling_algorithm = register_algorithm('bidirectional.bp_scaling:BPVariableBitsScalingEmbedder',
+                                             'bidirectional.bp_scaling:BPVariableBitsScalingExtractor',
+                                             'bp_vb_scaling')
+
+vo_scaling_algorithm = register_algorithm('bidirectional.scaling:ValueOrderScalingEmbedder',
+                                          'bidirectional.scaling:ValueOrderedScalingExtractor',
+                                          'vo_scaling')
+
+bp_vo_scaling_algorithm = register_algorithm('bidirectional.bp_scaling:BPValueOrderScalingEmbedder',
+                                             'bidirectional.bp_scaling:BPValueOrderedScalingExtractor',
+                                             'bp_vo_scaling')
+
+nb_original_algorithm = register_algorithm('bidirectional.original:NeighboringBinsEmbedder',
+                                           'bidirectional.original:NeighboringBinsExtractor',
+                                           'nb_original')
+
+bp_nb_original_algorithm = register_algorithm('bidirectional.original:BPNeighboringBinsEmbedder',
+                                              'bidirectional.original:BPNeighboringBinsExtractor',
+                                              'bp_nb_original')
+
+nb_vo_original_algorithm = register_algorithm('bidirectional.original:NbVoEmbedder',
+                                              'bidirectional.original:NbVoExtractor',
+                                              'nb_vo_original')
+
+bp_nb_vo_original_algorithm = register_algorithm('bidirectional.original:BPNbVoEmbedder',
+                                                 'bidirectional.original:BPNbVoExtractor',
+                                                 'bp_nb_vo_original')
+
+multi_peak_algorithm = register_algorithm('bidirectional.multi_peak:MultiPeakEmbedder',
+                                          'bidirectional.multi_peak:MultiPeakExtractor',
+                                          'multi_peak')
+
+ALGORITHMS = list(_REGISTRY.values())
+
+
+def get_algorithm(label: str) -> RdhAlgorithm:
+    try:
+        return _REGISTRY[label]
+    except KeyError:
+        raise KeyError(f'Unknown RDH algorithm: {label}') from None
+
+
+# Capacity planning is the iteration sweep stats.py runs: one embedding per iteration count
+def plan_capacity(algorithm: RdhAlgorithm, cover: np.ndarray, data: bytes, iterations: int,
+                  config: RdhConfig = None) -> List[int]:
+    capacities = []
+    for _, _, pure_embedded_data in algorithm.embedder(cover, data, config=config):
+        capacities.append(pure_embedded_data)
+        if len(capacities) >= iterations:
+            break
+    return capacities
@@ -0,0 +1,2 @@
+from .features import *
+from .model import *
@@ -0,0 +1,43 @@
+import argparse
+
+from recommend.model import DEFAULT_RIDGE, OBJECTIVES, RECOMMENDER_PATH, TRAINING_ROOTS, Recommender, \
+    collect_samples, evaluate_recommender, train_recommender
+from results.store import STORE_PATH, ResultsStore
+from util.util import read_image
+
+parser = argparse.ArgumentParser(prog='recommend', description='Pick RDH algorithms from cover histogram features.')
+parser.add_argument('--model', default=RECOMMENDER_PATH, help='Recommender JSON.')
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+train_parser = subparsers.add_parser('train', help='Retrain the recommender from stored runs.')
+train_parser.add_argument('--roots', nargs='+', default=TRAINING_ROOTS, help='Directories of run JSON files.')
+train_parser.add_argument('--store', nargs='?', const=STORE_PATH, help='Also train on a results store.')
+train_parser.add_argument('--ridge', type=float, default=DEFAULT_RIDGE)
+train_parser.add_argument('--top', type=int, default=3, help='Candidates checked by the leave-one-out score.')
+train_parser.add_argument('--objective', choices=list(OBJECTIVES), default='ratio')
+
+rank_parser = subparsers.add_parser('rank', help='Rank the algorithms for covers.')
+rank_parser.add_argument('images', nargs='+')
+rank_parser.add_argument('--top', type=int, help='Only the best candidates (default: all).')
+rank_parser.add_argument('--objective', choices=list(OBJECTIVES), default='ratio')
+
+args = parser.parse_args()
+
+if args.command == 'train':
+    samples = collect_samples(args.roots, ResultsStore(args.store) if args.store else None)
+    recommender = train_recommender(samples, args.ridge)
+    for model in recommender.models:
+        print(f'{model.label:<30} {model.samples:>4} covers')
+    hits, covers = evaluate_recommender(samples, args.top, args.objective, args.ridge)
+    if covers:
+        print(f'leave-one-out: best {args.objective} in the top {args.top} for {hits} of {covers} covers')
+    print(f'recommender written to {recommender.save(args.model)}')
+else:
+    recommender = Recommender.load(args.model)
+    for image_path in args.images:
+        cover = read_image(image_path)
+        predictions = recommender.predict(cover)
+        print(image_path)
+        for label in recommender.recommend(cover, args.top or len(predictions), args.objective):
+            print('  ' + f'{label:<30} ' + '  '.join(f'{metric} {value:.4f}'
+                                                   for metric, value in predictions[label].items()))
@@ -0,0 +1,41 @@
+import numpy as np
+
+from util.kernels import HIST_SIZE
+
+__all__ = [
+    'FEATURES',
+    'get_hist_features',
+    'get_features',
+]
+
+FEATURES = ['peak', 'second_peak', 'top_mass', 'zero_bins', 'low_saturation', 'high_saturation',
+            'mean', 'std', 'range']
+TOP_BINS = 8
+
+
+# Cheap descriptors of a cover's histogram, all scaled to about [0, 1]: the two highest bins
+# and the TOP_BINS highest together as fractions of the pixels, the share of empty bins, the
+# pixels at 0 and 255, and the mean, spread and range of the values
+def get_hist_features(hist: np.ndarray) -> np.ndarray:
+    hist = np.asarray(hist, dtype=np.float64)
+    pixels = hist.sum()
+    values = np.arange(HIST_SIZE)
+    used = np.flatnonzero(hist)
+    ordered = np.sort(hist)[::-1] / pixels
+    mean = np.dot(hist, values) / pixels
+    std = np.sqrt(np.dot(hist, (values - mean) ** 2) / pixels)
+    return np.array([
+        ordered[0],
+        ordered[1],
+        ordered[:TOP_BINS].sum(),
+        (HIST_SIZE - used.size) / HIST_SIZE,
+        hist[0] / pixels,
+        hist[-1] / pixels,
+        mean / (HIST_SIZE - 1),
+        std / (HIST_SIZE - 1),
+        (used[-1] - used[0]) / (HIST_SIZE - 1),
+    ])
+
+
+def get_features(cover: np.ndarray) -> np.ndarray:
+    return get_hist_features(np.bincount(np.asarray(cover, dtype=np.uint8).ravel(), minlength=HIST_SIZE))
@@ -0,0 +1,264 @@
+import datetime
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from bench.covers import RES_PATH, get_datasets
+from rdh_algorithm import ALGORITHMS, get_algorithm
+from recommend.features import FEATURES, get_features
+from results.convert import read_run
+from results.store import METRICS, ResultsStore
+from util.config import RdhConfig
+from util.util import is_image, read_image
+from write_data import DATA_PATH, RunStats, dump_json
+
+__all__ = [
+    'RECOMMENDER_PATH',
+    'TRAINING_ROOTS',
+    'OBJECTIVES',
+    'DEFAULT_RIDGE',
+    'Sample',
+    'AlgorithmModel',
+    'Recommender',
+    'get_label',
+    'collect_samples',
+    'train_recommender',
+    'evaluate_recommender',
+]
+
+RECOMMENDER_PATH = f'{DATA_PATH}/recommender.json'
+TRAINING_ROOTS = [DATA_PATH, 'data-analysis/data']
+# +1 when a higher predicted value is better, -1 when a smaller magnitude is; mean is the
+# absolute brightness change, which the regression can predict slightly below zero. std is
+# the embedded image's own spread, not a change from the cover, so it is predicted but no
+# objective.
+OBJECTIVES = {'ratio': 1, 'ssim': 1, 'mean': -1}
+DEFAULT_RIDGE = 1.0
+
+
+# The outcome of one algorithm on one cover: its last iteration's metrics
+@dataclass
+class Sample:
+    label: str
+    cover: str
+    date: str
+    features: np.ndarray
+    outcome: Dict[str, float]
+
+
+# One algorithm's fitted weights per metric: a weight per feature, then the bias
+@dataclass
+class AlgorithmModel:
+    label: str
+    samples: int
+    weights: Dict[str, List[float]] = field(default_factory=dict)
+
+
+# The registered label a run name ends with. stats.py names runs {dataset}_{label}, so the
+# longest label the name ends with wins; names with a config or parameter suffix give None,
+# and so do names whose prefix is not one of datasets when they are given (vo_original).
+def get_label(name: str, datasets: Iterable[str] = None) -> Optional[str]:
+    labels = [algorithm.label for algorithm in ALGORITHMS if name == algorithm.label
+              or name.endswith(f'_{algorithm.label}')
+              and (datasets is None or name[:-len(algorithm.label) - 1] in datasets)]
+    return max(labels, key=len) if labels else None
+
+
+# Runs of other configs were often recorded under the plain algorithm name and told apart only
+# by where they were kept (bp_uni_improved/0Bit.json, 0.1BrightnessThreshold/, Old/usc/), so a
+# run counts as the label's default only in a file named for the label, {name}.json or the
+# history file {name}/{date}.json, at most a dataset directory deep.
+def _is_default_path(hint: str, label: str, datasets: List[str]) -> bool:
+    *directories, name = os.path.splitext(hint)[0].replace(os.sep, '/').split('/')
+    if get_label(name, datasets) != label and directories and get_label(directories[-1], datasets) == label:
+        *directories, name = directories
+    return get_label(name, datasets) == label and len(directories) <= 1
+
+
+# Runs that recorded their parameters count only when those resolve to the label's defaults
+def _is_default_config(run: RunStats, label: str) -> bool:
+    if run.parameters is None:
+        return True
+    embedder = get_algorithm(label).embedder
+    try:
+        return embedder.resolve_config(RdhConfig(**run.parameters)) == embedder.resolve_config()
+    except (TypeError, ValueError):
+        return False
+
+
+# filename -> paths of the covers in res/ with that name
+def _index_covers(res_path: str) -> Dict[str, List[str]]:
+    covers = {}
+    for dataset in get_datasets(res_path):
+        directory_path = os.path.join(res_path, dataset)
+        for filename in sorted(os.listdir(directory_path)):
+            if is_image(os.path.join(directory_path, filename)):
+                covers.setdefault(filename, []).append(os.path.join(directory_path, filename))
+    return covers
+
+
+# A name found in several datasets is resolved by the dataset named in the run's path
+def _find_cover(covers: Dict[str, List[str]], filename: str, hint: str) -> Optional[str]:
+    paths = covers.get(filename, [])
+    if len(paths) > 1:
+        paths = [path for path in paths if os.path.basename(os.path.dirname(path)) in hint] or paths[:0]
+    return paths[0] if len(paths) == 1 else None
+
+
+def _iter_json_runs(roots: Iterable[str]) -> Iterable[Tuple[RunStats, str]]:
+    for root in roots:
+        for directory, directories, filenames in os.walk(root):
+            directories.sort()
+            for filename in sorted(filenames):
+                file_path = os.path.join(directory, filename)
+                if not filename.endswith('.json'):
+                    continue
+                try:
+                    run = read_run(file_path)
+                except (ValueError, KeyError, TypeError):
+                    continue
+                yield run, os.path.relpath(file_path, root)
+
+
+def _iter_store_runs(store: ResultsStore) -> Iterable[Tuple[RunStats, str]]:
+    for entry in store.find(latest=True):
+        yield store.load_run(entry), f'{entry.dataset}/{entry.config}'
+
+
+# Training samples from the run JSON under roots (the latest run files and their history
+# alike) and, if given, the results store. Only the newest outcome of every (label, cover)
+# is kept, and runs of non-default configs and runs whose covers are no longer in res/ are
+# skipped.
+def collect_samples(roots: Iterable[str] = None, store: ResultsStore = None,
+                    res_path: str = RES_PATH) -> List[Sample]:
+    roots = TRAINING_ROOTS if roots is None else roots
+    covers = _index_covers(res_path)
+    datasets = get_datasets(res_path)
+    runs = list(_iter_json_runs(root for root in roots if os.path.isdir(root)))
+    if store is not None:
+        runs.extend(_iter_store_runs(store))
+
+    samples: Dict[Tuple[str, str], Sample] = {}
+    features = {}
+    for run, hint in runs:
+        label = get_label(run.algorithm, datasets) \
+            or get_label(os.path.splitext(hint)[0].replace(os.sep, '_'), datasets)
+        if label is None or not _is_default_path(hint, label, datasets) or not _is_default_config(run, label):
+            continue
+        date = str(run.date)
+        for image in run.images:
+            cover = _find_cover(covers, image.filename, f'{hint}/{run.algorithm}')
+            if cover is None or not image.ratio:
+                continue
+            key = label, cover
+            if key in samples and samples[key].date >= date:
+                continue
+            if cover not in features:
+                features[cover] = get_features(read_image(cover))
+            samples[key] = Sample(label, cover, date, features[cover],
+                                  {metric: float(getattr(image, metric)[-1]) for metric in METRICS})
+    return list(samples.values())
+
+
+# Predicts every metric of every algorithm from the cover features with a ridge regression
+# per (algorithm, metric) on standardised features; the bias is not penalised
+@dataclass
+class Recommender:
+    ridge: float
+    feature_mean: List[float]
+    feature_scale: List[float]
+    models: List[AlgorithmModel] = field(default_factory=list)
+    features: List[str] = field(default_factory=lambda: list(FEATURES))
+    date: Optional[datetime.date] = field(default_factory=datetime.datetime.utcnow)
+
+    @property
+    def labels(self) -> List[str]:
+        return [model.label for model in self.models]
+
+    def _design(self, features: np.ndarray) -> np.ndarray:
+        standardised = (np.atleast_2d(features) - self.feature_mean) / self.feature_scale
+        return np.hstack([standardised, np.ones((len(standardised), 1))])
+
+    def predict_features(self, features: np.ndarray) -> Dict[str, Dict[str, float]]:
+        design = self._design(features)[0]
+        return {model.label: {metric: float(np.dot(design, weights)) for metric, weights in model.weights.items()}
+                for model in self.models}
+
+    # label -> metric -> predicted value at the last iteration
+    def predict(self, cover: np.ndarray) -> Dict[str, Dict[str, float]]:
+        return self.predict_features(get_features(cover))
+
+    def rank_features(self, features: np.ndarray, objective: str = 'ratio') -> List[str]:
+        sign = OBJECTIVES[objective]
+        predictions = self.predict_features(features)
+        scores = {label: predicted[objective] if sign > 0 else -abs(predicted[objective])
+                  for label, predicted in predictions.items()}
+        return sorted(scores, key=lambda label: -scores[label])
+
+    # The top labels by predicted objective, best first
+    def recommend(self, cover: np.ndarray, top: int = 3, objective: str = 'ratio') -> List[str]:
+        return self.rank_features(get_features(cover), objective)[:top]
+
+    def save(self, file_path: str = RECOMMENDER_PATH) -> str:
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        dump_json(self, file_path)
+        return file_path
+
+    @classmethod
+    def load(cls, file_path: str = RECOMMENDER_PATH) -> 'Recommender':
+        with open(file_path, encoding='utf-8') as model_file:
+            data = json.load(model_file)
+        if data['features'] != FEATURES:
+            raise ValueError(f'{file_path} was trained on other features, retrain it')
+        data['models'] = [AlgorithmModel(**model) for model in data['models']]
+        return cls(**data)
+
+
+def train_recommender(samples: List[Sample], ridge: float = DEFAULT_RIDGE) -> Recommender:
+    if not samples:
+        raise ValueError('no training samples')
+    all_features = np.array([sample.features for sample in samples])
+    scale = all_features.std(axis=0)
+    recommender = Recommender(ridge, all_features.mean(axis=0).tolist(),
+                              np.where(scale > 0, scale, 1).tolist())
+
+    penalty = ridge * np.eye(len(FEATURES) + 1)
+    penalty[-1, -1] = 0
+    for label in sorted({sample.label for sample in samples}):
+        group = [sample for sample in samples if sample.label == label]
+        design = recommender._design(np.array([sample.features for sample in group]))
+        model = AlgorithmModel(label, len(group))
+        for metric in METRICS:
+            outcome = np.array([sample.outcome[metric] for sample in group])
+            weights = np.linalg.solve(design.T @ design + penalty, design.T @ outcome)
+            model.weights[metric] = weights.tolist()
+        recommender.models.append(model)
+    return recommender
+
+
+# Leave-one-cover-out: for every cover run with at least two algorithms, trains on the other
+# covers and checks whether the algorithm that did best on it is among the top predictions.
+# Returns (hits, covers).
+def evaluate_recommender(samples: List[Sample], top: int = 3, objective: str = 'ratio',
+                         ridge: float = DEFAULT_RIDGE) -> Tuple[int, int]:
+    sign = OBJECTIVES[objective]
+    hits = total = 0
+    for cover in sorted({sample.cover for sample in samples}):
+        tested = [sample for sample in samples if sample.cover == cover]
+        training = [sample for sample in samples if sample.cover != cover]
+        if len(tested) < 2 or not training:
+            continue
+        recommender = train_recommender(training, ridge)
+        tested = [sample for sample in tested if sample.label in recommender.labels]
+        if len(tested) < 2:
+            continue
+        best = max(tested, key=lambda sample: sample.outcome[objective] if sign > 0
+                   else -abs(sample.outcome[objective])).label
+        ranked = [label for label in recommender.rank_features(tested[0].features, objective)
+                  if label in {sample.label for sample in tested}]
+        hits += best in ranked[:top]
+        total += 1
+    return hits, total
@@ -0,0 +1,2 @@
+from .store import *
+from .convert import *
@@ -0,0 +1,68 @@
+import argparse
+
+import numpy as np
+
+from results.convert import export_csv, export_json_tree, import_json_tree
+from results.store import METRICS, STORE_PATH, ResultsStore
+
+parser = argparse.ArgumentParser(prog='results', description='Columnar store of run results.')
+parser.add_argument('--store', default=STORE_PATH, help='Store directory.')
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+import_parser = subparsers.add_parser('import', help='Import a tree of run JSON files.')
+import_parser.add_argument('root')
+import_parser.add_argument('--dataset', help='Dataset of every file (default: first directory under root).')
+
+
+def add_filters(command_parser):
+    command_parser.add_argument('--dataset', nargs='+')
+    command_parser.add_argument('--algorithm', nargs='+')
+    command_parser.add_argument('--config', nargs='+')
+    command_parser.add_argument('--latest', action='store_true', help='Only the newest run per key.')
+
+
+list_parser = subparsers.add_parser('list', help='List the indexed runs.')
+add_filters(list_parser)
+
+query_parser = subparsers.add_parser('query', help='Summarise the matching rows.')
+add_filters(query_parser)
+query_parser.add_argument('--image', nargs='+')
+query_parser.add_argument('--iterations', nargs=2, type=int, metavar=('FIRST', 'LAST'))
+
+json_parser = subparsers.add_parser('export-json', help='Write runs back as {dataset}/{config}.json.')
+json_parser.add_argument('root')
+add_filters(json_parser)
+
+csv_parser = subparsers.add_parser('export-csv', help='Write rows as CSV with the columns main.R uses.')
+csv_parser.add_argument('file')
+add_filters(csv_parser)
+csv_parser.add_argument('--image', nargs='+')
+
+subparsers.add_parser('compact', help='Merge all shards into one.')
+
+args = parser.parse_args()
+store = ResultsStore(args.store)
+
+if args.command == 'import':
+    entries = import_json_tree(args.root, store, args.dataset)
+    print(f'imported {len(entries)} runs, {sum(entry.stop - entry.start for entry in entries)} rows')
+elif args.command == 'list':
+    for entry in store.find(args.dataset, args.algorithm, args.config, args.latest):
+        print(f'{entry.dataset:<20} {entry.config:<50} {entry.algorithm:<30} {entry.date} '
+              f'{len(entry.images)} images {entry.stop - entry.start} rows')
+elif args.command == 'query':
+    columns = store.query(args.dataset, args.algorithm, args.config, args.image, args.iterations, args.latest)
+    print(f'{len(columns["iteration"])} rows')
+    if len(columns['iteration']):
+        for metric in METRICS:
+            values = columns[metric]
+            print(f'{metric:<6} mean {np.mean(values):.6f} min {np.min(values):.6f} max {np.max(values):.6f}')
+elif args.command == 'export-json':
+    paths = export_json_tree(store, args.root, args.dataset, args.algorithm, args.config, True)
+    print(f'wrote {len(paths)} files')
+elif args.command == 'export-csv':
+    rows = export_csv(store, args.file, args.dataset, args.algorithm, args.config, args.image, args.latest)
+    print(f'wrote {rows} rows')
+else:
+    store.compact()
+    print(f'compacted {len(store.entries)} runs')
@@ -0,0 +1,80 @@
+import csv
+import json
+import os
+from typing import List
+
+from results.store import Filter, METRICS, ResultsStore, RunEntry
+from write_data import ImageStats, RunStats, dump_json
+
+__all__ = [
+    'read_run',
+    'import_json_tree',
+    'export_json_tree',
+    'export_csv',
+]
+
+# Column names of the data frame data-analysis/main.R builds from the JSON files
+CSV_COLUMNS = ['dataset', 'config', 'algorithm', 'filename', 'date', 'iteration',
+               'mean_difference', 'STD', 'SSIM', 'rate']
+
+
+def read_run(file_path: str) -> RunStats:
+    with open(file_path, encoding='utf-8') as data_file:
+        data = json.load(data_file)
+    return RunStats(data['algorithm'], data['date'], [ImageStats(**image) for image in data['images']],
+                    data.get('parameters'))
+
+
+def _is_run_file(file_path: str) -> bool:
+    try:
+        with open(file_path, encoding='utf-8') as data_file:
+            data = json.load(data_file)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and 'algorithm' in data and 'images' in data
+
+
+# Imports every run JSON under root into one shard. The first directory below root is
+# the dataset and the rest of the path, without .json, the config: for example
+# research/bp_uni_improved/2Bit.json -> ('research', 'bp_uni_improved/2Bit').
+# With dataset given, the whole relative path is the config.
+def import_json_tree(root: str, store: ResultsStore, dataset: str = None) -> List[RunEntry]:
+    runs = []
+    for directory, directories, filenames in os.walk(root):
+        directories.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(directory, filename)
+            if not filename.endswith('.json') or not _is_run_file(file_path):
+                continue
+            parts = os.path.splitext(os.path.relpath(file_path, root))[0].split(os.sep)
+            if dataset is not None:
+                run_dataset, config = dataset, '/'.join(parts)
+            elif len(parts) > 1:
+                run_dataset, config = parts[0], '/'.join(parts[1:])
+            else:
+                run_dataset, config = '', parts[0]
+            runs.append((read_run(file_path), run_dataset, config))
+    return store.append_many(runs)
+
+
+# Writes the matching runs back as {root}/{dataset}/{config}.json, in the write_data format
+def export_json_tree(store: ResultsStore, root: str, dataset: Filter = None, algorithm: Filter = None,
+                     config: Filter = None, latest: bool = True) -> List[str]:
+    paths = []
+    for entry in store.find(dataset, algorithm, config, latest):
+        file_path = os.path.join(root, entry.dataset, f'{entry.config}.json')
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        dump_json(store.load_run(entry), file_path)
+        paths.append(file_path)
+    return paths
+
+
+def export_csv(store: ResultsStore, file_path: str, dataset: Filter = None, algorithm: Filter = None,
+               config: Filter = None, image: Filter = None, latest: bool = False) -> int:
+    columns = store.query(dataset, algorithm, config, image, latest=latest)
+    names = ['dataset', 'config', 'algorithm', 'image', 'date', 'iteration'] + METRICS
+    with open(file_path, mode='w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(zip(*(columns[name].tolist() for name in names)))
+    return len(columns['iteration'])
@@ -0,0 +1,186 @@
+import datetime
+import json
+import os
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from write_data import DATA_PATH, ImageStats, RunStats
+
+__all__ = [
+    'STORE_PATH',
+    'METRICS',
+    'RunEntry',
+    'ResultsStore',
+]
+
+STORE_PATH = f'{DATA_PATH}/store'
+INDEX_FILE = 'index.json'
+METRICS = ['mean', 'std', 'ssim', 'ratio']
+
+Filter = Optional[Union[str, Iterable[str]]]
+
+
+# One run (a RunStats) in the index: its key, and the rows it occupies in its shard
+@dataclass
+class RunEntry:
+    dataset: str
+    algorithm: str
+    config: str
+    date: str
+    shard: str
+    start: int
+    stop: int
+    images: List[Tuple[str, int, int]] = field(default_factory=list)  # (filename, iterations, rows), in run order
+    parameters: Optional[Dict[str, Any]] = None
+
+    def key(self) -> tuple:
+        return self.dataset, self.algorithm, self.config
+
+
+def _matches(value: str, accepted: Filter) -> bool:
+    if accepted is None:
+        return True
+    if isinstance(accepted, str):
+        return value == accepted
+    return value in accepted
+
+
+def _to_date(date: Union[str, datetime.date]) -> str:
+    return date.isoformat() if isinstance(date, datetime.date) else str(date)
+
+
+# Columnar store of per-iteration image stats.
+# Rows live in .npz shards (one column per metric, plus image and iteration), and
+# index.json maps every run, keyed by (dataset, algorithm, config), to its shard and
+# row range. Queries read the index, then load only the shards holding matching runs.
+class ResultsStore:
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._index_path = os.path.join(path, INDEX_FILE)
+        self._entries: Optional[List[RunEntry]] = None
+
+    @property
+    def entries(self) -> List[RunEntry]:
+        if self._entries is None:
+            if os.path.isfile(self._index_path):
+                with open(self._index_path, encoding='utf-8') as index_file:
+                    self._entries = [RunEntry(**entry) for entry in json.load(index_file)]
+            else:
+                self._entries = []
+        return self._entries
+
+    def _write_index(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        temporary_path = f'{self._index_path}.tmp'
+        with open(temporary_path, mode='w', encoding='utf-8') as index_file:
+            json.dump([asdict(entry) for entry in self.entries], index_file)
+        os.replace(temporary_path, self._index_path)
+
+    # Writes all the runs into one new shard; each item is (run, dataset, config)
+    def append_many(self, runs: Iterable[Tuple[RunStats, str, str]]) -> List[RunEntry]:
+        shard = f'{uuid.uuid4().hex}.npz'
+        entries = []
+        filenames = {}
+        columns = {name: [] for name in ['image', 'iteration'] + METRICS}
+        rows = 0
+        for run, dataset, config in runs:
+            entry = RunEntry(dataset, run.algorithm, config if config is not None else run.algorithm,
+                             _to_date(run.date), shard, rows, rows, parameters=run.parameters)
+            for image in run.images:
+                image = image if isinstance(image, ImageStats) else ImageStats(**image)
+                code = filenames.setdefault(image.filename, len(filenames))
+                image_rows = len(image.ratio)
+                entry.images.append((image.filename, image.iterations, image_rows))
+                columns['image'].append(np.full(image_rows, code, dtype=np.int32))
+                columns['iteration'].append(np.arange(1, image_rows + 1, dtype=np.int32))
+                for metric in METRICS:
+                    columns[metric].append(np.asarray(getattr(image, metric), dtype=np.float64))
+                rows += image_rows
+            entry.stop = rows
+            entries.append(entry)
+        if not entries:
+            return entries
+
+        os.makedirs(self.path, exist_ok=True)
+        arrays = {name: np.concatenate(values) if values else np.empty((0,), dtype=np.float64 if name in METRICS
+                                                                          else np.int32)
+                  for name, values in columns.items()}
+        np.savez(os.path.join(self.path, shard), filenames=np.array(list(filenames), dtype=str), **arrays)
+        self.entries.extend(entries)
+        self._write_index()
+        return entries
+
+    def append(self, run: RunStats, dataset: str, config: str = None) -> RunEntry:
+        return self.append_many([(run, dataset, config)])[0]
+
+    def find(self, dataset: Filter = None, algorithm: Filter = None, config: Filter = None,
+             latest: bool = False) -> List[RunEntry]:
+        entries = [entry for entry in self.entries
+                   if _matches(entry.dataset, dataset) and _matches(entry.algorithm, algorithm)
+                   and _matches(entry.config, config)]
+        if latest:
+            newest = {}
+            for entry in entries:
+                if entry.key() not in newest or entry.date >= newest[entry.key()].date:
+                    newest[entry.key()] = entry
+            entries = [entry for entry in entries if newest[entry.key()] is entry]
+        return entries
+
+    def _load_shard(self, shard: str) -> Dict[str, np.ndarray]:
+        with np.load(os.path.join(self.path, shard)) as data:
+            return {name: data[name] for name in data.files}
+
+    # Rows of the matching runs as columns: dataset, algorithm, config, date, image,
+    # iteration and the metrics. iterations is an iteration number or a (first, last) range.
+    def query(self, dataset: Filter = None, algorithm: Filter = None, config: Filter = None, image: Filter = None,
+              iterations: Union[int, Tuple[int, int]] = None, latest: bool = False) -> Dict[str, np.ndarray]:
+        entries = self.find(dataset, algorithm, config, latest)
+        parts = {name: [] for name in ['dataset', 'algorithm', 'config', 'date', 'image', 'iteration'] + METRICS}
+
+        shards = {}
+        for entry in entries:
+            if entry.shard not in shards:
+                shards[entry.shard] = self._load_shard(entry.shard)
+            data = shards[entry.shard]
+            rows = slice(entry.start, entry.stop)
+            images = data['filenames'][data['image'][rows]]
+            selected = np.ones(entry.stop - entry.start, dtype=bool)
+            if image is not None:
+                selected &= np.isin(images, [image] if isinstance(image, str) else list(image))
+            if iterations is not None:
+                first, last = (iterations, iterations) if np.isscalar(iterations) else iterations
+                selected &= (data['iteration'][rows] >= first) & (data['iteration'][rows] <= last)
+
+            count = np.count_nonzero(selected)
+            for name in ['dataset', 'algorithm', 'config', 'date']:
+                parts[name].append(np.full(count, getattr(entry, name), dtype=object))
+            parts['image'].append(images[selected].astype(object))
+            for name in ['iteration'] + METRICS:
+                parts[name].append(data[name][rows][selected])
+
+        return {name: np.concatenate(values) if values else np.empty((0,)) for name, values in parts.items()}
+
+    def load_run(self, entry: RunEntry) -> RunStats:
+        data = self._load_shard(entry.shard)
+        run = RunStats(entry.algorithm, entry.date, parameters=entry.parameters)
+        row = entry.start
+        for filename, iterations, rows in entry.images:
+            image_stats = ImageStats(filename, iterations)
+            for metric in METRICS:
+                setattr(image_stats, metric, data[metric][row:row + rows].tolist())
+            run.append_image_stats(image_stats)
+            row += rows
+        return run
+
+    # Rewrites every run into a single shard, dropping the per-run shard files
+    def compact(self) -> None:
+        old_shards = {entry.shard for entry in self.entries}
+        runs = [(self.load_run(entry), entry.dataset, entry.config) for entry in self.entries]
+        self._entries = []
+        self.append_many(runs)
+        self._write_index()
+        for shard in old_shards:
+            os.remove(os.path.join(self.path, shard))
@@ -0,0 +1,3 @@
+from .cache import *
+from .client import *
+from .server import *
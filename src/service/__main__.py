@@ -0,0 +1,27 @@
+import argparse
+import asyncio
+
+from service.server import RdhService
+
+parser = argparse.ArgumentParser(prog='service', description='Serve embed/extract/plan requests over HTTP.')
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8765)
+parser.add_argument('--unix', help='Listen on a Unix socket instead of TCP.')
+parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count).')
+parser.add_argument('--max-pending', type=int, default=16, help='Requests queued or running at once.')
+parser.add_argument('--queue-timeout', type=float, default=5.0, help='Seconds to wait for a slot before 503.')
+parser.add_argument('--cache-size', type=int, default=32, help='Covers kept per worker.')
+args = parser.parse_args()
+
+
+async def main():
+    service = RdhService(args.workers, args.max_pending, args.queue_timeout, args.cache_size)
+    await service.start(args.host, args.port, args.unix)
+    print(f'listening on {service.address}')
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+asyncio.run(main())
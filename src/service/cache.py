@@ -0,0 +1,34 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+__all__ = [
+    'LruCache',
+]
+
+
+class LruCache:
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+        self.misses += 1
+        value = factory()
+        if self.capacity > 0:
+            self._items[key] = value
+            if len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        self._items.clear()
@@ -0,0 +1,108 @@
+import asyncio
+import base64
+import json
+
+import numpy as np
+
+from util.util import decode_image, encode_image
+
+__all__ = [
+    'RdhClient',
+    'ServiceError',
+]
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, response: dict):
+        super().__init__(f'{status}: {response.get("error")}')
+        self.status = status
+        self.response = response
+
+
+class RdhClient:
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, unix_path: str = None):
+        self._host = host
+        self._port = port
+        self._unix_path = unix_path
+        self._reader = None
+        self._writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def connect(self):
+        if self._unix_path:
+            self._reader, self._writer = await asyncio.open_unix_connection(self._unix_path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+
+    async def request(self, method: str, path: str, payload: dict = None) -> dict:
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self._writer.write(f'{method} {path} HTTP/1.1\r\n'
+                           f'Host: {self._host}\r\n'
+                           f'Content-Type: application/json\r\n'
+                           f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+        await self._writer.drain()
+
+        status = int((await self._reader.readline()).split()[1])
+        content_length = 0
+        while True:
+            line = (await self._reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                content_length = int(value)
+        response = json.loads(await self._reader.readexactly(content_length))
+        if status != 200:
+            raise ServiceError(status, response)
+        return response
+
+    async def embed(self, algorithm: str, cover: np.ndarray, data: bytes, iterations: int,
+                    parameters: dict = None) -> dict:
+        response = await self.request('POST', '/embed', {
+            'algorithm': algorithm,
+            'image': base64.b64encode(encode_image(cover)).decode('ascii'),
+            'data': base64.b64encode(data).decode('ascii'),
+            'iterations': iterations,
+            'parameters': parameters or {},
+        })
+        response['image'] = decode_image(base64.b64decode(response['image']))
+        return response
+
+    async def extract(self, algorithm: str, embedded_image: np.ndarray, mode: str = 'both',
+                      parameters: dict = None) -> dict:
+        response = await self.request('POST', '/extract', {
+            'algorithm': algorithm,
+            'image': base64.b64encode(encode_image(embedded_image)).decode('ascii'),
+            'mode': mode,
+            'parameters': parameters or {},
+        })
+        if 'image' in response:
+            response['image'] = decode_image(base64.b64decode(response['image']))
+        if 'data' in response:
+            response['data'] = base64.b64decode(response['data'])
+        return response
+
+    async def plan(self, algorithm: str, cover: np.ndarray, data: bytes, iterations: int,
+                   parameters: dict = None) -> dict:
+        return await self.request('POST', '/plan', {
+            'algorithm': algorithm,
+            'image': base64.b64encode(encode_image(cover)).decode('ascii'),
+            'data': base64.b64encode(data).decode('ascii'),
+            'iterations': iterations,
+            'parameters': parameters or {},
+        })
+
+    async def health(self) -> dict:
+        return await self.request('GET', '/health')
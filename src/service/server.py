@@ -0,0 +1,161 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from service.worker import OPERATIONS, init_worker, run_request
+
+__all__ = [
+    'RdhService',
+]
+
+MAX_BODY_SIZE = 512 * 2 ** 20
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class RdhService:
+    def __init__(self, workers: int = None, max_pending: int = 16, queue_timeout: float = 5.0,
+                 cache_size: int = 32):
+        self._workers = workers
+        self._max_pending = max_pending
+        self._queue_timeout = queue_timeout
+        self._cache_size = cache_size
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = {}
+        self.pending = 0
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765, unix_path: str = None):
+        self._pool = ProcessPoolExecutor(self._workers, initializer=init_worker, initargs=(self._cache_size,))
+        self._slots = asyncio.Semaphore(self._max_pending)
+        if unix_path:
+            self._server = await asyncio.start_unix_server(self._handle_connection, unix_path)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = await self._read_headers(reader)
+                content_length = int(headers.get('content-length', 0))
+                if content_length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {'error': 'request body too large'})
+                    break
+                body = await reader.readexactly(content_length)
+
+                status, response = await self._dispatch(method, path, body)
+                await self._respond(writer, status, response)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> dict:
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                return headers
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, response: dict):
+        body = json.dumps(response).encode('utf-8')
+        writer.write(f'HTTP/1.1 {status} {_REASONS[status]}\r\n'
+                     f'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> (int, dict):
+        operation = path.strip('/')
+        if method == 'GET' and operation == 'health':
+            return 200, {'pending': self.pending, 'max_pending': self._max_pending}
+        if operation not in OPERATIONS:
+            return 404, {'error': f'unknown operation: {operation}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, {'error': 'request body is not valid JSON'}
+
+        return await self.submit(operation, request)
+
+    # At most max_pending requests are queued or running; the rest wait up to
+    # queue_timeout for a slot and are then turned away with 503
+    async def submit(self, operation: str, request: dict) -> (int, dict):
+        received_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self._queue_timeout)
+        except asyncio.TimeoutError:
+            return 503, {'error': 'queue is full, retry later'}
+
+        self.pending += 1
+        queued_time = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self._pool, run_request, operation, request)
+            status = 200
+        except KeyError as error:
+            status, response = 400, {'error': f'missing or unknown field: {error}'}
+        # bad base64, an undecodable image or parameters the embedder rejects, such as
+        # too many iterations
+        except ValueError as error:
+            status, response = 400, {'error': f'{type(error).__name__}: {error}'}
+        except Exception as error:
+            status, response = 500, {'error': f'{type(error).__name__}: {error}'}
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+        done_time = time.perf_counter()
+        worker = response.pop('worker', {})
+        response['timing'] = {
+            'wait_ms': 1000 * (queued_time - received_time),
+            'compute_ms': worker.get('compute_ms'),
+            'total_ms': 1000 * (done_time - received_time),
+            'cover_cached': worker.get('cover_cached'),
+            'worker_pid': worker.get('pid'),
+        }
+        return status, response
@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from rdh_algorithm import get_algorithm, plan_capacity
+from service.cache import LruCache
+from util.config import RdhConfig, get_config
+from util.util import decode_image, encode_image
+
+__all__ = [
+    'OPERATIONS',
+    'init_worker',
+    'run_request',
+]
+
+OPERATIONS = ['embed', 'extract', 'plan']
+
+# One cache per worker process, filled by init_worker
+_covers = LruCache()
+_payloads = LruCache()
+
+
+def init_worker(cache_size: int) -> None:
+    global _covers, _payloads
+    _covers = LruCache(cache_size)
+    _payloads = LruCache(cache_size)
+
+
+def _digest(encoded: str) -> str:
+    return hashlib.sha1(encoded.encode('ascii')).hexdigest()
+
+
+# Bad base64 already raises ValueError; an image that does not decode does too, so the
+# server can tell client errors from its own
+def _decode_cover(encoded_image: str) -> np.ndarray:
+    try:
+        return decode_image(base64.b64decode(encoded_image))
+    except OSError as error:
+        raise ValueError(f'image cannot be decoded: {error}') from None
+
+
+# Covers are read-only in the cache; the embedders get a copy
+def _get_cover(encoded_image: str) -> np.ndarray:
+    cover = _covers.get(_digest(encoded_image), lambda: _decode_cover(encoded_image))
+    cover.setflags(write=False)
+    return cover
+
+
+def _get_payload(encoded_data: str) -> bytes:
+    return _payloads.get(_digest(encoded_data), lambda: base64.b64decode(encoded_data))
+
+
+# The optional parameters of a request, RdhConfig fields for the embedder or extractor
+def _get_config(request: dict) -> RdhConfig:
+    return get_config(request.get('parameters'))
+
+
+def _embed(request: dict) -> dict:
+    algorithm = get_algorithm(request['algorithm'])
+    cover = _get_cover(request['image'])
+    embedded_image, iterations, pure_embedded_data = algorithm.embedder(
+        cover, _get_payload(request['data']), config=_get_config(request)).embed(int(request['iterations']))
+    return {
+        'image': base64.b64encode(encode_image(embedded_image)).decode('ascii'),
+        'iterations': int(iterations),
+        'capacity': int(pure_embedded_data),
+    }
+
+
+def _extract(request: dict) -> dict:
+    algorithm = get_algorithm(request['algorithm'])
+    embedded_image = _get_cover(request['image'])
+    recovered_image, iterations, hidden_data = algorithm.extractor(config=_get_config(request)).extract(
+        embedded_image, mode=request.get('mode', 'both'))
+    response = {'iterations': int(iterations)}
+    if recovered_image is not None:
+        response['image'] = base64.b64encode(encode_image(recovered_image)).decode('ascii')
+    if hidden_data is not None:
+        response['data'] = base64.b64encode(hidden_data).decode('ascii')
+    return response
+
+
+def _plan(request: dict) -> dict:
+    algorithm = get_algorithm(request['algorithm'])
+    cover = _get_cover(request['image'])
+    capacities = plan_capacity(algorithm, cover, _get_payload(request['data']), int(request['iterations']),
+                               _get_config(request))
+    return {
+        'iterations': len(capacities),
+        'capacities': [int(capacity) for capacity in capacities],
+    }
+
+
+_HANDLERS = {
+    'embed': _embed,
+    'extract': _extract,
+    'plan': _plan,
+}
+
+
+def run_request(operation: str, request: dict) -> dict:
+    start_time = time.perf_counter()
+    cache_hits = _covers.hits
+    response = _HANDLERS[operation](request)
+    response['worker'] = {
+        'pid': os.getpid(),
+        'compute_ms': 1000 * (time.perf_counter() - start_time),
+        'cover_cached': _covers.hits > cache_hits,
+    }
+    return response
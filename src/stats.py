@@ -1,28 +1,32 @@
 import traceback
+from dataclasses import asdict
 from os.path import join as join_path
 
 import cv2
 
 from rdh_algorithm import *
+from recommend.model import Recommender
+from results.store import ResultsStore
+from util.config import RdhConfig, get_parameters_suffix
 from util.measure import Measure
+from util.profiler import profiler
+from util.telemetry import JsonlTrace
 from util.util import *
-from write_data import RunStats, ImageStats, write_data
+from write_data import DATA_PATH, RunStats, ImageStats, write_data
 
 SAVE_IMAGES = True
+PROFILE = False  # record per-phase timings into the run JSON and write a Chrome trace per image
+PROFILE_MEMORY = False  # also record tracemalloc peak/current bytes per phase and iteration (slow)
+TRACES_PATH = f'{DATA_PATH}/traces'
+TELEMETRY = False  # write every embedder/extractor iteration record to a JSONL file per run
+TELEMETRY_PATH = f'{DATA_PATH}/telemetry'
+RECOMMEND_TOP = None  # run only the algorithms the recommender ranks in the top RECOMMEND_TOP per image
+RECOMMEND_OBJECTIVE = 'ratio'
+PARAMETERS = {}  # RdhConfig fields to run with instead of the family defaults, e.g. {'placement_bits': 2}
 DATA_SET = "custom"
 IMAGES_PATH = f'res/{DATA_SET}/'
 original_images = []  # path relative to ORIGINAL_IMAGES_PATH
 
-# if list is empty, find all images in ORIGINAL_IMAGES_PATH
-if not original_images:
-    for f in os.listdir(IMAGES_PATH):
-        joined_path = join_path(IMAGES_PATH, f)
-        if is_image(joined_path):
-            original_images.append(f)
-
-# read all images and pair them with their filenames
-original_images = [(image, read_image(join_path(IMAGES_PATH, image))) for image in original_images]
-
 RDH_ALGORITHMS = [
     uni_algorithm
     # bp_uni_algorithm,
@@ -38,61 +42,114 @@ RDH_ALGORITHMS = [
     # bp_nb_vo_original_algorithm
 ]
 
-np.random.seed(2115)
-data = bits_to_bytes(np.random.randint(0, 2, size=2000 * 2000) > 0)
-
-for rdh_embedder, rdh_extractor, label in RDH_ALGORITHMS:
-    stopwatch = Measure()
-    print('======================')
-    print(label)
-    print('======================')
-    run_stats = RunStats(f'{DATA_SET}_{label}')
-    for filename, original_image in original_images:
-        embedder = rdh_embedder(original_image.copy(), data)
-        extractor = rdh_extractor()
-        iterations_count = 0
-
-        image_stats = ImageStats(filename)
-
-        for embedded_image, iterations_count, _ in embedder:
-            print(f'{iterations_count} iterations:')
-            try:
-                recovered_image, extraction_iterations, extracted_data = Measure(extractor.extract, print_time=True)(
-                    embedded_image)
-                is_successful = \
-                    not np.any(original_image - recovered_image) and \
-                    extraction_iterations == iterations_count
-                correct_recovered_data = extracted_data[:-1] == data[:len(extracted_data) - 1]
-                if not correct_recovered_data:
-                    print('recovered data is incorrect')
+
+# Images are read when the run starts, not when the module is imported
+def load_images():
+    filenames = original_images
+    # if list is empty, find all images in ORIGINAL_IMAGES_PATH
+    if not filenames:
+        filenames = [f for f in os.listdir(IMAGES_PATH) if is_image(join_path(IMAGES_PATH, f))]
+
+    # read all images and pair them with their filenames
+    return [(image, read_image(join_path(IMAGES_PATH, image))) for image in filenames]
+
+
+# Per image, the algorithms the recommender knows but ranks below RECOMMEND_TOP;
+# the ones it has no model for always run
+def get_skipped_algorithms(images):
+    if not RECOMMEND_TOP:
+        return {}
+    recommender = Recommender.load()
+    return {filename: set(recommender.labels) - set(recommender.recommend(image, RECOMMEND_TOP, RECOMMEND_OBJECTIVE))
+            for filename, image in images}
+
+
+def main():
+    images = load_images()
+    skipped = get_skipped_algorithms(images)
+
+    np.random.seed(2115)
+    data = bits_to_bytes(np.random.randint(0, 2, size=2000 * 2000) > 0)
+
+    if PROFILE or PROFILE_MEMORY:
+        profiler.enable(memory=PROFILE_MEMORY)
+        os.makedirs(TRACES_PATH, exist_ok=True)
+    if TELEMETRY:
+        os.makedirs(TELEMETRY_PATH, exist_ok=True)
+
+    config = RdhConfig(**PARAMETERS)
+    suffix = get_parameters_suffix(PARAMETERS)
+    for rdh_embedder, rdh_extractor, label in RDH_ALGORITHMS:
+        stopwatch = Measure()
+        print('======================')
+        print(label + suffix)
+        print('======================')
+        run_stats = RunStats(f'{DATA_SET}_{label}{suffix}', parameters=asdict(rdh_embedder.resolve_config(config)))
+        trace = JsonlTrace(f'{TELEMETRY_PATH}/{run_stats.algorithm}.jsonl', mode='w') if TELEMETRY else None
+        for filename, original_image in images:
+            if label in skipped.get(filename, ()):
+                continue
+            embedder = rdh_embedder(original_image.copy(), data, config=config)
+            extractor = rdh_extractor(config=config)
+            if trace:
+                trace.context['image'] = filename
+                embedder.observe(trace)
+                extractor.observe(trace)
+            iterations_count = 0
+            profiler.reset()
+
+            image_stats = ImageStats(filename)
+
+            for embedded_image, iterations_count, _ in embedder:
+                print(f'{iterations_count} iterations:')
+                try:
+                    recovered_image, extraction_iterations, extracted_data = Measure(
+                        extractor.extract, print_time=True)(embedded_image)
+                    is_successful = \
+                        not np.any(original_image - recovered_image) and \
+                        extraction_iterations == iterations_count
+                    correct_recovered_data = extracted_data[:-1] == data[:len(extracted_data) - 1]
+                    if not correct_recovered_data:
+                        print('recovered data is incorrect')
+                        is_successful = False
+                    hidden_data_size = len(extracted_data) * 8
+                except Exception:
+                    traceback.print_exc()
                     is_successful = False
-                hidden_data_size = len(extracted_data) * 8
-            except Exception:
-                traceback.print_exc()
-                is_successful = False
-                hidden_data_size = 0
-                recovered_image = None
-
-            if is_successful:
-                print(hidden_data_size, 'bits')
-                print(hidden_data_size / 8000, 'kb')
-                print(round(hidden_data_size / original_image.size, 3), 'bit/pixel')
-                mean = np.abs(np.mean(original_image) - np.mean(embedded_image, dtype=np.float64))
-                std = float(np.std(embedded_image, dtype=np.float64))
-                ssim = structural_similarity(original_image, embedded_image)
-                ratio = hidden_data_size / original_image.size
-
-                image_stats.append_iteration(mean, std, ssim, ratio)
-            else:
-                print_error('EXTRACTION FAILED')
-                if recovered_image is not None:
-                    print('PSNR =', cv2.PSNR(original_image, recovered_image))
-                break
-
-            print('total time:', stopwatch)
-            print('----------------------')
-        if SAVE_IMAGES:
-            os.makedirs(f'out/stats/{filename}/', exist_ok=True)
-            cv2.imwrite(f'out/stats/{filename}/{label}.png', embedded_image)
-        run_stats.append_image_stats(image_stats)
-    write_data(run_stats)
+                    hidden_data_size = 0
+                    recovered_image = None
+
+                if is_successful:
+                    print(hidden_data_size, 'bits')
+                    print(hidden_data_size / 8000, 'kb')
+                    print(round(hidden_data_size / original_image.size, 3), 'bit/pixel')
+                    mean = np.abs(np.mean(original_image) - np.mean(embedded_image, dtype=np.float64))
+                    std = float(np.std(embedded_image, dtype=np.float64))
+                    ssim = structural_similarity(original_image, embedded_image)
+                    ratio = hidden_data_size / original_image.size
+
+                    image_stats.append_iteration(mean, std, ssim, ratio)
+                else:
+                    print_error('EXTRACTION FAILED')
+                    if recovered_image is not None:
+                        print('PSNR =', cv2.PSNR(original_image, recovered_image))
+                    break
+
+                print('total time:', stopwatch)
+                print('----------------------')
+            if SAVE_IMAGES:
+                os.makedirs(f'out/stats/{filename}/', exist_ok=True)
+                cv2.imwrite(f'out/stats/{filename}/{label}.png', embedded_image)
+            if profiler.enabled:
+                image_stats.profile = profiler.summary()
+                profiler.to_chrome_trace(f'{TRACES_PATH}/{run_stats.algorithm}_{filename}.json')
+                print(profiler.table())
+            run_stats.append_image_stats(image_stats)
+        if trace:
+            trace.close()
+        write_data(run_stats)
+        ResultsStore().append(run_stats, DATA_SET, label + suffix)
+
+
+if __name__ == '__main__':
+    main()
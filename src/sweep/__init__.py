@@ -0,0 +1,4 @@
+from .jobs import *
+from .queue import *
+from .worker import *
+from .reduce import *
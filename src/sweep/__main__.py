@@ -0,0 +1,87 @@
+import argparse
+import multiprocessing
+
+from results.store import STORE_PATH, ResultsStore
+from sweep.jobs import CONFIGS, SWEEP_ITERATIONS, build_grid, get_parameter_grid
+from sweep.queue import DEFAULT_LEASE, DEFAULT_MAX_ATTEMPTS, WorkQueue
+from sweep.reduce import reduce_queue
+from sweep.worker import DEFAULT_POLL, get_worker_name, run_worker
+from util.config import parse_parameter_value
+
+parser = argparse.ArgumentParser(prog='sweep', description='Run the experiment grid from a shared work queue.')
+parser.add_argument('queue', help='Queue directory, on a filesystem every worker host shares.')
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+init_parser = subparsers.add_parser('init', help='Cut the grid into jobs and queue them.')
+init_parser.add_argument('--datasets', nargs='+', help='Datasets in res/ (default: all).')
+init_parser.add_argument('--algorithms', nargs='+', help='Algorithm labels (default: all).')
+init_parser.add_argument('--iterations', nargs='+', type=int, default=SWEEP_ITERATIONS, help='Iteration limits.')
+init_parser.add_argument('--configs', nargs='+', choices=list(CONFIGS), help='Configuration variants.')
+init_parser.add_argument('--images', type=int, help='Images per dataset (default: all).')
+init_parser.add_argument('--parameters', nargs='+', default=[], metavar='NAME=VALUES',
+                         help='RdhConfig values to sweep, e.g. placement_bits=1,2 exact_candidates=0,8.')
+
+
+def parse_parameters(arguments):
+    values = {}
+    for argument in arguments:
+        name, _, listed = argument.partition('=')
+        values[name] = [parse_parameter_value(value) for value in listed.split(',')]
+    return get_parameter_grid(values)
+
+
+def add_worker_arguments(command_parser):
+    command_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE,
+                                help='Seconds without a heartbeat before a job is requeued.')
+    command_parser.add_argument('--heartbeat', type=float, help='Seconds between heartbeats (default: lease / 4).')
+    command_parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+    command_parser.add_argument('--max-jobs', type=int, help='Jobs per worker before it exits.')
+    command_parser.add_argument('--poll', type=float, default=DEFAULT_POLL)
+    command_parser.add_argument('--quiet', action='store_true')
+
+
+work_parser = subparsers.add_parser('work', help='Claim and run jobs until the queue is finished.')
+add_worker_arguments(work_parser)
+work_parser.add_argument('--name', help='Worker name (default: host-pid).')
+
+local_parser = subparsers.add_parser('local', help='Run several workers on this machine.')
+add_worker_arguments(local_parser)
+local_parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+
+subparsers.add_parser('status', help='Count the jobs in every state and show the failures.')
+
+reduce_parser = subparsers.add_parser('reduce', help='Merge the finished jobs into runs/ and the results store.')
+reduce_parser.add_argument('--store', default=STORE_PATH, help='Results store directory.')
+reduce_parser.add_argument('--no-store', action='store_true', help='Only write the run JSON files.')
+
+args = parser.parse_args()
+queue = WorkQueue(args.queue)
+
+
+def work(name: str = None) -> int:
+    return run_worker(queue, name, args.lease, args.heartbeat, args.max_attempts, args.max_jobs, args.poll,
+                      verbose=not args.quiet)
+
+
+if args.command == 'init':
+    jobs = build_grid(args.datasets, args.algorithms, args.iterations, args.configs, args.images,
+                      parameters=parse_parameters(args.parameters))
+    print(f'queued {queue.create(jobs)} of {len(jobs)} jobs')
+elif args.command == 'work':
+    print(f'{work(args.name or get_worker_name())} jobs completed')
+elif args.command == 'local':
+    workers = [multiprocessing.Process(target=work) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    print(' '.join(f'{state} {count}' for state, count in queue.status().items()))
+elif args.command == 'status':
+    print(' '.join(f'{state} {count}' for state, count in queue.status().items()))
+    for job in queue.failed_jobs():
+        last_line = job.error.strip().splitlines()[-1] if job.error else ''
+        print(f'{job.id} {job.run} {job.image} after {job.attempts} attempts: {last_line}')
+else:
+    runs = reduce_queue(queue, None if args.no_store else ResultsStore(args.store))
+    for run in runs:
+        print(f'{run.algorithm:<50} {len(run.images)} images')
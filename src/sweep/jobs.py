@@ -0,0 +1,143 @@
+import hashlib
+import itertools
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from bench.covers import RES_PATH, get_datasets
+from rdh_algorithm import ALGORITHMS, get_algorithm
+from util.compress import deflate, no_compress, zlib
+from util.config import RdhConfig, get_parameters_suffix
+from util.util import is_image, read_image, structural_similarity
+from write_data import ImageStats
+
+__all__ = [
+    'CONFIGS',
+    'DEFAULT_CONFIG',
+    'SWEEP_ITERATIONS',
+    'Job',
+    'build_grid',
+    'get_parameter_grid',
+    'run_job',
+]
+
+# Configuration variants of the grid: the compression of the embedded side information
+CONFIGS = {
+    'deflate': deflate,
+    'zlib': zlib,
+    'no_compress': no_compress,
+}
+DEFAULT_CONFIG = 'deflate'
+SWEEP_ITERATIONS = [32]
+
+
+# One cover of one run: the algorithm, configuration, RdhConfig parameters and iteration limit
+# it is embedded with. run is the write_data name its ImageStats are reduced into. id is derived
+# from what the job runs, index is its place in the grid it was built in.
+@dataclass
+class Job:
+    id: str
+    index: int
+    run: str
+    dataset: str
+    algorithm: str
+    config: str
+    iterations: int
+    image: str
+    parameters: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+# The runs are named as stats.py names them, {dataset}_{label} and the parameters, with the
+# configuration appended when it is not the default and the iteration limit when the grid has several
+def _get_run_name(dataset: str, label: str, parameters: Dict[str, Any], config: str, iterations: int,
+                  iteration_counts: int) -> str:
+    name = f'{dataset}_{label}{get_parameters_suffix(parameters)}'
+    if config != DEFAULT_CONFIG:
+        name += f'_{config}'
+    if iteration_counts > 1:
+        name += f'_{iterations}'
+    return name
+
+
+# The same job gets the same id in every grid, so queueing a grid again adds only the jobs that
+# are new to the queue
+def _get_job_id(dataset: str, label: str, config: str, parameters: Dict[str, Any], iterations: int,
+                image: str) -> str:
+    key = json.dumps([dataset, label, config, parameters, iterations, image], sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+# Every combination of the values given per RdhConfig field, e.g. {'placement_bits': [1, 2]}
+# -> [{'placement_bits': 1}, {'placement_bits': 2}]
+def get_parameter_grid(values: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    names = sorted(values)
+    return [dict(zip(names, setting)) for setting in itertools.product(*(values[name] for name in names))]
+
+
+def build_grid(datasets: List[str] = None,
+               algorithms: List[str] = None,
+               iterations: List[int] = None,
+               configs: List[str] = None,
+               images: int = None,
+               res_path: str = RES_PATH,
+               parameters: List[Dict[str, Any]] = None) -> List[Job]:
+    datasets = datasets or get_datasets(res_path)
+    algorithms = algorithms or [algorithm.label for algorithm in ALGORITHMS]
+    iterations = iterations or SWEEP_ITERATIONS
+    configs = configs or [DEFAULT_CONFIG]
+    parameters = parameters or [{}]
+    for label in algorithms:
+        get_algorithm(label)
+    for config in configs:
+        if config not in CONFIGS:
+            raise ValueError(f'unknown configuration {config!r}, expected one of {", ".join(CONFIGS)}')
+    for setting in parameters:
+        RdhConfig(**setting)
+
+    jobs = []
+    for dataset in datasets:
+        directory_path = os.path.join(res_path, dataset)
+        filenames = sorted(f for f in os.listdir(directory_path) if is_image(os.path.join(directory_path, f)))
+        for label, setting, config, iteration_limit in itertools.product(algorithms, parameters, configs,
+                                                                         iterations):
+            run = _get_run_name(dataset, label, setting, config, iteration_limit, len(iterations))
+            for filename in filenames[:images]:
+                job_id = _get_job_id(dataset, label, config, setting, iteration_limit, filename)
+                jobs.append(Job(job_id, len(jobs), run, dataset, label, config, iteration_limit, filename, setting))
+    return jobs
+
+
+# The per-iteration loop of stats.py for one cover: embeds one more iteration at a time up
+# to the job's limit, and records the metrics of every iteration that extracts correctly. An
+# extractor that raises ends the cover like a mismatch does, with the exception recorded.
+def run_job(job: Job, data: bytes, res_path: str = RES_PATH) -> ImageStats:
+    algorithm = get_algorithm(job.algorithm)
+    compression = CONFIGS[job.config]
+    config = RdhConfig(**job.parameters)
+    original_image = read_image(os.path.join(res_path, job.dataset, job.image))
+    embedder = algorithm.embedder(original_image.copy(), data, compression=compression, config=config)
+    extractor = algorithm.extractor(compression=compression, config=config)
+
+    image_stats = ImageStats(job.image)
+    for embedded_image, iterations_count, _ in embedder:
+        try:
+            recovered_image, extraction_iterations, extracted_data = extractor.extract(embedded_image)
+        except Exception as exception:
+            image_stats.error = f'extraction of iteration {iterations_count} failed: {exception!r}'
+            break
+        if np.any(original_image - recovered_image) or extraction_iterations != iterations_count \
+                or extracted_data[:-1] != data[:len(extracted_data) - 1]:
+            break
+
+        mean = np.abs(np.mean(original_image) - np.mean(embedded_image, dtype=np.float64))
+        std = float(np.std(embedded_image, dtype=np.float64))
+        ssim = structural_similarity(original_image, embedded_image)
+        image_stats.append_iteration(mean, std, ssim, len(extracted_data) * 8 / original_image.size)
+        if iterations_count >= job.iterations:
+            break
+    return image_stats
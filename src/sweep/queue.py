@@ -0,0 +1,168 @@
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional
+
+from sweep.jobs import Job
+from write_data import default
+
+__all__ = [
+    'DEFAULT_LEASE',
+    'DEFAULT_MAX_ATTEMPTS',
+    'QUEUE_STATES',
+    'Lease',
+    'WorkQueue',
+]
+
+DEFAULT_LEASE = 300.0  # seconds a claimed job may go without a heartbeat
+DEFAULT_MAX_ATTEMPTS = 3
+QUEUE_STATES = ['pending', 'leased', 'done', 'failed']
+TEMPORARY_DIRECTORY = 'tmp'
+RESULTS_DIRECTORY = 'results'
+
+
+# A claimed job and the lease file that holds it
+@dataclass
+class Lease:
+    job: Job
+    path: str
+
+
+# A queue of jobs as files in a directory on a shared filesystem. Every state is a
+# subdirectory and a job changes state by an atomic rename, so whichever worker renames a
+# file first owns the change and the others see it gone:
+#   pending/{id}.json              waiting to be claimed
+#   leased/{id}.{token}.json       claimed; its mtime is the last heartbeat
+#   done/{id}.json, failed/{id}.json
+#   results/{id}.json              the job's ImageStats, written before it is marked done
+# A lease older than the lease timeout is requeued by whichever worker notices it first.
+# The timeout has to be well above the heartbeat interval and the clock skew between hosts.
+class WorkQueue:
+    def __init__(self, path: str):
+        self.path = path
+
+    def _directory(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    # Writes through a temporary file, so readers never see a partial file
+    def _write(self, file_path: str, obj) -> None:
+        temporary_path = os.path.join(self._directory(TEMPORARY_DIRECTORY), f'{uuid.uuid4().hex}.json')
+        with open(temporary_path, mode='w', encoding='utf-8') as data_file:
+            json.dump(obj, data_file, default=default)
+        os.replace(temporary_path, file_path)
+
+    @staticmethod
+    def _read_job(file_path: str) -> Job:
+        with open(file_path, encoding='utf-8') as job_file:
+            return Job(**json.load(job_file))
+
+    def _list(self, name: str) -> List[str]:
+        try:
+            return sorted(f for f in os.listdir(self._directory(name)) if f.endswith('.json'))
+        except FileNotFoundError:
+            return []
+
+    # Adds the jobs that are in no state yet; returns how many were added
+    def create(self, jobs: Iterable[Job]) -> int:
+        for name in QUEUE_STATES + [TEMPORARY_DIRECTORY, RESULTS_DIRECTORY]:
+            os.makedirs(self._directory(name), exist_ok=True)
+        known = {file_name.split('.')[0] for name in QUEUE_STATES for file_name in self._list(name)}
+        added = 0
+        for job in jobs:
+            if job.id not in known:
+                self._write(os.path.join(self._directory('pending'), f'{job.id}.json'), asdict(job))
+                added += 1
+        return added
+
+    # Claims a pending job, starting the scan at a worker-specific offset so workers started
+    # together do not all race for the same file
+    def claim(self, worker: str) -> Optional[Lease]:
+        pending = self._list('pending')
+        if not pending:
+            return None
+        start = hash(worker) % len(pending)
+        for file_name in pending[start:] + pending[:start]:
+            pending_path = os.path.join(self._directory('pending'), file_name)
+            lease_path = os.path.join(self._directory('leased'), f'{file_name[:-5]}.{uuid.uuid4().hex}.json')
+            try:
+                # rename keeps the mtime, so the file is touched first for the lease to start fresh
+                os.utime(pending_path)
+                os.rename(pending_path, lease_path)
+            except FileNotFoundError:
+                continue
+            os.utime(lease_path)
+            return Lease(self._read_job(lease_path), lease_path)
+        return None
+
+    # False once the lease has been requeued or finished by someone else
+    def heartbeat(self, lease: Lease) -> bool:
+        try:
+            os.utime(lease.path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    # Stores the result and marks the job done. A worker that lost its lease still keeps its
+    # result and drops the requeued copy if nobody has claimed it yet; returns whether the
+    # lease was still held.
+    def complete(self, lease: Lease, result: dict) -> bool:
+        self._write(os.path.join(self._directory(RESULTS_DIRECTORY), f'{lease.job.id}.json'), result)
+        try:
+            os.rename(lease.path, os.path.join(self._directory('done'), f'{lease.job.id}.json'))
+            return True
+        except FileNotFoundError:
+            try:
+                os.remove(os.path.join(self._directory('pending'), f'{lease.job.id}.json'))
+            except FileNotFoundError:
+                pass
+            return False
+
+    # Takes the lease file away from its holder, then puts the job back in pending, or in
+    # failed after max_attempts
+    def _release(self, lease_path: str, error: str, max_attempts: int) -> bool:
+        released_path = os.path.join(self._directory(TEMPORARY_DIRECTORY), f'{uuid.uuid4().hex}.lease')
+        try:
+            os.rename(lease_path, released_path)
+        except FileNotFoundError:
+            return False
+        job = self._read_job(released_path)
+        job.attempts += 1
+        job.error = error
+        state = 'failed' if job.attempts >= max_attempts else 'pending'
+        self._write(os.path.join(self._directory(state), f'{job.id}.json'), asdict(job))
+        os.remove(released_path)
+        return True
+
+    def fail(self, lease: Lease, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+        return self._release(lease.path, error, max_attempts)
+
+    # Returns how many expired leases this call requeued
+    def requeue_expired(self, timeout: float = DEFAULT_LEASE, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        requeued = 0
+        now = time.time()
+        for file_name in self._list('leased'):
+            lease_path = os.path.join(self._directory('leased'), file_name)
+            try:
+                expired = now - os.path.getmtime(lease_path) > timeout
+            except FileNotFoundError:
+                continue
+            if expired:
+                requeued += self._release(lease_path, f'lease expired after {timeout:g} s', max_attempts)
+        return requeued
+
+    def status(self) -> Dict[str, int]:
+        return {name: len(self._list(name)) for name in QUEUE_STATES}
+
+    # Nothing left to claim or waiting on a lease
+    def is_finished(self) -> bool:
+        return not self._list('pending') and not self._list('leased')
+
+    def failed_jobs(self) -> List[Job]:
+        return [self._read_job(os.path.join(self._directory('failed'), file_name)) for file_name in self._list('failed')]
+
+    def results(self) -> Iterable[dict]:
+        for file_name in self._list(RESULTS_DIRECTORY):
+            with open(os.path.join(self._directory(RESULTS_DIRECTORY), file_name), encoding='utf-8') as result_file:
+                yield json.load(result_file)
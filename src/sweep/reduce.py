@@ -0,0 +1,45 @@
+from dataclasses import asdict
+from typing import Dict, List, Tuple
+
+from rdh_algorithm import get_algorithm
+from results.store import ResultsStore
+from sweep.jobs import Job
+from sweep.queue import WorkQueue
+from util.config import RdhConfig
+from write_data import ImageStats, RunStats, write_data
+
+__all__ = [
+    'collect_runs',
+    'reduce_queue',
+]
+
+
+# The finished jobs as RunStats, one per run name with its images in file name order as a grid
+# lists them, each paired with its dataset and its config as the results store keys it. A queue can
+# hold several grids, so the runs are in the order of their first job by grid index. The parameters
+# are recorded resolved, as the embedder ran with them.
+def collect_runs(queue: WorkQueue) -> List[Tuple[RunStats, str, str]]:
+    results = list(queue.results())
+    run_indices: Dict[str, int] = {}
+    for result in results:
+        run = result['job']['run']
+        run_indices[run] = min(run_indices.get(run, result['job']['index']), result['job']['index'])
+    results.sort(key=lambda result: (run_indices[result['job']['run']], result['job']['image']))
+    runs: Dict[str, Tuple[RunStats, str, str]] = {}
+    for result in results:
+        job = Job(**result['job'])
+        if job.run not in runs:
+            config = get_algorithm(job.algorithm).embedder.resolve_config(RdhConfig(**job.parameters))
+            runs[job.run] = RunStats(job.run, parameters=asdict(config)), job.dataset, job.run[len(job.dataset) + 1:]
+        runs[job.run][0].append_image_stats(ImageStats(**result['image']))
+    return list(runs.values())
+
+
+# Writes every run as stats.py does, to runs/ through write_data and to the results store
+def reduce_queue(queue: WorkQueue, store: ResultsStore = None) -> List[RunStats]:
+    runs = collect_runs(queue)
+    for run, _, _ in runs:
+        write_data(run)
+    if store is not None:
+        store.append_many(runs)
+    return [run for run, _, _ in runs]
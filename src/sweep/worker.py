@@ -0,0 +1,110 @@
+import datetime
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import asdict
+from typing import Optional
+
+from bench.covers import RES_PATH
+from bench.suite import get_payload
+from sweep.jobs import run_job
+from sweep.queue import DEFAULT_LEASE, DEFAULT_MAX_ATTEMPTS, Lease, WorkQueue
+
+__all__ = [
+    'DEFAULT_POLL',
+    'Heartbeat',
+    'get_worker_name',
+    'run_worker',
+]
+
+DEFAULT_POLL = 1.0  # seconds an idle worker waits before looking for jobs again
+
+
+def get_worker_name() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+# Touches a lease every interval seconds from a background thread while a job runs.
+# lost is set once the lease turns out to be gone.
+class Heartbeat:
+    def __init__(self, queue: WorkQueue, lease: Lease, interval: float):
+        self._queue = queue
+        self._lease = lease
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.lost = False
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            if not self._queue.heartbeat(self._lease):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+# Claims and runs jobs until the queue is finished or max_jobs are done. An idle worker keeps
+# polling while other workers hold leases, so it can take over the jobs of any that die.
+# Returns how many jobs this worker completed.
+def run_worker(queue: WorkQueue,
+               worker: str = None,
+               lease: float = DEFAULT_LEASE,
+               heartbeat: float = None,
+               max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+               max_jobs: int = None,
+               poll: float = DEFAULT_POLL,
+               data: bytes = None,
+               res_path: str = RES_PATH,
+               verbose: bool = True) -> int:
+    worker = worker or get_worker_name()
+    heartbeat = heartbeat or lease / 4
+    data = get_payload() if data is None else data
+    completed = 0
+
+    while max_jobs is None or completed < max_jobs:
+        claimed = queue.claim(worker)
+        if claimed is None and queue.requeue_expired(lease, max_attempts):
+            claimed = queue.claim(worker)
+        if claimed is None:
+            if queue.is_finished():
+                break
+            time.sleep(poll)
+            continue
+
+        job = claimed.job
+        started = time.perf_counter()
+        error: Optional[str] = None
+        with Heartbeat(queue, claimed, heartbeat) as beat:
+            try:
+                image_stats = run_job(job, data, res_path)
+            except Exception:
+                error = traceback.format_exc()
+        if error is not None:
+            queue.fail(claimed, error, max_attempts)
+            if verbose:
+                print(f'{worker} {job.id} {job.run} {job.image} FAILED\n{error}', flush=True)
+            continue
+
+        held = queue.complete(claimed, {
+            'job': asdict(job),
+            'image': asdict(image_stats),
+            'worker': worker,
+            'seconds': time.perf_counter() - started,
+            'date': datetime.datetime.utcnow().isoformat(),
+        })
+        completed += 1
+        if verbose:
+            lost = '' if held and not beat.lost else ' (lease lost)'
+            stopped = f' ({image_stats.error})' if image_stats.error else ''
+            print(f'{worker} {job.id} {job.run} {job.image} {image_stats.iterations} iterations '
+                  f'{time.perf_counter() - started:.2f} s{lost}{stopped}', flush=True)
+    return completed
@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from util import kernels
+from util.kernels import HIST_SIZE
+
+IMAGES = 5
+PIXELS = 4096
+
+
+# Every JIT kernel against the NumPy code it replaces, on the same random inputs: both have
+# to leave the same pixels behind and return the same histograms
+@unittest.skipUnless(kernels.JIT_AVAILABLE, 'numba is not installed')
+class JitKernelsTest(unittest.TestCase):
+    def setUp(self):
+        self._jit_enabled = kernels.jit_enabled()
+        self.rng = np.random.default_rng(2115)
+
+    def tearDown(self):
+        kernels.set_jit_enabled(self._jit_enabled)
+
+    # Runs kernel on a copy of pixels with and without the JIT; returns (pixels, result) of both
+    def _run_both(self, kernel, pixels, *args):
+        outputs = []
+        for enabled in (True, False):
+            kernels.set_jit_enabled(enabled)
+            self.assertEqual(kernels.jit_enabled(), enabled)
+            copy = pixels.copy()
+            outputs.append((copy, kernel(copy, *args)))
+        return outputs
+
+    def _assert_same(self, outputs):
+        (jit_pixels, jit_result), (numpy_pixels, numpy_result) = outputs
+        np.testing.assert_array_equal(jit_pixels, numpy_pixels)
+        np.testing.assert_array_equal(jit_result, numpy_result)
+
+    # Pixels kept one value away from both ends, so a shift never wraps around
+    def _get_pixels(self, shape):
+        return self.rng.integers(1, HIST_SIZE - 1, shape, dtype=np.uint8)
+
+    def _get_bits(self, size):
+        return self.rng.integers(0, 2, size).astype(bool)
+
+    def test_shift_and_embed(self):
+        for direction in (-1, 1):
+            pixels = self._get_pixels(PIXELS)
+            lut = self.rng.integers(1, HIST_SIZE - 1, HIST_SIZE)
+            peak = int(lut[pixels[0]])
+            bits = self._get_bits(PIXELS)
+            hist = np.bincount(pixels, minlength=HIST_SIZE)
+            self._assert_same(self._run_both(kernels.shift_and_embed, pixels, lut, peak, direction, bits, hist))
+            self._assert_same(self._run_both(kernels.shift_and_embed, pixels, lut, peak, direction, bits))
+
+    def test_shift_and_embed_pair(self):
+        pixels = self._get_pixels(PIXELS)
+        left_peak, right_peak = int(self.rng.integers(1, 128)), int(self.rng.integers(128, HIST_SIZE - 1))
+        left_bits, right_bits = self._get_bits(PIXELS), self._get_bits(PIXELS)
+        hist = np.bincount(pixels, minlength=HIST_SIZE)
+        self._assert_same(self._run_both(kernels.shift_and_embed_pair, pixels, left_peak, right_peak, left_bits,
+                                         right_bits, hist))
+        self._assert_same(self._run_both(kernels.shift_and_embed_pair, pixels, left_peak, right_peak, left_bits,
+                                         right_bits))
+
+    def test_shift_and_embed_batch(self):
+        pixels = self._get_pixels((IMAGES, PIXELS))
+        luts = self.rng.integers(1, HIST_SIZE - 1, (IMAGES, HIST_SIZE))
+        peaks = luts[np.arange(IMAGES), pixels[:, 0]]
+        directions = self.rng.choice([-1, 1], IMAGES)
+        bits = self._get_bits(pixels.size)
+        hists = kernels.get_row_hists(pixels)
+        self._assert_same(self._run_both(kernels.shift_and_embed_batch, pixels, luts, peaks, directions, bits,
+                                         hists))
+
+    def test_shift_and_embed_pair_batch(self):
+        pixels = self._get_pixels((IMAGES, PIXELS))
+        left_peaks = self.rng.integers(1, 128, IMAGES)
+        right_peaks = self.rng.integers(128, HIST_SIZE - 1, IMAGES)
+        left_bits, right_bits = self._get_bits(pixels.size), self._get_bits(pixels.size)
+        hists = kernels.get_row_hists(pixels)
+        self._assert_same(self._run_both(kernels.shift_and_embed_pair_batch, pixels, left_peaks, right_peaks,
+                                         left_bits, right_bits, hists))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 from .bp_uni import *
 from .uni_original import *
 from .bp_uni_improved import *
+from .batch import *
+from .snapshot import *
 
 __all__ = [
     'UnidirectionEmbedder',
@@ -9,4 +11,6 @@ __all__ = [
     'BPUnidirectionExtractor',
     'ImprovedBPUnidirectionEmbedder',
     'ImprovedBPUnidirectionExtractor',
+    'BatchUnidirectionEmbedder',
+    'EmbedderSnapshot',
 ]
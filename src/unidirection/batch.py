@@ -0,0 +1,136 @@
+from unidirection.configurations import *
+from unidirection.uni_original import UnidirectionEmbedder
+from util import *
+
+
+# UnidirectionEmbedder over an (N, H, W) stack of same-size covers. Histograms, peaks, shifts
+# and embedding run on the whole stack at once; only the location maps are compressed and the
+# payload buffers advanced image by image. Every image comes out exactly as UnidirectionEmbedder
+# embeds it on its own, and stops after the same number of iterations.
+class BatchUnidirectionEmbedder(Configurable, Reentrant):
+    _HEADER_SIZE = HEADER_SIZE
+    _DEFAULT_CONFIG = DEFAULT_CONFIG
+    _get_overhead = UnidirectionEmbedder._get_overhead
+
+    def __init__(self, cover_images: np.ndarray, hidden_data, compression: CompressionAlgorithm = deflate,
+                 config: RdhConfig = None):
+        self._set_config(config)
+        self._cover_images = as_pixels(cover_images)
+        if self._cover_images.ndim != 3:
+            raise ValueError(f'expected an (N, H, W) stack of covers, got shape {self._cover_images.shape}')
+        self._payloads = get_payloads(hidden_data, len(self._cover_images))
+        self._compress = compression.compress
+        self._reset_state()
+
+    def _reset_state(self):
+        self._images = None
+        self._header_pixels = None
+        self._body_pixels = None
+        self._buffers = None
+
+        self._hists = None
+        self._old_P_L = None
+        self._old_P_H = None
+        self._iterations = None
+
+    # Returns the embedded stack with the iterations and capacity of every image
+    @profiled('embed')
+    def embed(self, iterations, out=None, inplace=False):
+        context = self._new_context()
+        context._initialize(out, inplace)
+        return context._process(iterations)
+
+    @profiled('split')
+    def _initialize(self, out=None, inplace=False):
+        count = len(self._cover_images)
+        self._images = get_work_image(self._cover_images, out, inplace)
+        pixels = self._images.reshape(count, -1)
+        header_size = self._config.header_size
+        self._header_pixels, self._body_pixels = pixels[:, :header_size], pixels[:, header_size:]
+        header_LSBs = (self._header_pixels & 1).astype(bool)
+        self._buffers = [PayloadBuffer(LSBs, payload=payload) for LSBs, payload in zip(header_LSBs, self._payloads)]
+
+        self._hists = get_row_hists(self._body_pixels)
+        self._old_P_L = np.zeros(count, dtype=np.int64)
+        self._old_P_H = np.zeros(count, dtype=np.int64)
+        self._iterations = np.zeros(count, dtype=np.int64)
+
+    def _process(self, iterations):
+        pure_embedded_data = np.zeros(len(self._buffers), dtype=np.int64)
+        rows = np.arange(len(self._buffers))
+        pixels = self._body_pixels
+
+        with phase('peaks'):
+            P_L, P_H = self._get_peaks(rows)
+        buffer_data, extra_space = self._get_buffer_data(pixels, rows, P_L, P_H)
+        extra_space -= self._config.header_size
+
+        while True:
+            is_embedding = np.logical_and(extra_space >= 0, self._iterations[rows] < iterations)
+            if not is_embedding.all():
+                rows, P_L, P_H, extra_space = rows[is_embedding], P_L[is_embedding], P_H[is_embedding], \
+                                              extra_space[is_embedding]
+                buffer_data = [data for data, embedding in zip(buffer_data, is_embedding) if embedding]
+            if not rows.size:
+                break
+
+            with phase('iteration'):
+                pixels = self._get_body_pixels(rows)
+                with phase('buffer'):
+                    for row, data in zip(rows, buffer_data):
+                        self._buffers[row].add(data)
+                pure_embedded_data[rows] += extra_space
+                with phase('shift'):
+                    self._shift_histograms(pixels, rows, P_L, P_H)
+
+                self._old_P_L[rows] = P_L
+                self._old_P_H[rows] = P_H
+                self._iterations[rows] += 1
+                with phase('peaks'):
+                    P_L, P_H = self._get_peaks(rows)
+                buffer_data, extra_space = self._get_buffer_data(pixels, rows, P_L, P_H)
+                if pixels is not self._body_pixels:
+                    self._body_pixels[rows] = pixels
+
+        with phase('lsb'):
+            self._embed_in_LSB()
+
+        return self._images, self._iterations, pure_embedded_data
+
+    # The body pixels of the images still embedding, copied out of the stack once some are done
+    def _get_body_pixels(self, rows):
+        return self._body_pixels if rows.size == len(self._body_pixels) else self._body_pixels[rows]
+
+    def _get_peaks(self, rows):
+        hists = self._hists[rows]
+        P_H = hists.argmax(axis=1)
+        return get_minimum_closest_batch(hists, P_H), P_H
+
+    def _get_buffer_data(self, pixels, rows, P_L, P_H):
+        d = np.where(P_L < P_H, LEFT_DIRECTION, RIGHT_DIRECTION)
+        with phase('location_map'):
+            location_maps = read_pair_rows(pixels, P_L, -d)
+        with phase('overhead'):
+            buffer_data = [self._get_overhead(old_P_L, old_P_H, location_map) for old_P_L, old_P_H, location_map
+                           in zip(self._old_P_L[rows], self._old_P_H[rows], location_maps)]
+        return buffer_data, self._hists[rows, P_H] - np.array([len(data) for data in buffer_data], dtype=np.int64)
+
+    def _shift_histograms(self, pixels, rows, P_L, P_H):
+        d = np.where(P_L < P_H, LEFT_DIRECTION, RIGHT_DIRECTION)
+        values = get_identity_lut()
+        is_between = np.logical_and(values > np.minimum(P_L, P_H)[:, None], values < np.maximum(P_L, P_H)[:, None])
+        luts = values + d[:, None] * is_between
+        hists = self._hists[rows]
+
+        with phase('buffer'):
+            bit_counts = np.where(luts == P_H[:, None], hists, 0).sum(axis=1)
+            embedded_data = np.concatenate([self._buffers[row].next(bit_count)
+                                            for row, bit_count in zip(rows, bit_counts)])
+        with phase('shift_and_embed'):
+            self._hists[rows] = shift_and_embed_batch(pixels, luts, P_H, d, embedded_data, hists)
+
+    def _embed_in_LSB(self):
+        LSBs = np.zeros(self._header_pixels.shape, dtype=np.uint8)
+        peaks = np.stack([self._old_P_L, self._old_P_H], axis=1).astype(np.uint8)
+        LSBs[:, :2 * PEAK_BITS] = np.unpackbits(peaks, axis=1)
+        self._header_pixels[...] = (self._header_pixels & np.uint8(0xFE)) | LSBs
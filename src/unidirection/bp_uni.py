@@ -4,23 +4,24 @@ from util import *
 
 
 class BPUnidirectionEmbedder(UnidirectionEmbedder):
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        super().__init__(cover_image, hidden_data, compression)
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 two_phase: bool = False, config: RdhConfig = None):
+        super().__init__(cover_image, hidden_data, compression, two_phase, config)
         self._original_brightness = np.mean(cover_image)
 
     def _get_peaks(self):
         self._hist = self._get_hist()
-        current_brightness = np.mean(self._body_pixels)
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD:
+        current_brightness = self._get_brightness(self._hist)
+        if self._original_brightness - current_brightness > self._config.brightness_threshold:
             P_H = self._hist[:MAX_PIXEL_VALUE - 1].argmax()
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold:
             P_H = self._hist[2:].argmax() + 2
         else:
             P_H = self._hist.argmax()
 
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD or P_H < 2:
+        if self._original_brightness - current_brightness > self._config.brightness_threshold or P_H < 2:
             P_L = get_minimum_closest_right(self._hist, P_H)
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD or P_H > 253:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold or P_H > 253:
             P_L = get_minimum_closest_left(self._hist, P_H)
         else:
             P_L = get_minimum_closest(self._hist, P_H)
@@ -3,28 +3,33 @@ from unidirection.configurations import *
 from util import *
 
 
+# Peaks are chosen by a fitted estimate of the compressed location map size. With the config's
+# exact_candidates, the candidate pairs the estimate ranks highest are measured instead: their
+# location maps are compressed on a shared thread pool of exact_workers threads (the
+# compressors release the GIL) and the pair with the most real capacity wins.
 class ImprovedBPUnidirectionEmbedder(BPUnidirectionEmbedder):
 
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        super().__init__(cover_image, hidden_data, compression)
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 two_phase: bool = False, config: RdhConfig = None):
+        super().__init__(cover_image, hidden_data, compression, two_phase, config)
+
+    def _reset_state(self):
+        super()._reset_state()
         self._P_L = None
         self._P_H = None
         self._offset = None
         self._minimum_closest_P_L = None
+        self._map_sizes = {}
 
-    def _shift_in_between(self, P_L, P_H):
-        self._move_bin(P_L)
-        super()._shift_in_between(P_L, P_H)
-
-    def _move_bin(self, P_L):
-        self._body_pixels[self._body_pixels == P_L] = self._minimum_closest_P_L[P_L]
-        self._hist[self._minimum_closest_P_L[P_L]] += self._hist[P_L]  # if self._minimum_closest_P_L[P_L] == P_H
-        self._hist[P_L] = 0  # Not needed
+    # The P_L bin first moves onto its minimum closest bin, then the in-between shift applies
+    def _get_shift_lut(self, P_L, P_H):
+        moved = get_identity_lut()
+        moved[P_L] = self._minimum_closest_P_L[P_L]
+        return super()._get_shift_lut(P_L, P_H)[moved]
 
     def _get_location_map(self, P_L, P_H):
-        combined_bins = np.logical_or(self._body_pixels == self._minimum_closest_P_L[P_L], self._body_pixels == P_L)
-        location_map = self._body_pixels[combined_bins]
-        return np.equal(location_map, P_L)
+        minimum_closest = int(self._minimum_closest_P_L[P_L])
+        return self._read_pair(minimum_closest, int(P_L) - minimum_closest)
 
     def _get_overhead(self, P_L, P_H, location_map):
         overhead_data = super()._get_overhead(P_L, P_H, location_map)
@@ -38,15 +43,16 @@ class ImprovedBPUnidirectionEmbedder(BPUnidirectionEmbedder):
     def _get_peak_offset(self):
         sign = self._minimum_closest_P_L[self._P_L] < self._P_L
         offset = np.abs(int(self._P_L) - self._minimum_closest_P_L[self._P_L])
-        return np.concatenate([[sign], integer_to_binary(offset - 1, PLACEMENT_BITS)], axis=None).astype(bool)
+        offset_bits = integer_to_binary(offset - 1, self._config.placement_bits)
+        return np.concatenate([[sign], offset_bits], axis=None).astype(bool)
 
     def _get_peaks(self):
         self._hist = self._get_hist()
-        self._minimum_closest_P_L = self._get_minimum_closest_by_N(2 ** PLACEMENT_BITS)
-        current_brightness = np.mean(self._body_pixels)
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD:
+        self._minimum_closest_P_L = self._get_minimum_closest_by_N(2 ** self._config.placement_bits)
+        current_brightness = self._get_brightness(self._hist)
+        if self._original_brightness - current_brightness > self._config.brightness_threshold:
             self._P_L, self._P_H = self._get_peaks_difference_right()
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold:
             self._P_L, self._P_H = self._get_peaks_difference_left()
         else:
             self._P_L, self._P_H = self._get_best_difference_peaks()
@@ -70,12 +76,14 @@ class ImprovedBPUnidirectionEmbedder(BPUnidirectionEmbedder):
         return find_closest_candidate(candidates, pixel_value)
 
     def _get_peaks_difference_right(self):
+        return self._choose_peaks(*self._get_candidates_right())
+
+    # For every P_H that can shift right, its best P_L and the estimated capacity of the pair
+    def _get_candidates_right(self):
         best_P_L_for_P_H_right = self._get_minimum_closest_right()
         max_diff_right = self._get_embedding_capacity(best_P_L_for_P_H_right, np.arange(0, MAX_PIXEL_VALUE + 1))
-        best_P_H = max_diff_right[:MAX_PIXEL_VALUE].argmax()
-        best_P_L = best_P_L_for_P_H_right[best_P_H]
-
-        return best_P_L, best_P_H
+        P_H = np.arange(0, MAX_PIXEL_VALUE)
+        return best_P_L_for_P_H_right[P_H], P_H, max_diff_right[P_H]
 
     # Finds for each P_H (0, 255) the P_L with the minimum location map size
     def _get_minimum_closest_right(self):
@@ -92,12 +100,13 @@ class ImprovedBPUnidirectionEmbedder(BPUnidirectionEmbedder):
         return minimum_closest_right
 
     def _get_peaks_difference_left(self):
+        return self._choose_peaks(*self._get_candidates_left())
+
+    def _get_candidates_left(self):
         best_P_L_for_P_H_left = self._get_minimum_closest_left()
         max_diff_left = self._get_embedding_capacity(best_P_L_for_P_H_left, np.arange(0, MAX_PIXEL_VALUE + 1))
-        best_P_H = max_diff_left[1:].argmax() + 1
-        best_P_L = best_P_L_for_P_H_left[best_P_H]
-
-        return best_P_L, best_P_H
+        P_H = np.arange(1, MAX_PIXEL_VALUE + 1)
+        return best_P_L_for_P_H_left[P_H], P_H, max_diff_left[P_H]
 
     def _get_minimum_closest_left(self):
         minimum_closest_left = np.zeros(MAX_PIXEL_VALUE + 1, dtype=np.uint8)
@@ -115,14 +124,40 @@ class ImprovedBPUnidirectionEmbedder(BPUnidirectionEmbedder):
     def _get_min_location_map_size(self, P_L):
         return self._hist[P_L] + self._hist[self._minimum_closest_P_L[P_L]]
 
+    # The right candidates come first, so a tie between the two directions goes right
     def _get_best_difference_peaks(self):
-        P_L_left, P_H_left = self._get_peaks_difference_left()
-        P_L_right, P_H_right = self._get_peaks_difference_right()
-
-        if self._get_embedding_capacity(P_L_left, P_H_left) > self._get_embedding_capacity(P_L_right, P_H_right):
-            return P_L_left, P_H_left
+        candidates = zip(self._get_candidates_right(), self._get_candidates_left())
+        return self._choose_peaks(*(np.concatenate(pair) for pair in candidates))
+
+    # The first pair with the highest capacity, estimated or, among the exact_candidates best
+    # estimates, measured
+    def _choose_peaks(self, P_L, P_H, capacity):
+        self._map_sizes = {}
+        if self._config.exact_candidates:
+            top = np.argsort(-capacity, kind='stable')[:self._config.exact_candidates]
+            with phase('exact'):
+                self._measure_map_sizes(P_L[top])
+            best = top[np.argmax([self._get_capacity(P_L[i], P_H[i]) for i in top])]
         else:
-            return P_L_right, P_H_right
+            best = capacity.argmax()
+        return P_L[best], P_H[best]
+
+    # The location map depends on P_L only, so each distinct one is compressed once
+    def _measure_map_sizes(self, P_L):
+        P_L = [int(value) for value in dict.fromkeys(P_L.tolist())]
+        location_maps = [self._get_location_map(value, None) for value in P_L]
+        sizes = get_thread_pool(self._config.exact_workers).map(self._get_map_size, location_maps)
+        self._map_sizes = dict(zip(P_L, sizes))
+
+    def _get_map_size(self, location_map):
+        compressed_size = len(self._compress(bits_to_bytes(location_map))) * BITS_PER_BYTE
+        return min(location_map.size, compressed_size + self._config.compressed_data_length_bits)
+
+    # The measured capacity when the pair was among the exact candidates, else the estimate
+    def _get_capacity(self, P_L, P_H):
+        if int(P_L) in self._map_sizes:
+            return self._hist[P_H] - self._map_sizes[int(P_L)]
+        return self._get_embedding_capacity(P_L, P_H)
 
     def _get_embedding_capacity(self, P_L, P_H):
         return self._hist[P_H] - self._get_location_map_size(P_L, self._minimum_closest_P_L[P_L])
@@ -133,23 +168,22 @@ class ImprovedBPUnidirectionEmbedder(BPUnidirectionEmbedder):
         compressed_map_size = estimate_compressed_map_size(location_map_size, percentage)
 
         # return location_map_size
-        return np.minimum(location_map_size, compressed_map_size + COMPRESSED_DATA_LENGTH_BITS)
+        return np.minimum(location_map_size, compressed_map_size + self._config.compressed_data_length_bits)
 
 
 class ImprovedBPUnidirectionExtractor(BPUnidirectionExtractor):
 
-    def _shift_in_between(self, P_L, P_H):
+    def _get_shift_lut(self, P_L, P_H):
+        lut = get_identity_lut()
         if P_L < P_H:
-            in_between = np.logical_and(self._body_pixels >= P_L, self._body_pixels < P_H)
+            lut[P_L:P_H] -= self._direction
         else:
-            in_between = np.logical_and(self._body_pixels > P_H, self._body_pixels <= P_L)
-        self._body_pixels[in_between] = self._body_pixels[in_between] - self._direction
+            lut[P_H + 1:P_L + 1] -= self._direction
+        return lut
 
     def _fix_P_L_bin(self, P_L):
         location_map = self._get_location_map(P_L)
-        combined_bin = self._body_pixels == (P_L + self._offset)
-        location_map = location_map[:np.sum(combined_bin)]
-        self._body_pixels[combined_bin] = self._body_pixels[combined_bin] - self._offset * location_map
+        self._values.move_selected(P_L + self._offset, -self._offset, location_map)
 
     def _get_location_map(self, P_L):
         self._offset = self._get_offset()
@@ -157,7 +191,7 @@ class ImprovedBPUnidirectionExtractor(BPUnidirectionExtractor):
 
     def _get_offset(self):
         sign = self._buffer.next(SIGN_BIT)
-        offset = binary_to_integer(self._buffer.next(PLACEMENT_BITS)) + 1
+        offset = binary_to_integer(self._buffer.next(self._config.placement_bits)) + 1
 
         if sign:
             return -offset
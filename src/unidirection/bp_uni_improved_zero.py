@@ -1,16 +1,18 @@
-from unidirection import ImprovedBPUnidirectionEmbedder, ImprovedBPUnidirectionExtractor
+from unidirection import UnidirectionEmbedder, ImprovedBPUnidirectionEmbedder, ImprovedBPUnidirectionExtractor
 from unidirection.configurations import *
 from util import *
 
 
 class BPZeroUnidirectionEmbedder(ImprovedBPUnidirectionEmbedder):
 
-    def _shift_in_between(self, P_L, P_H):
+    def _get_shift_lut(self, P_L, P_H):
         if self._zero_peak:
-            in_between = np.logical_and(self._body_pixels > min((P_L, P_H)), self._body_pixels < max((P_L, P_H)))
-            self._body_pixels[in_between] = self._body_pixels[in_between] + get_shift_direction(P_L, P_H)
+            return UnidirectionEmbedder._get_shift_lut(self, P_L, P_H)
         else:
-            super()._shift_in_between(P_L, P_H)
+            return super()._get_shift_lut(P_L, P_H)
+
+    def _get_iteration_fields(self):
+        return {'zero_peak': bool(self._zero_peak)}
 
     def _get_buffer_data(self, P_L, P_H):
         if self._zero_peak:
@@ -21,11 +23,11 @@ class BPZeroUnidirectionEmbedder(ImprovedBPUnidirectionEmbedder):
 
     def _get_peaks(self):
         self._hist = self._get_hist()
-        self._minimum_closest_P_L = self._get_minimum_closest_by_N(2 ** PLACEMENT_BITS)
-        current_brightness = np.mean(self._body_pixels)
-        if self._original_brightness - current_brightness > BRIGHTNESS_THRESHOLD:
+        self._minimum_closest_P_L = self._get_minimum_closest_by_N(2 ** self._config.placement_bits)
+        current_brightness = self._get_brightness(self._hist)
+        if self._original_brightness - current_brightness > self._config.brightness_threshold:
             self._P_L, self._P_H = self._get_best_overall_right()
-        elif self._original_brightness - current_brightness < -BRIGHTNESS_THRESHOLD:
+        elif self._original_brightness - current_brightness < -self._config.brightness_threshold:
             self._P_L, self._P_H = self._get_best_overall_left()
         else:
             self._P_L, self._P_H = self._get_best_overall()
@@ -52,8 +54,8 @@ class BPZeroUnidirectionEmbedder(ImprovedBPUnidirectionEmbedder):
             return P_L, P_H
 
     def _is_zero_better(self, P_H_zero, P_L, P_H):
-        return self._hist[P_H_zero] - COMPRESSED_DATA_LENGTH_BITS > \
-               self._get_embedding_capacity(P_L, P_H) - SIGN_BIT - PLACEMENT_BITS
+        return self._hist[P_H_zero] - self._config.compressed_data_length_bits > \
+               self._get_capacity(P_L, P_H) - SIGN_BIT - self._config.placement_bits
 
     def _get_best_overall_left(self):
         P_L_zero, P_H_zero = self._get_peaks_zero_left()
@@ -97,12 +99,12 @@ class BPZeroUnidirectionEmbedder(ImprovedBPUnidirectionEmbedder):
             integer_to_binary(self._old_P_L, PEAK_BITS),
             integer_to_binary(self._old_P_H, PEAK_BITS),
             integer_to_binary(1, FLAG_BIT),
-            integer_to_binary(0, COMPRESSED_DATA_LENGTH_BITS)], axis=None).astype(bool)
+            integer_to_binary(0, self._config.compressed_data_length_bits)], axis=None).astype(bool)
 
     def _insert_offset_bits(self, overhead_data):
         offset_bits = self._get_peak_offset()
         is_compressed = overhead_data[2 * PEAK_BITS]
-        insert_index = 2 * PEAK_BITS + FLAG_BIT + is_compressed * COMPRESSED_DATA_LENGTH_BITS
+        insert_index = 2 * PEAK_BITS + FLAG_BIT + is_compressed * self._config.compressed_data_length_bits
         return np.concatenate([overhead_data[:insert_index], offset_bits, overhead_data[insert_index:]])
 
 
@@ -111,9 +113,7 @@ class BPZeroUnidirectionExtractor(ImprovedBPUnidirectionExtractor):
     def _fix_P_L_bin(self, P_L):
         location_map = self._get_location_map(P_L)
         if location_map.size > 0:
-            combined_bin = self._body_pixels == (P_L + self._offset)
-            location_map = location_map[:np.sum(combined_bin)]
-            self._body_pixels[combined_bin] = self._body_pixels[combined_bin] - self._offset * location_map
+            self._values.move_selected(P_L + self._offset, -self._offset, location_map)
 
     def _get_location_map(self, P_L):
         is_map_compressed = self._buffer.next(FLAG_BIT)[0]
@@ -121,15 +121,16 @@ class BPZeroUnidirectionExtractor(ImprovedBPUnidirectionExtractor):
             return self._get_compressed_map()
         else:
             self._offset = self._get_offset()
-            return self._buffer.next(np.sum(self._body_pixels == P_L + self._offset))
+            return self._buffer.next(self._values.count(P_L + self._offset))
 
     def _get_compressed_map(self):
-        map_size = binary_to_integer(self._buffer.next(COMPRESSED_DATA_LENGTH_BITS)) * BITS_PER_BYTE
+        map_size = binary_to_integer(self._buffer.next(self._config.compressed_data_length_bits)) * BITS_PER_BYTE
         if map_size == 0:
             return np.ndarray(shape=(0, 0), dtype=bool)
         else:
             self._offset = self._get_offset()
-            return bytes_to_bits(self._decompress(bits_to_bytes(self._buffer.next(map_size))))
+            with phase('decompress'):
+                return bytes_to_bits(self._decompress(bits_to_bytes(self._buffer.next(map_size))))
 
 
 if __name__ == '__main__':
@@ -1,3 +1,5 @@
+from util.config import RdhConfig
+
 COMPRESSED_DATA_LENGTH_BITS = 32
 HEADER_SIZE = 16
 PEAK_BITS = 8
@@ -9,3 +11,9 @@ SIGN_BIT = 1
 PLACEMENT_BITS = 1
 MAX_FREQUENCY = 2 ** 31
 BITS_PER_BYTE = 8
+
+EXACT_CANDIDATES = 0  # peaks are chosen by the estimated capacity alone
+
+DEFAULT_CONFIG = RdhConfig(BRIGHTNESS_THRESHOLD, PLACEMENT_BITS,
+                           compressed_data_length_bits=COMPRESSED_DATA_LENGTH_BITS,
+                           exact_candidates=EXACT_CANDIDATES)
@@ -0,0 +1,72 @@
+import json
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from util import *
+
+# The RdhConfig fields the embedded bits are laid out by; a sweep restored with other values
+# would write bits its extractor cannot read
+LAYOUT_FIELDS = ['placement_bits', 'header_size', 'compressed_data_length_bits']
+
+
+# The state of a unidirection sweep between two iterations. The image is a read-only view
+# shared with the sweep it was taken from and every sweep restored from it; each of them
+# copies it before its next write. The embedder class, its resolved config and the payload
+# identity are kept so restore can refuse a sweep that would embed an unreadable layout;
+# only the brightness threshold, which steers the peaks and not the layout, may differ.
+# embedder is the class as 'module:Class', as the algorithm registry names it.
+@dataclass(frozen=True)
+class EmbedderSnapshot:
+    image: np.ndarray
+    values: Optional[ValueIndex]
+    buffer: tuple  # PayloadBuffer.get_state()
+    hist: Optional[np.ndarray]
+    next_hist: Optional[np.ndarray]
+    old_P_L: int
+    old_P_H: int
+    index: int
+    embedder: str
+    config: RdhConfig
+    payload_bits: int
+    payload_digest: str
+
+    # Why a sweep of the given embedder, config and payload cannot go on from this
+    # snapshot, or None when it can
+    def get_mismatch(self, embedder: str, config: RdhConfig, payload_bits: int, payload_digest: str) -> Optional[str]:
+        if embedder != self.embedder:
+            return f'snapshot of {self.embedder}, not {embedder}'
+        for name in LAYOUT_FIELDS:
+            if getattr(config, name) != getattr(self.config, name):
+                return f'snapshot taken with {name}={getattr(self.config, name)}, not {getattr(config, name)}'
+        if (payload_bits, payload_digest) != (self.payload_bits, self.payload_digest):
+            return 'snapshot taken with another payload'
+        return None
+
+    # The pixels are materialized after every step, so the value index is left out
+    # and rebuilt from them on restore
+    def save(self, file_path: str) -> None:
+        head, payload_index, parity = self.buffer
+        np.savez(file_path, image=self.image, head=head, payload_index=payload_index, parity=parity,
+                 hist=_or_empty(self.hist), next_hist=_or_empty(self.next_hist),
+                 peaks=np.array([self.old_P_L, self.old_P_H]), index=self.index, embedder=self.embedder,
+                 config=json.dumps(asdict(self.config)), payload_bits=self.payload_bits,
+                 payload_digest=self.payload_digest)
+
+    @classmethod
+    def load(cls, file_path: str) -> 'EmbedderSnapshot':
+        with np.load(file_path) as data:
+            image = data['image']
+            image.flags.writeable = False
+            return cls(image, None, (data['head'], int(data['payload_index']), bool(data['parity'])),
+                       _or_none(data['hist']), _or_none(data['next_hist']),
+                       int(data['peaks'][0]), int(data['peaks'][1]), int(data['index']), str(data['embedder']),
+                       RdhConfig(**json.loads(str(data['config']))), int(data['payload_bits']),
+                       str(data['payload_digest']))
+
+
+def _or_empty(hist: Optional[np.ndarray]) -> np.ndarray:
+    return np.empty((0,), dtype=np.int64) if hist is None else hist
+
+
+def _or_none(hist: np.ndarray) -> Optional[np.ndarray]:
+    return hist if hist.size else None
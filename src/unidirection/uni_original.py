@@ -1,65 +1,134 @@
 from util import *
 from unidirection.configurations import *
+from unidirection.snapshot import EmbedderSnapshot
 
 
-class UnidirectionEmbedder:
-    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate):
-        self._cover_image = cover_image
-        self._hidden_data = bytes_to_bits(hidden_data)
+# With two_phase, the iterations run on a ValueIndex of the body (histogram and positions by
+# value) and the pixels are written once at the end, instead of rewriting the image every
+# iteration. Each iteration then costs the pixels of the bins it reads or moves.
+class UnidirectionEmbedder(Observable, Configurable, Reentrant):
+    _HEADER_SIZE = HEADER_SIZE
+    _DEFAULT_CONFIG = DEFAULT_CONFIG
+
+    def __init__(self, cover_image: np.ndarray, hidden_data: Iterable, compression: CompressionAlgorithm = deflate,
+                 two_phase: bool = False, config: RdhConfig = None):
+        self._set_config(config)
+        self._cover_image = as_pixels(cover_image)
+        self._payload = PayloadSource(hidden_data)
         self._compress = compression.compress
+        self._two_phase = two_phase
+        # values computed from the cover on first use, shared by every call
+        self._derived = {}
+        self._reset_state()
 
+    def _reset_state(self):
+        self._image = None
         self._header_pixels = None
         self._body_pixels = None
+        self._values = None
         self._buffer = None
+        self._shares_image = False
 
         self._hist = None
+        self._next_hist = None
         self._old_P_L = None
         self._old_P_H = None
         self._index = None
 
-    def embed(self, iterations):
-        self._initialize()
-        return self._process(iterations)
+    # The embedded image is written to out when given; inplace overwrites the cover itself,
+    # and nothing derived from the old cover is kept
+    @profiled('embed')
+    def embed(self, iterations, out=None, inplace=False):
+        try:
+            context = self._new_context()
+            context._initialize(out, inplace)
+            return context._process(iterations)
+        finally:
+            if inplace:
+                self._derived.clear()
 
     def _process(self, iterations=1):
+        self._start_trace()
         pure_embedded_data = 0
+        if self._shares_image:
+            self._own_image()
 
-        P_L, P_H = self._get_peaks()
+        with phase('peaks'):
+            P_L, P_H = self._get_peaks()
         buffer_data, extra_space = self._get_buffer_data(P_L, P_H)
         if not self._index:
-            extra_space -= HEADER_SIZE
+            extra_space -= self._config.header_size
 
         while extra_space >= 0 and self._index < iterations:
-            self._fill_buffer(buffer_data)
-            pure_embedded_data += extra_space
-            self._shift_histogram(P_L, P_H)
-
-            self._old_P_L = P_L
-            self._old_P_H = P_H
-            self._index += 1
-            P_L, P_H = self._get_peaks()
-            buffer_data, extra_space = self._get_buffer_data(P_L, P_H)
-
-        self._embed_in_LSB()
-
-        embedded_image = assemble_image(self._header_pixels, self._body_pixels, self._cover_image.shape)
-
+            with phase('iteration'):
+                with phase('buffer'):
+                    self._fill_buffer(buffer_data)
+                pure_embedded_data += extra_space
+                with phase('shift'):
+                    self._shift_histogram(P_L, P_H)
+
+                self._old_P_L = P_L
+                self._old_P_H = P_H
+                self._index += 1
+                if self._observers:
+                    self._emit_iteration(P_L, P_H, buffer_data, extra_space)
+                with phase('peaks'):
+                    P_L, P_H = self._get_peaks()
+                buffer_data, extra_space = self._get_buffer_data(P_L, P_H)
+
+        with phase('lsb'):
+            self._embed_in_LSB()
+
+        if self._values is not None:
+            with phase('materialize'):
+                self._values.materialize(self._body_pixels)
+        with phase('assemble'):
+            embedded_image = assemble_image(self._header_pixels, self._body_pixels, self._image.shape, out=self._image)
+
+        self._emit('embed', iterations=self._index, capacity=pure_embedded_data)
         return embedded_image, self._index, pure_embedded_data
 
-    def _initialize(self):
-        self._header_pixels, self._body_pixels = get_header_and_body(self._cover_image, HEADER_SIZE)
-        self._buffer = BoolDataBuffer(self._get_header_LSBs(), self._hidden_data)
-
+    def _emit_iteration(self, P_L, P_H, buffer_data, extra_space):
+        self._emit('iteration', iteration=self._index, P_L=P_L, P_H=P_H, direction=get_shift_direction(P_L, P_H),
+                   **self._get_iteration_fields(), compressed=bool(buffer_data[2 * PEAK_BITS]),
+                   overhead_bits=len(buffer_data), capacity=extra_space + len(buffer_data), net_capacity=extra_space,
+                   brightness_drift=self._get_brightness_drift(self._next_hist))
+
+    # Extra fields subclasses report about the peaks they chose
+    def _get_iteration_fields(self):
+        return {}
+
+    @profiled('split')
+    def _initialize(self, out=None, inplace=False):
+        self._set_image(get_work_image(self._cover_image, out, inplace))
+        if self._two_phase:
+            with phase('index'):
+                self._values = ValueIndex(self._body_pixels)
+        self._buffer = PayloadBuffer(self._get_header_LSBs(), payload=self._payload)
+
+        self._next_hist = None
         self._old_P_L = 0
         self._old_P_H = 0
         self._index = 0
 
+    def _set_image(self, image):
+        self._image = image
+        self._header_pixels, self._body_pixels = get_header_and_body(self._image, self._config.header_size, copy=False)
+
+    # Copy-on-write: the image stays shared with snapshots until this sweep writes to it
+    def _own_image(self):
+        with phase('copy'):
+            self._set_image(self._image.copy())
+        self._shares_image = False
+
     def _get_header_LSBs(self):
         return np.array(get_lsb(self._header_pixels), dtype=bool)
 
     def _get_buffer_data(self, P_L, P_H):
-        location_map = self._get_location_map(P_L, P_H)
-        overhead_data = self._get_overhead(self._old_P_L, self._old_P_H, location_map)
+        with phase('location_map'):
+            location_map = self._get_location_map(P_L, P_H)
+        with phase('overhead'):
+            overhead_data = self._get_overhead(self._old_P_L, self._old_P_H, location_map)
         return overhead_data, self._hist[P_H] - len(overhead_data)
 
     def _fill_buffer(self, buffer_data):
@@ -79,22 +148,34 @@ class UnidirectionEmbedder:
 
     def _get_location_map(self, P_L, P_H) -> np.ndarray:
         d = get_shift_direction(P_L, P_H)
-        location_map = self._body_pixels[np.logical_or(self._body_pixels == P_L - d, self._body_pixels == P_L)]
-        return np.equal(location_map, P_L - d)
+        return self._read_pair(int(P_L), -d)
+
+    # One bit per pixel equal to value (0) or value + step (1), in raster order
+    def _read_pair(self, value, step):
+        if self._values is not None:
+            return self._values.read_pair(value, step)
+        return read_pair(self._body_pixels, value, step)
 
     def _get_hist(self):
+        if self._next_hist is not None:
+            hist, self._next_hist = self._next_hist, None
+            return hist
+        if self._values is not None:
+            return self._values.hist.copy()
         return np.bincount(np.array(self._body_pixels).flatten(), minlength=MAX_PIXEL_VALUE + 1)
 
     def _get_overhead(self, P_L, P_H, location_map: np.ndarray):
-        compressed_map = bytes_to_bits(self._compress(bits_to_bytes(location_map)))
-        flag = len(location_map) > len(compressed_map) + COMPRESSED_DATA_LENGTH_BITS
+        with phase('compress'):
+            compressed_map = bytes_to_bits(self._compress(bits_to_bytes(location_map)))
+        length_bits = self._config.compressed_data_length_bits
+        flag = len(location_map) > len(compressed_map) + length_bits
 
         if flag:
             return np.concatenate([
                 integer_to_binary(P_L, PEAK_BITS),
                 integer_to_binary(P_H, PEAK_BITS),
                 integer_to_binary(flag, FLAG_BIT),
-                integer_to_binary(compressed_map.size // BITS_PER_BYTE, COMPRESSED_DATA_LENGTH_BITS),
+                integer_to_binary(compressed_map.size // BITS_PER_BYTE, length_bits),
                 compressed_map], axis=None).astype(bool)
         else:
             return np.concatenate([
@@ -104,26 +185,37 @@ class UnidirectionEmbedder:
                 location_map], axis=None).astype(bool)
 
     def _shift_histogram(self, P_L, P_H):
-        self._shift_in_between(P_L, P_H)
-
-        embedding_pixels = self._body_pixels == P_H
-        embedded_data = self._buffer.next(self._hist[P_H])
-        d = get_shift_direction(P_L, P_H)
-        self._body_pixels[embedding_pixels] = self._body_pixels[embedding_pixels] + d * embedded_data
-
-    def _shift_in_between(self, P_L, P_H):
-        in_between = np.logical_and(self._body_pixels > min((P_L, P_H)), self._body_pixels < max((P_L, P_H)))
-        self._body_pixels[in_between] = self._body_pixels[in_between] + get_shift_direction(P_L, P_H)
-
+        lut = self._get_shift_lut(P_L, P_H)
+        with phase('buffer'):
+            embedded_data = self._buffer.next(int(self._hist[lut == P_H].sum()))
+        with phase('shift_and_embed'):
+            d = get_shift_direction(P_L, P_H)
+            if self._values is not None:
+                self._values.apply_lut(lut)
+                self._values.move_selected(P_H, d, embedded_data)
+                self._next_hist = self._values.hist.copy()
+            else:
+                self._next_hist = shift_and_embed(self._body_pixels, lut, P_H, d, embedded_data, self._hist)
+
+    # Value map of the in-between shift; the pixels it maps to P_H carry the payload
+    def _get_shift_lut(self, P_L, P_H):
+        lut = get_identity_lut()
+        lut[min((P_L, P_H)) + 1:max((P_L, P_H))] += get_shift_direction(P_L, P_H)
+        return lut.astype(np.uint8)
+
+    # A header longer than the two peaks gets zeros in the remaining LSBs
     def _embed_in_LSB(self):
-        LSBs = np.concatenate([integer_to_binary(self._old_P_L, PEAK_BITS),
-                               integer_to_binary(self._old_P_H, PEAK_BITS)])
-        for i in range(0, HEADER_SIZE):
+        LSBs = np.zeros(self._config.header_size, dtype=bool)
+        LSBs[:2 * PEAK_BITS] = np.concatenate([integer_to_binary(self._old_P_L, PEAK_BITS),
+                                               integer_to_binary(self._old_P_H, PEAK_BITS)])
+        for i in range(0, self._config.header_size):
             self._header_pixels[i] = set_lsb(self._header_pixels[i], LSBs[i])
 
+    # Each sweep is a context of its own, so sweeping never changes the shared instance
     def __iter__(self):
-        self._index = 0
-        return self
+        sweep = self._new_context()
+        sweep._index = 0
+        return sweep
 
     def __next__(self):
         if not self._index:
@@ -134,78 +226,187 @@ class UnidirectionEmbedder:
             embedded_image, iterations, pure_embedded_data = self._process(prev_iterations + 1)
             if iterations == prev_iterations:
                 raise StopIteration
-            return embedded_image, self._index, pure_embedded_data
+            # the sweep keeps embedding into the same buffer
+            return embedded_image.copy(), self._index, pure_embedded_data
         except ValueError:
             self.index = 0
             raise StopIteration
 
-
-class UnidirectionExtractor:
-    def __init__(self, compression=deflate):
+    # Embeds on from a sweep's state up to iterations in total, as that many next() calls
+    # would, without copying out the images in between
+    def advance(self, iterations):
+        if self._image is None:
+            self._initialize()
+        embedded_image, _, pure_embedded_data = self._process(iterations)
+        return embedded_image.copy(), self._index, pure_embedded_data
+
+    # The state of a sweep between iterations, taken without copying the pixels
+    def snapshot(self) -> EmbedderSnapshot:
+        if self._image is None:
+            raise ValueError('only a started sweep has a state to snapshot')
+        image = self._image.view()
+        image.flags.writeable = False
+        self._shares_image = True
+        return EmbedderSnapshot(image, None if self._values is None else self._values.copy(), self._buffer.get_state(),
+                                None if self._hist is None else self._hist.copy(),
+                                None if self._next_hist is None else self._next_hist.copy(),
+                                int(self._old_P_L), int(self._old_P_H), self._index, self._get_class_path(),
+                                self._config, len(self._payload), self._get_payload_digest())
+
+    def _get_class_path(self):
+        return f'{type(self).__module__}:{type(self).__qualname__}'
+
+    def _get_payload_digest(self):
+        if 'payload_digest' not in self._derived:
+            self._derived['payload_digest'] = self._payload.digest()
+        return self._derived['payload_digest']
+
+    # A sweep of this embedder that goes on from the snapshot. The snapshot has to come from
+    # the same class, cover and payload with the same layout; the brightness threshold and
+    # two_phase may differ.
+    def restore(self, snapshot: EmbedderSnapshot):
+        if snapshot.image.shape != self._cover_image.shape:
+            raise ValueError(f'snapshot of a {snapshot.image.shape} image, the cover is {self._cover_image.shape}')
+        mismatch = snapshot.get_mismatch(self._get_class_path(), self._config, len(self._payload),
+                                         self._get_payload_digest())
+        if mismatch is not None:
+            raise ValueError(mismatch)
+        sweep = self._new_context()
+        sweep._set_image(snapshot.image)
+        sweep._shares_image = True
+        if self._two_phase:
+            sweep._values = ValueIndex(sweep._body_pixels) if snapshot.values is None else snapshot.values.copy()
+        sweep._buffer = PayloadBuffer.from_state(snapshot.buffer, self._payload)
+        sweep._hist = None if snapshot.hist is None else snapshot.hist.copy()
+        sweep._next_hist = None if snapshot.next_hist is None else snapshot.next_hist.copy()
+        sweep._old_P_L = snapshot.old_P_L
+        sweep._old_P_H = snapshot.old_P_H
+        sweep._index = snapshot.index
+        return sweep
+
+    # An independent sweep from this one's current state; both share the pixels until they write
+    def fork(self):
+        return self.restore(self.snapshot())
+
+
+class UnidirectionExtractor(Observable, Configurable, Reentrant):
+    _HEADER_SIZE = HEADER_SIZE
+    _DEFAULT_CONFIG = DEFAULT_CONFIG
+
+    def __init__(self, compression=deflate, config: RdhConfig = None):
+        self._set_config(config)
         self._decompress = compression.decompress
+        self._reset_state()
 
+    def _reset_state(self):
         self._header_pixels = None
         self._body_pixels = None
+        self._values = None
         self._buffer = BoolDataBuffer()
+        self._restores_image = True
+        self._unpacks_payload = True
 
         self._direction = None
 
-    def extract(self, embedded_image):
-        self._header_pixels, self._body_pixels = get_header_and_body(embedded_image, HEADER_SIZE)
-        P_L, P_H = get_peaks_from_header(self._header_pixels, PEAK_BITS)
+    # mode 'payload' returns None for the image and 'image' None for the payload
+    @profiled('extract')
+    def extract(self, embedded_image, out=None, inplace=False, mode='both'):
+        return self._new_context()._extract(embedded_image, out, inplace, mode)
+
+    def _extract(self, embedded_image, out, inplace, mode='both'):
+        self._restores_image, self._unpacks_payload = get_extract_parts(mode)
+        self._start_trace()
+        with phase('split'):
+            # without the image to restore the pixels are only read, so they are not copied
+            image = get_work_image(as_pixels(embedded_image), out, inplace) if self._restores_image \
+                else as_pixels(embedded_image)
+            self._header_pixels, self._body_pixels = get_header_and_body(image, self._config.header_size, copy=False)
+            P_L, P_H = get_peaks_from_header(self._header_pixels, PEAK_BITS)
+        # the iterations are unwound on a ValueIndex, so each one only touches the bins it moves
+        with phase('index'):
+            self._values = ValueIndex(self._body_pixels)
         iterations = 0
         hidden_data = []
 
         while P_L != 0 or P_H != 0:
-            self._direction = get_shift_direction(P_L, P_H)
-            self._fill_payload(P_H)
-            new_P_L, new_P_H = self._get_next_peaks()
-            self._shift_in_between(P_L, P_H)
-            self._fix_P_L_bin(P_L)
-
-            if new_P_L == 0 and new_P_H == 0:
-                self._fix_LSB(self._buffer.next(HEADER_SIZE))
-
-            hidden_data.extend(self._buffer.next(-1)[::-1])
-            P_L = new_P_L
-            P_H = new_P_H
-            iterations += 1
-
-        cover_image = assemble_image(self._header_pixels, self._body_pixels, embedded_image.shape)
-        hidden_data.reverse()
+            with phase('iteration'):
+                self._direction = get_shift_direction(P_L, P_H)
+                with phase('payload'):
+                    self._fill_payload(P_H)
+                with phase('peaks'):
+                    new_P_L, new_P_H = self._get_next_peaks()
+                with phase('shift_in_between'):
+                    self._shift_in_between(P_L, P_H)
+                with phase('location_map'):
+                    self._fix_P_L_bin(P_L)
+
+                if new_P_L == 0 and new_P_H == 0:
+                    with phase('lsb'):
+                        LSBs = self._buffer.next(self._config.header_size)
+                        if self._restores_image:
+                            self._fix_LSB(LSBs)
+
+                with phase('buffer'):
+                    payload = self._buffer.next(-1)
+                    if self._unpacks_payload:
+                        hidden_data.extend(payload[::-1])
+                self._emit('iteration', iteration=iterations + 1, P_L=P_L, P_H=P_H, direction=self._direction,
+                           payload_bits=len(payload))
+                P_L = new_P_L
+                P_H = new_P_H
+                iterations += 1
+
+        cover_image = None
+        if self._restores_image:
+            with phase('materialize'):
+                self._values.materialize(self._body_pixels)
+            with phase('assemble'):
+                cover_image = assemble_image(self._header_pixels, self._body_pixels, image.shape, out=image)
+        if self._unpacks_payload:
+            with phase('assemble'):
+                hidden_data.reverse()
+                hidden_data = bits_to_bytes(hidden_data)
+        else:
+            hidden_data = None
 
-        return cover_image, iterations, bits_to_bytes(hidden_data)
+        self._emit('extract', iterations=iterations, mode=mode,
+                   payload_bits=None if hidden_data is None else 8 * len(hidden_data))
+        return cover_image, iterations, hidden_data
 
     def _fill_payload(self, P_H):
-        embedded_data = np.logical_or(self._body_pixels == P_H, self._body_pixels == P_H + self._direction)
-        self._buffer.add(self._body_pixels[embedded_data] != P_H)
+        self._buffer.add(self._values.read_pair(P_H, self._direction))
 
     def _get_next_peaks(self):
         return binary_to_integer(self._buffer.next(PEAK_BITS)), binary_to_integer(self._buffer.next(PEAK_BITS))
 
     def _shift_in_between(self, P_L, P_H):
-        in_between = np.logical_and(self._body_pixels > min((P_H, P_L)), self._body_pixels < max((P_H, P_L)))
-        self._body_pixels[in_between] = self._body_pixels[in_between] - self._direction
+        self._values.apply_lut(self._get_shift_lut(P_L, P_H))
+
+    def _get_shift_lut(self, P_L, P_H):
+        lut = get_identity_lut()
+        lut[min((P_H, P_L)) + 1:max((P_H, P_L))] -= self._direction
+        return lut
 
     def _fix_P_L_bin(self, P_L):
         location_map = self._get_location_map(P_L)
-        combined_bin = self._body_pixels == P_L
         if location_map.size == 0:
-            self._body_pixels[combined_bin] = self._body_pixels[combined_bin] - self._direction
+            lut = get_identity_lut()
+            lut[P_L] -= self._direction
+            self._values.apply_lut(lut)
         else:
-            self._body_pixels[combined_bin] = self._body_pixels[combined_bin] - \
-                                              self._direction * location_map[:np.sum(combined_bin)]
+            self._values.move_selected(P_L, -self._direction, location_map)
 
     def _get_location_map(self, P_L):
         is_map_compressed = self._buffer.next(FLAG_BIT)[0]
         if is_map_compressed:
-            map_size = binary_to_integer(self._buffer.next(COMPRESSED_DATA_LENGTH_BITS)) * BITS_PER_BYTE
-            return bytes_to_bits(self._decompress(bits_to_bytes(self._buffer.next(map_size))))
+            map_size = binary_to_integer(self._buffer.next(self._config.compressed_data_length_bits)) * BITS_PER_BYTE
+            with phase('decompress'):
+                return bytes_to_bits(self._decompress(bits_to_bytes(self._buffer.next(map_size))))
         else:
-            return self._buffer.next(np.sum(self._body_pixels == P_L))
+            return self._buffer.next(self._values.count(P_L))
 
     def _fix_LSB(self, LSBs):
-        for i in range(0, HEADER_SIZE):
+        for i in range(0, self._config.header_size):
             self._header_pixels[i] = set_lsb(self._header_pixels[i], LSBs[i])
 
 
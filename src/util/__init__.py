@@ -1,4 +1,12 @@
 from .compress import *
+from .config import *
+from .context import *
 from .data_buffer import *
+from .kernels import *
 from .measure import *
+from .payload import *
+from .profiler import *
+from .telemetry import *
+from .threads import *
 from .util import *
+from .value_index import *
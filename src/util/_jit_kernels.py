@@ -0,0 +1,74 @@
+import numba
+import numpy as np
+
+
+@numba.njit(cache=True, nogil=True)
+def shift_and_embed(pixels, lut, peak, direction, bits, hist):
+    k = 0
+    for i in range(pixels.size):
+        value = np.int64(lut[pixels[i]])
+        if value == peak:
+            if bits[k]:
+                value += direction
+            k += 1
+        pixels[i] = value
+        hist[value] += 1
+
+
+@numba.njit(cache=True, nogil=True)
+def shift_and_embed_pair(pixels, left_peak, right_peak, left_bits, right_bits, hist):
+    left = right = 0
+    for i in range(pixels.size):
+        value = np.int64(pixels[i])
+        if value < left_peak:
+            value -= 1
+        elif value > right_peak:
+            value += 1
+        elif value == left_peak:
+            if left_bits[left]:
+                value -= 1
+            left += 1
+        elif value == right_peak:
+            if right_bits[right]:
+                value += 1
+            right += 1
+        pixels[i] = value
+        hist[value] += 1
+
+
+@numba.njit(cache=True, nogil=True)
+def shift_and_embed_batch(pixels, luts, peaks, directions, bits, hists):
+    k = 0
+    for n in range(pixels.shape[0]):
+        for i in range(pixels.shape[1]):
+            value = np.int64(luts[n, pixels[n, i]])
+            if value == peaks[n]:
+                if bits[k]:
+                    value += directions[n]
+                k += 1
+            pixels[n, i] = value
+            hists[n, value] += 1
+
+
+@numba.njit(cache=True, nogil=True)
+def shift_and_embed_pair_batch(pixels, left_peaks, right_peaks, left_bits, right_bits, hists):
+    left = right = 0
+    for n in range(pixels.shape[0]):
+        left_peak = left_peaks[n]
+        right_peak = right_peaks[n]
+        for i in range(pixels.shape[1]):
+            value = np.int64(pixels[n, i])
+            if value < left_peak:
+                value -= 1
+            elif value > right_peak:
+                value += 1
+            elif value == left_peak:
+                if left_bits[left]:
+                    value -= 1
+                left += 1
+            elif value == right_peak:
+                if right_bits[right]:
+                    value += 1
+                right += 1
+            pixels[n, i] = value
+            hists[n, value] += 1
@@ -0,0 +1,78 @@
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, Dict, Optional
+
+__all__ = [
+    'RdhConfig',
+    'Configurable',
+    'get_config',
+    'get_parameters_suffix',
+    'parse_parameter_value',
+]
+
+
+# The tunable layout and peak-selection parameters of the embedders and extractors. A field
+# left as None takes the default of the algorithm family (the constants in its
+# configurations module). Embedder and extractor must be given the same config.
+# exact_candidates and exact_workers only change how ImprovedBPUnidirectionEmbedder picks
+# its peaks (exact_workers None: the thread pool default); the others ignore them.
+@dataclass(frozen=True)
+class RdhConfig:
+    brightness_threshold: Optional[float] = None
+    placement_bits: Optional[int] = None
+    header_size: Optional[int] = None
+    compressed_data_length_bits: Optional[int] = None
+    exact_candidates: Optional[int] = None
+    exact_workers: Optional[int] = None
+
+    def with_defaults(self, defaults: 'RdhConfig') -> 'RdhConfig':
+        return replace(defaults, **{name: value for name, value in asdict(self).items() if value is not None})
+
+
+# Resolves the config of an embedder or extractor against its family's _DEFAULT_CONFIG. The
+# header holds at least _HEADER_SIZE pixels, the LSBs the layout itself needs.
+class Configurable:
+    _HEADER_SIZE = 0
+    _DEFAULT_CONFIG = RdhConfig()
+
+    # The config an instance of cls runs with when given config, without building one
+    @classmethod
+    def resolve_config(cls, config: Optional[RdhConfig] = None) -> RdhConfig:
+        config = (config or RdhConfig()).with_defaults(cls._DEFAULT_CONFIG)
+        if config.header_size is None:
+            config = replace(config, header_size=cls._HEADER_SIZE)
+        if config.header_size < cls._HEADER_SIZE:
+            raise ValueError(f'{cls.__name__} needs a header of at least {cls._HEADER_SIZE} pixels, '
+                             f'got {config.header_size}')
+        if config.exact_candidates is not None and config.exact_candidates < 0:
+            raise ValueError(f'exact_candidates must be at least 0, got {config.exact_candidates}')
+        return config
+
+    def _set_config(self, config: Optional[RdhConfig]):
+        self._config = self.resolve_config(config)
+
+    @property
+    def config(self) -> RdhConfig:
+        return self._config
+
+
+# Names a parameter setting in run names, e.g. {'placement_bits': 2} -> '_placement_bits-2';
+# empty when every parameter is left at its default
+def get_parameters_suffix(parameters: Dict[str, Any]) -> str:
+    return ''.join(f'_{name}-{value}' for name, value in sorted(parameters.items()))
+
+
+# A config from {field: value} as given on a command line or in a request
+def get_config(parameters: Optional[Dict[str, Any]] = None) -> RdhConfig:
+    parameters = parameters or {}
+    unknown = sorted(set(parameters) - {field.name for field in fields(RdhConfig)})
+    if unknown:
+        raise ValueError(f'unknown parameters: {", ".join(unknown)}')
+    return RdhConfig(**parameters)
+
+
+# A parameter value given as text: an int, else a float
+def parse_parameter_value(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
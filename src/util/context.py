@@ -0,0 +1,18 @@
+import copy
+
+__all__ = [
+    'Reentrant',
+]
+
+
+# Embedders and extractors keep their configuration on the instance, set once in __init__,
+# and run every call on a shallow copy whose per-call state _reset_state creates afresh.
+# One instance can then serve any number of threads at once.
+class Reentrant:
+    def _new_context(self):
+        context = copy.copy(self)
+        context._reset_state()
+        return context
+
+    def _reset_state(self):
+        pass
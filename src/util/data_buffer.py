@@ -1,5 +1,7 @@
 import numpy as np
 
+from .payload import PayloadSource
+
 
 class BoolDataBuffer:
     def __init__(self, *args: iter, calc_parity=False):
@@ -56,3 +58,65 @@ class BoolDataBuffer:
     def clear(self):
         self._buffer = np.array([])
         self._parity = False
+
+
+# Leading bits (header LSBs, overhead) followed by a PayloadSource. The payload is unpacked
+# only as next() reaches it, so the hidden data is never expanded or copied as a whole.
+# next/add behave like BoolDataBuffer over the concatenated stream.
+class PayloadBuffer:
+    def __init__(self, *args: iter, payload: PayloadSource):
+        self._head = np.concatenate([np.asarray(data, dtype=bool).ravel() for data in args]) if args \
+            else np.empty((0,), dtype=bool)
+        self._index = 0
+        self._payload = payload
+        self._payload_index = 0
+        self._parity = False
+
+    def next(self, count=1):
+        count = self.remaining() if count == -1 else int(count)
+        ret = np.zeros((count,), dtype=bool)
+
+        head = self._head[self._index:self._index + count]
+        ret[:head.size] = head
+        self._index += head.size
+
+        bits = self._payload.bits(self._payload_index, self._payload_index + count - head.size)
+        ret[head.size:head.size + bits.size] = bits
+        self._payload_index += bits.size
+
+        ret[:head.size + bits.size] ^= self._parity
+        return ret
+
+    def add(self, data):
+        data = np.asarray(data, dtype=bool)
+        data_size = len(data)
+        if self._index >= data_size:
+            self._head[self._index - data_size:self._index] = data
+            self._index -= data_size
+        else:
+            self._head = np.concatenate((data, self._head[self._index:]))
+            self._index = 0
+
+    def remaining(self) -> int:
+        return self._head.size - self._index + len(self._payload) - self._payload_index
+
+    # Everything but the payload: the unread head bits, the payload position and the parity
+    def get_state(self) -> (np.ndarray, int, bool):
+        return self._head[self._index:].copy(), self._payload_index, self._parity
+
+    @classmethod
+    def from_state(cls, state, payload: PayloadSource) -> 'PayloadBuffer':
+        head, payload_index, parity = state
+        buffer = cls(head, payload=payload)
+        buffer._payload_index = int(payload_index)
+        buffer._parity = bool(parity)
+        return buffer
+
+    def set_parity(self, parity):
+        self._parity = parity
+
+    def get_parity(self):
+        return self._parity
+
+    def __len__(self):
+        return self.remaining()
@@ -0,0 +1,252 @@
+import importlib.util
+
+import numpy as np
+
+__all__ = [
+    'JIT_AVAILABLE',
+    'jit_enabled',
+    'set_jit_enabled',
+    'get_identity_lut',
+    'apply_lut',
+    'move_selected',
+    'read_pair',
+    'shift_and_embed',
+    'shift_and_embed_pair',
+    'get_row_hists',
+    'apply_luts',
+    'move_selected_rows',
+    'read_pair_rows',
+    'shift_and_embed_batch',
+    'shift_and_embed_pair_batch',
+]
+
+HIST_SIZE = 256
+# Pixels the batched kernels take at once, which keeps their index temporaries in cache
+BATCH_BLOCK_PIXELS = 1 << 18
+
+try:
+    JIT_AVAILABLE = importlib.util.find_spec('numba') is not None
+except (ImportError, ValueError):
+    JIT_AVAILABLE = False
+_jit_enabled = JIT_AVAILABLE
+_jit_kernels = None
+
+
+def jit_enabled() -> bool:
+    return _jit_enabled
+
+
+def set_jit_enabled(enabled: bool) -> None:
+    global _jit_enabled
+    _jit_enabled = bool(enabled) and JIT_AVAILABLE
+
+
+# numba takes most of a second to import, so the JIT kernels are loaded on first use
+def _get_jit_kernels():
+    global _jit_kernels, _jit_enabled, JIT_AVAILABLE
+    if _jit_kernels is None:
+        try:
+            from . import _jit_kernels as kernels
+        except ImportError:
+            JIT_AVAILABLE = _jit_enabled = False
+            return None
+        _jit_kernels = kernels
+    return _jit_kernels
+
+
+def get_identity_lut() -> np.ndarray:
+    return np.arange(HIST_SIZE)
+
+
+# Maps every pixel through a 256-entry value table in place, in a single pass
+def apply_lut(pixels: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    lut = np.asarray(lut, dtype=np.uint8)
+    return lut.take(pixels, out=pixels)
+
+
+# Moves the pixels equal to value by step, picking them in raster order with selection.
+# Returns how many pixels moved.
+def move_selected(pixels: np.ndarray, value: int, step: int, selection: np.ndarray) -> int:
+    positions = np.flatnonzero(pixels == value)
+    positions = positions[np.asarray(selection[:positions.size], dtype=bool)]
+    if step > 0:
+        pixels[positions] += np.uint8(step)
+    else:
+        pixels[positions] -= np.uint8(-step)
+    return positions.size
+
+
+# Reads one bit per pixel equal to value (0) or value + step (1), in raster order
+def read_pair(pixels: np.ndarray, value: int, step: int) -> np.ndarray:
+    pair = pixels[np.logical_or(pixels == value, pixels == value + step)]
+    return pair != value
+
+
+# Histogram of the pixels after apply_lut, computed from the histogram before it
+def _move_hist(hist: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    moved_hist = np.zeros(HIST_SIZE, dtype=np.int64)
+    np.add.at(moved_hist, np.asarray(lut, dtype=np.uint8), hist)
+    return moved_hist
+
+
+# Maps every pixel through lut, then moves the pixels landing on peak by direction
+# for every set bit, in raster order. Returns the histogram of the result, which
+# is derived from hist (the histogram before the call) when given.
+def shift_and_embed(pixels: np.ndarray, lut: np.ndarray, peak: int, direction: int, bits: np.ndarray,
+                    hist: np.ndarray = None) -> np.ndarray:
+    if _jit_enabled and _get_jit_kernels() is not None:
+        new_hist = np.zeros(HIST_SIZE, dtype=np.int64)
+        _jit_kernels.shift_and_embed(pixels, np.asarray(lut, dtype=np.uint8), int(peak), int(direction), bits, new_hist)
+        return new_hist
+
+    apply_lut(pixels, lut)
+    peak_count = move_selected(pixels, peak, direction, bits)
+    if hist is None:
+        return np.bincount(pixels, minlength=HIST_SIZE)
+
+    new_hist = _move_hist(hist, lut)
+    new_hist[peak] -= peak_count
+    new_hist[peak + direction] += peak_count
+    return new_hist
+
+
+# Bidirectional iteration: moves the outer bins away from the peaks, then embeds
+# left_bits at the left peak (towards 0) and right_bits at the right peak (towards 255).
+def shift_and_embed_pair(pixels: np.ndarray, left_peak: int, right_peak: int,
+                         left_bits: np.ndarray, right_bits: np.ndarray, hist: np.ndarray = None) -> np.ndarray:
+    if _jit_enabled and _get_jit_kernels() is not None:
+        new_hist = np.zeros(HIST_SIZE, dtype=np.int64)
+        _jit_kernels.shift_and_embed_pair(pixels, int(left_peak), int(right_peak), left_bits, right_bits, new_hist)
+        return new_hist
+
+    lut = get_identity_lut()
+    lut[:left_peak] -= 1
+    lut[right_peak + 1:] += 1
+    apply_lut(pixels, lut)
+    left_count = move_selected(pixels, left_peak, -1, left_bits)
+    right_count = move_selected(pixels, right_peak, 1, right_bits)
+    if hist is None:
+        return np.bincount(pixels, minlength=HIST_SIZE)
+
+    new_hist = _move_hist(hist, lut)
+    new_hist[left_peak] -= left_count
+    new_hist[left_peak - 1] += left_count
+    new_hist[right_peak] -= right_count
+    new_hist[right_peak + 1] += right_count
+    return new_hist
+
+
+# The batched kernels below work on an (N, pixels) stack, one image per row, with a
+# histogram, value table and peak per row. The bits of all rows are concatenated in row
+# order. Rows are taken in blocks of about BATCH_BLOCK_PIXELS pixels: many small images
+# share one pass, large ones go one by one.
+def _get_row_blocks(pixels: np.ndarray):
+    step = max(1, BATCH_BLOCK_PIXELS // max(1, pixels.shape[1]))
+    for start in range(0, len(pixels), step):
+        yield start, pixels[start:start + step]
+
+
+def _get_row_offsets(start: int, stop: int) -> np.ndarray:
+    return np.arange(start, stop, dtype=np.intp)[:, None] * HIST_SIZE
+
+
+# Every row offset into a histogram of its own, so one bincount covers a whole block of rows
+def get_row_hists(pixels: np.ndarray) -> np.ndarray:
+    hists = np.empty((len(pixels), HIST_SIZE), dtype=np.int64)
+    for start, block in _get_row_blocks(pixels):
+        index = block + _get_row_offsets(0, len(block))
+        hists[start:start + len(block)] = np.bincount(index.ravel(), minlength=len(block) * HIST_SIZE) \
+            .reshape(len(block), HIST_SIZE)
+    return hists
+
+
+# Maps the pixels of every row through the value table of that row, in place
+def apply_luts(pixels: np.ndarray, luts: np.ndarray) -> np.ndarray:
+    flat_luts = np.asarray(luts, dtype=np.uint8).ravel()
+    for start, block in _get_row_blocks(pixels):
+        flat_luts.take(block + _get_row_offsets(start, start + len(block)), out=block)
+    return pixels
+
+
+# Row-wise move_selected: moves the pixels equal to the value of their row by the step of
+# their row, picking them in raster order with selection. Returns how many moved per row.
+def move_selected_rows(pixels: np.ndarray, values: np.ndarray, steps, selection: np.ndarray) -> np.ndarray:
+    values = np.asarray(values).astype(np.uint8)
+    steps = np.broadcast_to(np.asarray(steps, dtype=np.int64), values.shape).astype(np.uint8)
+    selection = np.asarray(selection, dtype=bool)
+    counts = np.zeros(len(pixels), dtype=np.int64)
+    used = 0
+    for start, block in _get_row_blocks(pixels):
+        stop = start + len(block)
+        positions = np.flatnonzero(block == values[start:stop, None])
+        selected = selection[used:used + positions.size]
+        used += positions.size
+        rows, columns = np.divmod(positions[selected], block.shape[1])
+        block[rows, columns] += steps[start:stop][rows]
+        counts[start:stop] = np.bincount(rows, minlength=len(block))
+    return counts
+
+
+# Row-wise read_pair, as one array of bits per row
+def read_pair_rows(pixels: np.ndarray, values: np.ndarray, steps) -> list:
+    values = np.asarray(values, dtype=np.int64)
+    pair_values = np.stack(np.broadcast_arrays(values, values + steps), axis=1).astype(np.uint8)
+    pairs = []
+    for start, block in _get_row_blocks(pixels):
+        low, high = pair_values[start:start + len(block), :1], pair_values[start:start + len(block), 1:]
+        is_pair = np.logical_or(block == low, block == high)
+        counts = np.count_nonzero(is_pair, axis=1)
+        bits = block[is_pair] != np.repeat(low[:, 0], counts)
+        pairs.extend(np.split(bits, np.cumsum(counts)[:-1]))
+    return pairs
+
+
+def _move_row_hists(hists: np.ndarray, luts: np.ndarray) -> np.ndarray:
+    index = np.asarray(luts, dtype=np.uint8) + _get_row_offsets(0, len(hists))
+    moved_hists = np.bincount(index.ravel(), weights=hists.ravel(), minlength=hists.size)
+    return moved_hists.astype(np.int64).reshape(hists.shape)
+
+
+# Row-wise shift_and_embed
+def shift_and_embed_batch(pixels: np.ndarray, luts: np.ndarray, peaks: np.ndarray, directions: np.ndarray,
+                          bits: np.ndarray, hists: np.ndarray) -> np.ndarray:
+    peaks = np.asarray(peaks, dtype=np.int64)
+    directions = np.asarray(directions, dtype=np.int64)
+    if _jit_enabled and _get_jit_kernels() is not None:
+        new_hists = np.zeros((len(pixels), HIST_SIZE), dtype=np.int64)
+        _jit_kernels.shift_and_embed_batch(pixels, np.asarray(luts, dtype=np.uint8), peaks, directions, bits,
+                                           new_hists)
+        return new_hists
+
+    apply_luts(pixels, luts)
+    counts = move_selected_rows(pixels, peaks, directions, bits)
+    rows = np.arange(len(pixels))
+    new_hists = _move_row_hists(hists, luts)
+    new_hists[rows, peaks] -= counts
+    new_hists[rows, peaks + directions] += counts
+    return new_hists
+
+
+# Row-wise shift_and_embed_pair
+def shift_and_embed_pair_batch(pixels: np.ndarray, left_peaks: np.ndarray, right_peaks: np.ndarray,
+                               left_bits: np.ndarray, right_bits: np.ndarray, hists: np.ndarray) -> np.ndarray:
+    left_peaks = np.asarray(left_peaks, dtype=np.int64)
+    right_peaks = np.asarray(right_peaks, dtype=np.int64)
+    if _jit_enabled and _get_jit_kernels() is not None:
+        new_hists = np.zeros((len(pixels), HIST_SIZE), dtype=np.int64)
+        _jit_kernels.shift_and_embed_pair_batch(pixels, left_peaks, right_peaks, left_bits, right_bits, new_hists)
+        return new_hists
+
+    values = get_identity_lut()
+    luts = values - (values < left_peaks[:, None]) + (values > right_peaks[:, None])
+    apply_luts(pixels, luts)
+    left_counts = move_selected_rows(pixels, left_peaks, -1, left_bits)
+    right_counts = move_selected_rows(pixels, right_peaks, 1, right_bits)
+
+    rows = np.arange(len(pixels))
+    new_hists = _move_row_hists(hists, luts)
+    new_hists[rows, left_peaks] -= left_counts
+    new_hists[rows, left_peaks - 1] += left_counts
+    new_hists[rows, right_peaks] -= right_counts
+    new_hists[rows, right_peaks + 1] += right_counts
+    return new_hists
@@ -2,6 +2,8 @@ import functools
 import time
 from typing import Callable
 
+from .profiler import profiler
+
 
 class Measured:
     def __init__(self, return_time: bool = False, print_time: bool = True):
@@ -22,14 +24,15 @@ class Measure:
         self._print_time = print_time
         self._total_time = 0
         self._calls_counter = 0
-        self._last_check_point = time.time()
+        self._last_check_point = time.perf_counter()
         functools.update_wrapper(self, function)
 
     def __call__(self, *args, **kwargs):
         self._calls_counter += 1
-        start_time = time.time()
-        returned = self.function(*args, **kwargs)
-        execution_time = time.time() - start_time
+        start_time = time.perf_counter()
+        with profiler.phase(self.label):
+            returned = self.function(*args, **kwargs)
+        execution_time = time.perf_counter() - start_time
         self._total_time += execution_time
 
         if self._print_time:
@@ -41,7 +44,7 @@ class Measure:
             return returned
 
     def check(self):
-        now = time.time()
+        now = time.perf_counter()
         dif = now - self._last_check_point
         self._total_time += dif
         self._last_check_point = now
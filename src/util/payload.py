@@ -0,0 +1,60 @@
+import hashlib
+import os
+from typing import List, Union
+
+import numpy as np
+
+__all__ = [
+    'PayloadSource',
+    'get_payloads',
+]
+
+
+# Read-only view of the bytes to hide. Bytes-like objects and arrays are wrapped without
+# copying and paths are memory-mapped; bits are unpacked only for the ranges asked for.
+class PayloadSource:
+    def __init__(self, data: Union['PayloadSource', bytes, bytearray, memoryview, np.ndarray, str, os.PathLike]):
+        if isinstance(data, PayloadSource):
+            self._bytes = data._bytes
+        elif isinstance(data, (str, os.PathLike)):
+            if os.path.getsize(data):
+                self._bytes = np.memmap(data, dtype=np.uint8, mode='r')
+            else:
+                self._bytes = np.empty((0,), dtype=np.uint8)
+        elif isinstance(data, np.ndarray):
+            self._bytes = np.ascontiguousarray(data).reshape(-1).view(np.uint8)
+        else:
+            self._bytes = np.frombuffer(data, dtype=np.uint8)
+
+    # Length in bits
+    def __len__(self):
+        return 8 * self._bytes.size
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes.size
+
+    def bits(self, start: int, stop: int) -> np.ndarray:
+        stop = min(stop, len(self))
+        if stop <= start:
+            return np.empty((0,), dtype=bool)
+        offset = start % 8
+        unpacked = np.unpackbits(self._bytes[start // 8:(stop + 7) // 8])
+        return unpacked[offset:offset + stop - start].view(bool)
+
+    def tobytes(self, start: int = 0, stop: int = None) -> bytes:
+        return self._bytes[start:stop].tobytes()
+
+    # Identifies the content, so two sources can be compared without keeping both
+    def digest(self) -> str:
+        return hashlib.sha256(self._bytes).hexdigest()
+
+
+# The payloads of a batch: one per image when given a list or tuple, otherwise the same one
+# for every image
+def get_payloads(hidden_data, count: int) -> List[PayloadSource]:
+    if isinstance(hidden_data, (list, tuple)):
+        if len(hidden_data) != count:
+            raise ValueError(f'expected {count} payloads, got {len(hidden_data)}')
+        return [PayloadSource(data) for data in hidden_data]
+    return [PayloadSource(hidden_data)] * count
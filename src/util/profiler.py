@@ -0,0 +1,320 @@
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+__all__ = [
+    'Profiler',
+    'PhaseStats',
+    'MemoryStats',
+    'profiler',
+    'phase',
+    'profiled',
+]
+
+HISTOGRAM_BUCKETS = 64
+LARGE_ARRAY_BYTES = 1 << 20
+# Counting large arrays takes a snapshot of every traced block, far too slow for every phase,
+# so only these phases are counted, at any depth
+LARGE_ARRAY_PHASES = frozenset(['embed', 'extract', 'iteration'])
+
+
+class PhaseStats:
+    def __init__(self, path: str):
+        self.path = path
+        self.calls = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        # bucket i counts durations in [2^i, 2^(i+1)) nanoseconds
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def record(self, duration_ns: int):
+        self.calls += 1
+        self.total_ns += duration_ns
+        self.max_ns = max(self.max_ns, duration_ns)
+        self.min_ns = duration_ns if self.min_ns is None else min(self.min_ns, duration_ns)
+        self.histogram[min(duration_ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def get_average(self):
+        return self.total_ns / self.calls if self.calls else 0
+
+    def to_dict(self) -> dict:
+        last_bucket = max((i for i, count in enumerate(self.histogram) if count), default=-1)
+        return {
+            'calls': self.calls,
+            'total_ns': self.total_ns,
+            'min_ns': self.min_ns,
+            'max_ns': self.max_ns,
+            'histogram': self.histogram[:last_bucket + 1],
+        }
+
+
+class MemoryStats:
+    def __init__(self):
+        # one entry per call, so phases inside the iteration loop give per-iteration series
+        self.peak_bytes = []
+        self.current_bytes = []
+        self.peak_increase_bytes = []
+        # large arrays alive on exit that were not on entry, for the LARGE_ARRAY_PHASES only;
+        # arrays allocated and freed inside the phase show in peak_increase_bytes instead
+        self.retained_large_arrays = []
+
+    def record(self, peak: int, current: int, peak_increase: int, retained_large_arrays: Optional[int]):
+        self.peak_bytes.append(peak)
+        self.current_bytes.append(current)
+        self.peak_increase_bytes.append(peak_increase)
+        if retained_large_arrays is not None:
+            self.retained_large_arrays.append(retained_large_arrays)
+
+    def to_dict(self) -> dict:
+        stats = {
+            'max_peak_bytes': max(self.peak_bytes),
+            'max_peak_increase_bytes': max(self.peak_increase_bytes),
+            'peak_bytes': self.peak_bytes,
+            'current_bytes': self.current_bytes,
+            'peak_increase_bytes': self.peak_increase_bytes,
+        }
+        if self.retained_large_arrays:
+            stats['retained_large_arrays'] = sum(self.retained_large_arrays)
+            stats['retained_large_arrays_per_call'] = self.retained_large_arrays
+        return stats
+
+
+class _MemoryFrame:
+    __slots__ = ('start_current', 'outer_peak', 'max_seen', 'large_arrays')
+
+    def __init__(self, start_current: int, outer_peak: int, large_arrays: Optional[int]):
+        self.start_current = start_current
+        self.outer_peak = outer_peak
+        self.max_seen = 0
+        self.large_arrays = large_arrays
+
+
+# Live numpy blocks of at least threshold bytes. Counting needs a snapshot of every traced
+# block; pass large_array_bytes=None to skip it.
+def _count_large_arrays(threshold: Optional[int]) -> Optional[int]:
+    if threshold is None:
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    snapshot = snapshot.filter_traces([tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)])
+    return sum(1 for trace in snapshot.traces if trace.size >= threshold)
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ('_profiler', '_name', '_start', '_memory')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self._profiler = profiler
+        self._name = name
+        self._start = 0
+        self._memory = False
+
+    def __enter__(self):
+        self._profiler._stack.append(self._name)
+        self._memory = self._profiler.memory
+        if self._memory:
+            self._profiler._enter_memory(self._name)
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self._profiler._close(self._start, end, self._memory)
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False, max_events: int = 1_000_000, memory: bool = False,
+                 large_array_bytes: int = LARGE_ARRAY_BYTES):
+        self.enabled = False
+        self.memory = False
+        self.max_events = max_events
+        self.large_array_bytes = large_array_bytes
+        self._local = threading.local()
+        self._stats: Dict[str, PhaseStats] = {}
+        self._memory_stats: Dict[str, MemoryStats] = {}
+        self._started_tracemalloc = False
+        self._events: List[tuple] = []  # (path, start ns, end ns, thread ident)
+        self._origin = time.perf_counter_ns()
+        if enabled:
+            self.enable(memory)
+
+    # Each thread nests its own phases, so embedders running side by side do not mix their paths
+    @property
+    def _stack(self) -> List[str]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    # The memory frames nest per thread in the same way. tracemalloc's peak is process-wide,
+    # though, so with phases on several threads each one's peak includes the others' allocations.
+    @property
+    def _memory_stack(self) -> List[_MemoryFrame]:
+        stack = getattr(self._local, 'memory_stack', None)
+        if stack is None:
+            stack = self._local.memory_stack = []
+        return stack
+
+    # Memory mode traces allocations with tracemalloc, which slows down everything it measures,
+    # so timings recorded in memory mode are only comparable with each other
+    def enable(self, memory: bool = False):
+        self.enabled = True
+        if memory and not self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            self.memory = True
+
+    def disable(self):
+        self.enabled = False
+        if self.memory:
+            self.memory = False
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    def reset(self):
+        self._stack.clear()
+        self._stats.clear()
+        self._memory_stack.clear()
+        self._memory_stats.clear()
+        self._events.clear()
+        self._origin = time.perf_counter_ns()
+
+    # tracemalloc keeps a single peak, so each phase resets it on entry and hands
+    # the peak it observed back to the enclosing phase on exit
+    def _enter_memory(self, name: str):
+        current, peak = tracemalloc.get_traced_memory()
+        large_arrays = _count_large_arrays(self.large_array_bytes) if name in LARGE_ARRAY_PHASES else None
+        self._memory_stack.append(_MemoryFrame(current, peak, large_arrays))
+        tracemalloc.reset_peak()
+
+    def _exit_memory(self, path: str):
+        current, peak = tracemalloc.get_traced_memory()
+        frame = self._memory_stack.pop()
+        peak = max(peak, frame.max_seen)
+        retained_large_arrays = None
+        if frame.large_arrays is not None:
+            retained_large_arrays = max(0, _count_large_arrays(self.large_array_bytes) - frame.large_arrays)
+        stats = self._memory_stats.get(path)
+        if stats is None:
+            stats = self._memory_stats[path] = MemoryStats()
+        stats.record(peak, current, peak - frame.start_current, retained_large_arrays)
+        if self._memory_stack:
+            outer = self._memory_stack[-1]
+            outer.max_seen = max(outer.max_seen, frame.outer_peak, peak)
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def _close(self, start: int, end: int, memory: bool = False):
+        path = '/'.join(self._stack)
+        self._stack.pop()
+        if memory:
+            self._exit_memory(path)
+        stats = self._stats.get(path)
+        if stats is None:
+            stats = self._stats[path] = PhaseStats(path)
+        stats.record(end - start)
+        if len(self._events) < self.max_events:
+            self._events.append((path, start, end, threading.get_ident()))
+
+    # Position in the event list, for phase_times
+    def mark(self) -> int:
+        return len(self._events)
+
+    # Total nanoseconds per phase over the events recorded since mark
+    def phase_times(self, mark: int) -> Dict[str, int]:
+        times = {}
+        for path, start, end, _ in self._events[mark:]:
+            times[path] = times.get(path, 0) + end - start
+        return times
+
+    def get_stats(self) -> Dict[str, PhaseStats]:
+        return self._stats
+
+    def get_memory_stats(self) -> Dict[str, MemoryStats]:
+        return self._memory_stats
+
+    def summary(self) -> Dict[str, dict]:
+        summary = {path: stats.to_dict() for path, stats in self._stats.items()}
+        for path, stats in self._memory_stats.items():
+            summary[path]['memory'] = stats.to_dict()
+        return summary
+
+    # Every event on the row of the thread that recorded it, so phases of embedders running
+    # side by side do not stack up as if they were nested
+    def to_chrome_trace(self, file_path: str):
+        events = [{
+            'name': path.rsplit('/', 1)[-1],
+            'cat': path,
+            'ph': 'X',
+            'ts': (start - self._origin) / 1000,
+            'dur': (end - start) / 1000,
+            'pid': 0,
+            'tid': thread,
+        } for path, start, end, thread in self._events]
+        with open(file_path, mode='w+', encoding='utf-8') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def table(self) -> str:
+        root_total = sum(s.total_ns for path, s in self._stats.items() if '/' not in path) or 1
+        rows = [f'{"phase":<60} {"calls":>8} {"total ms":>12} {"mean us":>12} {"min us":>10} {"max us":>10} {"%":>6}']
+        for path in sorted(self._stats):
+            s = self._stats[path]
+            label = '  ' * path.count('/') + path.rsplit('/', 1)[-1]
+            row = f'{label:<60} {s.calls:>8} {s.total_ns / 1e6:>12.3f} {s.get_average() / 1e3:>12.1f} ' \
+                  f'{s.min_ns / 1e3:>10.1f} {s.max_ns / 1e3:>10.1f} {100 * s.total_ns / root_total:>6.1f}'
+            memory = self._memory_stats.get(path)
+            if memory is not None:
+                row += f' {max(memory.peak_increase_bytes) / 2 ** 20:>10.1f} MiB peak'
+                if memory.retained_large_arrays:
+                    row += f' {sum(memory.retained_large_arrays):>6} large arrays retained'
+            rows.append(row)
+        return '\n'.join(rows)
+
+
+profiler = Profiler()
+
+
+def phase(name: str):
+    if not profiler.enabled:
+        return _NULL_PHASE
+    return _Phase(profiler, name)
+
+
+def profiled(name: str = None):
+    def decorator(function: Callable):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with _Phase(profiler, label):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+
+from .profiler import profiler
+
+__all__ = [
+    'Observable',
+    'JsonlTrace',
+]
+
+
+# Embedders and extractors report one record per iteration to their observers. Records are
+# flat dicts with an 'event' name, the class, the microseconds since the previous record and,
+# while the profiler is enabled, the phase timings in between. Nothing is built without observers.
+class Observable:
+    _observers = ()
+
+    def observe(self, observer: Callable[[dict], None]):
+        self._observers = (*self._observers, observer)
+        return self
+
+    def unobserve(self, observer: Callable[[dict], None]):
+        self._observers = tuple(o for o in self._observers if o is not observer)
+        return self
+
+    def _start_trace(self):
+        if self._observers:
+            self._trace_ns = time.perf_counter_ns()
+            self._trace_mark = profiler.mark()
+
+    def _emit(self, event: str, **fields):
+        if not self._observers:
+            return
+        now = time.perf_counter_ns()
+        record = {'event': event, 'algorithm': type(self).__name__, **fields,
+                  'elapsed_us': (now - getattr(self, '_trace_ns', now)) // 1000}
+        if profiler.enabled:
+            mark = getattr(self, '_trace_mark', profiler.mark())
+            record['phases_us'] = {path: ns // 1000 for path, ns in profiler.phase_times(mark).items()}
+            self._trace_mark = profiler.mark()
+        self._trace_ns = now
+        for observer in self._observers:
+            observer(record)
+
+    def _get_brightness(self, hist: np.ndarray) -> float:
+        return float(np.dot(hist, np.arange(hist.size)) / hist.sum())
+
+    # Brightness drift is measured against the cover, as the brightness-preserving embedders do.
+    # The cover brightness is computed once per embedder, in its shared _derived values.
+    def _get_brightness_drift(self, hist: np.ndarray) -> float:
+        if 'brightness' not in self._derived:
+            self._derived['brightness'] = float(np.mean(self._cover_image))
+        return round(self._get_brightness(hist) - self._derived['brightness'], 4)
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+# Observer writing each record as a JSON line, with the given fields (image name, run...) added
+class JsonlTrace:
+    def __init__(self, path: str, mode: str = 'a', **context):
+        self._file = open(path, mode=mode, encoding='utf-8')
+        self._lock = threading.Lock()
+        self.context = context
+
+    def __call__(self, record: dict):
+        line = json.dumps({**self.context, **record}, default=_to_json)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
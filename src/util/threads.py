@@ -0,0 +1,19 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+__all__ = [
+    'get_thread_pool',
+]
+
+_POOLS: Dict[Optional[int], ThreadPoolExecutor] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+# Thread pools shared by every embedder in the process, one per worker count (None for the
+# ThreadPoolExecutor default), so a pool is not started for every peak selection
+def get_thread_pool(workers: Optional[int] = None) -> ThreadPoolExecutor:
+    with _POOLS_LOCK:
+        if workers not in _POOLS:
+            _POOLS[workers] = ThreadPoolExecutor(workers, thread_name_prefix='rdh')
+        return _POOLS[workers]
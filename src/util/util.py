@@ -1,11 +1,10 @@
+import io
 import os.path
 from collections.abc import Iterable
 from typing import Union
 
 import PIL.Image as Image
-import matplotlib.pyplot as plt
 import numpy as np
-from skimage.metrics import structural_similarity
 
 IMAGE_EXTENSIONS = ['png', 'jpeg', 'tiff', 'tif', 'bmp', 'jpg', 'gif']
 MAX_PIXEL_VALUE = 255
@@ -60,11 +59,55 @@ def pad_bits(bits):
     return np.append(np.zeros((pad_size,)), bits).astype(bool)
 
 
-def get_header_and_body(image: np.ndarray, header_size: int) -> (np.ndarray, np.ndarray):
-    image = image.ravel().copy()
+# With copy=False both parts are views of image, which must then be contiguous
+def get_header_and_body(image: np.ndarray, header_size: int, copy=True) -> (np.ndarray, np.ndarray):
+    image = image.ravel()
+    if copy:
+        image = image.copy()
     return image[:int(header_size)], image[int(header_size):]
 
 
+# A uint8 array over anything exposing the buffer protocol (ndarray, bytearray, memoryview,
+# shared memory), without copying
+def as_pixels(buffer, shape=None) -> np.ndarray:
+    pixels = buffer if isinstance(buffer, np.ndarray) else np.asarray(memoryview(buffer))
+    if pixels.dtype != np.uint8:
+        raise ValueError(f'expected 8-bit pixels, got {pixels.dtype}')
+    return pixels if shape is None else pixels.reshape(shape)
+
+
+# The buffer an embed or extract works in: image itself when inplace, out filled with
+# image when given, otherwise a copy of image
+def get_work_image(image: np.ndarray, out=None, inplace=False) -> np.ndarray:
+    if inplace:
+        if out is not None:
+            raise ValueError('out and inplace cannot be combined')
+        work = as_pixels(image)
+    elif out is None:
+        return np.array(image, dtype=np.uint8)
+    else:
+        work = as_pixels(out)
+        if work.size != image.size:
+            raise ValueError(f'out has {work.size} pixels, expected {image.size}')
+        work = work.reshape(image.shape)
+        np.copyto(work, image)
+
+    if not work.flags.writeable or not work.flags.c_contiguous:
+        raise ValueError('the output buffer must be writable and contiguous')
+    return work
+
+
+# What an extract rebuilds: the cover and the payload, only the payload or only the cover.
+# Returns (restores the image, unpacks the payload).
+EXTRACT_MODES = ('both', 'payload', 'image')
+
+
+def get_extract_parts(mode: str) -> (bool, bool):
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f'unknown extract mode {mode!r}, expected one of {", ".join(EXTRACT_MODES)}')
+    return mode != 'payload', mode != 'image'
+
+
 def scale_to(image: np.ndarray, r: Union[np.ndarray, Iterable, int, str]) -> np.ndarray:
     try:
         scaled_min, scaled_max = r
@@ -119,12 +162,30 @@ def save_image(image, path: str):
     Image.fromarray(image).save(path)
 
 
+def decode_image(buffer: bytes) -> np.ndarray:
+    return np.uint8(Image.open(io.BytesIO(buffer)).getchannel(0)).copy()
+
+
+def encode_image(image: np.ndarray, image_format: str = 'PNG') -> bytes:
+    stream = io.BytesIO()
+    Image.fromarray(image).save(stream, format=image_format)
+    return stream.getvalue()
+
+
 def get_peaks(pixels, n=2):
     hist = np.bincount(pixels)
     return np.sort(hist.argsort()[-n:])
 
 
+# skimage and matplotlib are imported on first use; the embed/extract path needs neither
+def structural_similarity(*args, **kwargs) -> float:
+    from skimage.metrics import structural_similarity
+    return structural_similarity(*args, **kwargs)
+
+
 def show_hist(image, title=''):
+    import matplotlib.pyplot as plt
+
     bins = np.bincount(image.ravel())
     hist = np.zeros((MAX_PIXEL_VALUE + 1,))
     hist[:len(bins)] = bins
@@ -136,9 +197,17 @@ def show_hist(image, title=''):
     plt.show()
 
 
-def assemble_image(header, pixels, shape):
-    image = np.append(header, pixels)
-    return image.reshape(shape)
+# Writes into out instead when given, skipping the parts that already are views of it
+def assemble_image(header, pixels, shape, out=None):
+    if out is None:
+        image = np.append(header, pixels)
+        return image.reshape(shape)
+
+    flat = out.reshape(-1)
+    for part, target in ((header, flat[:header.size]), (pixels, flat[header.size:])):
+        if part.dtype != target.dtype or np.byte_bounds(part) != np.byte_bounds(target):
+            target[...] = part
+    return out.reshape(shape)
 
 
 def get_minimum_closest_right(hist, pixel_value):
@@ -171,6 +240,41 @@ def get_minimum_closest(hist, pixel_value):
             return closest_left
 
 
+# Row-wise get_minimum_closest for a stack of histograms. Peaks below 2 only look right and
+# peaks above 253 only left, as the unidirection embedders do.
+def get_minimum_closest_batch(hists, pixel_values):
+    hists = np.asarray(hists, dtype=np.int64)
+    pixel_values = np.asarray(pixel_values)[:, None]
+    values = np.arange(hists.shape[1])
+    hists_below = np.roll(hists, 1, axis=1)
+    hists_above = np.roll(hists, -1, axis=1)
+    closest_right, min_right_value = _get_minimum_closest_rows(hists + hists_below, hists_below,
+                                                               values >= pixel_values + 2, True)
+    closest_left, min_left_value = _get_minimum_closest_rows(hists + hists_above, hists_above,
+                                                             values <= pixel_values - 2, False)
+
+    pixel_values = pixel_values[:, 0]
+    right_is_closer = np.abs(closest_right - pixel_values) < np.abs(closest_left - pixel_values)
+    return np.where(min_right_value < min_left_value, closest_right,
+                    np.where(min_right_value > min_left_value, closest_left,
+                             np.where(right_is_closer, closest_right, closest_left)))
+
+
+# The candidates of every row with the smallest pair sum, then the smallest neighbour, and of
+# those the first (right of the peak) or the last (left of it). Rows without candidates get
+# the largest possible sum.
+def _get_minimum_closest_rows(pair_sums, neighbours, is_candidate, first):
+    no_candidate = np.iinfo(np.int64).max
+    pair_sums = np.where(is_candidate, pair_sums, no_candidate)
+    min_values = pair_sums.min(axis=1)
+    is_candidate = is_candidate & (pair_sums == min_values[:, None])
+    neighbours = np.where(is_candidate, neighbours, no_candidate)
+    is_candidate &= neighbours == neighbours.min(axis=1)[:, None]
+    if first:
+        return is_candidate.argmax(axis=1), min_values
+    return is_candidate.shape[1] - 1 - is_candidate[:, ::-1].argmax(axis=1), min_values
+
+
 def get_shift_direction(P_L, P_H):
     if P_L < P_H:
         return -1
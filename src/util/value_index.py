@@ -0,0 +1,85 @@
+import numpy as np
+
+from .kernels import HIST_SIZE
+
+__all__ = [
+    'ValueIndex',
+]
+
+_NO_POSITIONS = np.zeros(0, dtype=np.intp)
+
+
+# Pixel positions bucketed by value, each bucket in raster order, with the histogram kept
+# alongside. Mirrors the pixel kernels (read_pair, apply_lut, move_selected) so a loop of
+# histogram shifts costs the pixels of the bins it touches instead of a pass over the image,
+# and the pixels are written back once with materialize.
+class ValueIndex:
+    def __init__(self, pixels: np.ndarray):
+        pixels = pixels.ravel()
+        self._hist = np.bincount(pixels, minlength=HIST_SIZE)
+        order = np.argsort(pixels, kind='stable')
+        self._buckets = np.split(order, np.cumsum(self._hist)[:-1])
+
+    @property
+    def hist(self) -> np.ndarray:
+        return self._hist
+
+    def count(self, value: int) -> int:
+        return int(self._hist[value]) if 0 <= value < HIST_SIZE else 0
+
+    def positions(self, value: int) -> np.ndarray:
+        return self._buckets[value] if 0 <= value < HIST_SIZE else _NO_POSITIONS
+
+    # One bit per pixel equal to value (0) or value + step (1), in raster order
+    def read_pair(self, value: int, step: int) -> np.ndarray:
+        low = self.positions(value)
+        high = self.positions(value + step)
+        bits = np.zeros(low.size + high.size, dtype=bool)
+        bits[np.searchsorted(low, high) + np.arange(high.size)] = True
+        return bits
+
+    # Values wrap like kernels.apply_lut; only the buckets that merge are touched
+    def apply_lut(self, lut: np.ndarray) -> None:
+        lut = np.asarray(lut).astype(np.uint8)
+        sources = [[] for _ in range(HIST_SIZE)]
+        for value in np.flatnonzero(self._hist):
+            sources[lut[value]].append(self._buckets[value])
+        self._buckets = [_merge(parts) for parts in sources]
+        self._hist = np.bincount(lut, weights=self._hist, minlength=HIST_SIZE).astype(np.int64)
+
+    # Moves the pixels equal to value by step, picking them in raster order with selection.
+    # Returns how many pixels moved.
+    def move_selected(self, value: int, step: int, selection: np.ndarray) -> int:
+        positions = self.positions(value)
+        selected = np.asarray(selection[:positions.size], dtype=bool)
+        moved = positions[selected]
+        if moved.size:
+            target = (value + step) % HIST_SIZE
+            self._buckets[value] = positions[~selected]
+            self._buckets[target] = _merge([self._buckets[target], moved])
+            self._hist[value] -= moved.size
+            self._hist[target] += moved.size
+        return moved.size
+
+    # Buckets are replaced, never written in place, so the copy shares them until either
+    # side moves pixels
+    def copy(self) -> 'ValueIndex':
+        other = object.__new__(ValueIndex)
+        other._hist = self._hist.copy()
+        other._buckets = list(self._buckets)
+        return other
+
+    def materialize(self, pixels: np.ndarray) -> np.ndarray:
+        values = np.repeat(np.arange(HIST_SIZE, dtype=np.uint8), self._hist)
+        pixels.ravel()[np.concatenate(self._buckets)] = values
+        return pixels
+
+
+# Buckets are sorted runs, which the stable sort merges in linear time
+def _merge(parts) -> np.ndarray:
+    parts = [part for part in parts if part.size]
+    if not parts:
+        return _NO_POSITIONS
+    if len(parts) == 1:
+        return parts[0]
+    return np.sort(np.concatenate(parts), kind='stable')
@@ -3,7 +3,7 @@ import datetime
 import json
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Any, List
+from typing import Optional, Any, List, Dict
 
 DATA_PATH = 'runs'
 
@@ -16,6 +16,8 @@ class ImageStats:
     std: Optional[List[float]] = field(default_factory=list)
     ssim: Optional[List[float]] = field(default_factory=list)
     ratio: Optional[List[float]] = field(default_factory=list)
+    profile: Optional[Dict[str, dict]] = None
+    error: Optional[str] = None  # the extractor's exception when it ended the iterations
 
     def append_iteration(self, mean: float, std: float, ssim: float, ratio: float):
         self.mean.append(mean)
@@ -30,6 +32,7 @@ class RunStats:
     algorithm: str
     date: Optional[datetime.date] = field(default_factory=datetime.datetime.utcnow)
     images: Optional[List[ImageStats]] = field(default_factory=list)
+    parameters: Optional[Dict[str, Any]] = None  # the RdhConfig the run was embedded with
 
     def append_image_stats(self, image_stats: ImageStats) -> None:
         self.images.append(image_stats)